@@ -1,3 +1,5 @@
+import argparse
+import asyncio
 import threading
 import time
 import os
@@ -5,6 +7,17 @@ import sys
 import traceback
 from pynput import keyboard
 from scripts.agent import IrisAgent
+from scripts.checkpoint import load_checkpoint
+from scripts.macros import load_macro
+from scripts.config import (
+    AGENT_STOP_TIMEOUT_SECONDS,
+    DEBUG_MODE,
+    OVERLAY_CAPTURE_MODE,
+    OVERLAY_HIDE_SETTLE_SECONDS,
+    OVERLAY_HIDE_TIMEOUT_SECONDS,
+)
+from scripts.debug_writer import close_debug_writer, get_debug_writer
+from scripts.runner import AgentRunner
 from scripts.terminal_input import prompt_for_task
 from scripts.utils import DISPLAY_BOX_WIDTH, DisplayWindow, colorize_terminal, format_status_box, print_boxed, logo
 
@@ -15,10 +28,15 @@ def format_exception_details(error):
 
 
 class IrisController:
-    def __init__(self, task):
+    def __init__(self, task, resume_path=None, replay_path=None):
         self.task = task
+        self.resume_path = resume_path
+        self.replay_path = replay_path
         self.window = DisplayWindow()
         self.running = False
+        self.runner = None
+        self.agent_thread = None
+        self.stopping = False
         self.esc_count = 0
         self.last_esc_time = 0
 
@@ -42,11 +60,22 @@ class IrisController:
             
             self.last_esc_time = current_time
             
-            if self.esc_count >= 3:
+            if self.esc_count >= 3 and not self.stopping:
                 print_boxed("Stop Triggered!")
+                self.stopping = True
                 self.running = False
-                self.window.safe_quit()
-                os._exit(0) # Force exit
+                # Do not block the key listener while the agent winds down
+                threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def shutdown(self):
+        """Cancel the model request, let the runner flush memory, checkpoint and logs, then exit."""
+        if self.runner:
+            self.runner.stop()
+        if self.agent_thread:
+            self.agent_thread.join(AGENT_STOP_TIMEOUT_SECONDS + 1)
+        self.window.safe_quit()
+        close_debug_writer() # os._exit skips atexit, so drain pending debug artifacts first
+        os._exit(0) # Force exit
 
     def start_agent_thread(self):
         if self.running:
@@ -55,9 +84,9 @@ class IrisController:
         self.running = True
         
         # Run Agent in a new thread
-        thread = threading.Thread(target=self.run_agent, args=(self.task,))
-        thread.daemon = True
-        thread.start()
+        self.agent_thread = threading.Thread(target=self.run_agent, args=(self.task,))
+        self.agent_thread.daemon = True
+        self.agent_thread.start()
 
     def run_agent(self, task):
         start_message = format_status_box("Task", f"Starting task:\n{task}")
@@ -69,8 +98,10 @@ class IrisController:
             def pre_callback():
                 # Hide window before screenshot
                 self.window.set_suppressed(True) # Prevent window from showing up if new logs arrive
-                self.window.safe_hide()
-                time.sleep(0.5) # Wait for window to hide
+                # Wait until Tk reports the window unmapped instead of a fixed sleep
+                self.window.safe_hide_and_wait(OVERLAY_HIDE_TIMEOUT_SECONDS)
+                if OVERLAY_HIDE_SETTLE_SECONDS > 0:
+                    time.sleep(OVERLAY_HIDE_SETTLE_SECONDS)
 
             def post_callback():
                 # Restore window after screenshot
@@ -79,19 +110,25 @@ class IrisController:
 
             # Use DisplayWindow regardless of DEBUG_MODE
             # DEBUG_MODE only affects internal logic like saving screenshots (controlled by scripts.config)
-            self.agent = IrisAgent(task, pre_callback=pre_callback, post_callback=post_callback)
-            
-            while self.running:
-                # Execute one step
-                feedback = self.agent.step(
-                    log_callback=self.log
-                )
-                
-                if "[Max Steps Reached]" in feedback or "[Task Completed]" in feedback:
-                    self.running = False
-                    final_feedback = feedback
-                    break
-                
+            # In mask mode the window stays visible; captures paint over its rectangle instead
+            overlay_rect = self.window.screen_rect if OVERLAY_CAPTURE_MODE == "mask" else None
+            if self.resume_path:
+                self.agent = IrisAgent.resume(self.resume_path, pre_callback=pre_callback, post_callback=post_callback, overlay_rect=overlay_rect)
+                self.log(format_status_box("Task", f"Resumed after step {self.agent.step_count}.", width=DISPLAY_BOX_WIDTH) + "\n")
+            else:
+                self.agent = IrisAgent(task, pre_callback=pre_callback, post_callback=post_callback, overlay_rect=overlay_rect)
+            if self.replay_path:
+                player = self.agent.replay_macro(self.replay_path)
+                self.log(format_status_box("Macro", f"Replaying {len(player.steps)} recorded steps from {self.replay_path}.", width=DISPLAY_BOX_WIDTH) + "\n")
+            if self.agent.checkpoint_path:
+                print_boxed(f"Checkpoint: {self.agent.checkpoint_path}\nResume with: python main.py --resume {self.agent.checkpoint_path}")
+
+            # Steps run in a worker thread; model requests are cancellable tasks on this loop
+            self.runner = AgentRunner(self.agent, log_callback=self.log)
+            if self.stopping:
+                self.runner.stop()
+            final_feedback = asyncio.run(self.runner.run())
+
         except Exception as e:
             error_text = format_exception_details(e)
             error_message = format_status_box("Error", error_text)
@@ -100,14 +137,20 @@ class IrisController:
             print(colorize_terminal(error_message), flush=True)
         finally:
             self.running = False
-            self.log(format_status_box("Task Finished", "Task finished.", width=DISPLAY_BOX_WIDTH) + "\n")
-            if final_feedback:
-                print_boxed(f"Final Result:\n{final_feedback}")
+            if self.stopping:
+                # The runner already flushed; shutdown() exits once this thread ends
+                print_boxed("Stopped.")
+            else:
+                if DEBUG_MODE:
+                    get_debug_writer().flush()
+                self.log(format_status_box("Task Finished", "Task finished.", width=DISPLAY_BOX_WIDTH) + "\n")
+                if final_feedback:
+                    print_boxed(f"Final Result:\n{final_feedback}")
             
-            # Ensure window is visible and prompt for exit
-            self.window.safe_unhide()
-            self.log(format_status_box("Exit", "Press ESC 3 times to exit the program.", width=DISPLAY_BOX_WIDTH) + "\n")
-            print_boxed("Task finished. Press ESC 3 times to exit.")
+                # Ensure window is visible and prompt for exit
+                self.window.safe_unhide()
+                self.log(format_status_box("Exit", "Press ESC 3 times to exit the program.", width=DISPLAY_BOX_WIDTH) + "\n")
+                print_boxed("Task finished. Press ESC 3 times to exit.")
 
     def start(self):
         self.window.start_loop()
@@ -150,18 +193,37 @@ def wait_with_countdown(seconds):
     print_boxed("Time is up, starting task!")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Iris desktop GUI agent.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--resume", metavar="CHECKPOINT", help="Continue an interrupted task from its checkpoint file.")
+    source.add_argument("--replay", metavar="MACRO", help="Repeat a recorded run without the model, falling back to it when the screen differs.")
+    args = parser.parse_args()
+
     # Check if running in a headless environment (if GUI is needed)
     if os.environ.get('DISPLAY', '') == '' and os.name != 'nt':
         print_boxed('No display found. Cannot run GUI.')
         sys.exit(1)
 
-    task_prompt = prompt_for_task(logo)
-    
-    if task_prompt is None or not task_prompt.text.strip():
-        print_boxed("No task selected, exiting.")
-        sys.exit(0)
-        
-    wait_with_countdown(task_prompt.delay_seconds)
-        
-    app = IrisController(task_prompt.text)
+    if args.resume:
+        checkpoint = load_checkpoint(args.resume)
+        if checkpoint.get("completed"):
+            print_boxed(f"The task in {args.resume} already completed, nothing to resume.")
+            sys.exit(0)
+        print_boxed(f"Resuming after step {checkpoint['step_count']}:\n{checkpoint['task']}")
+        task = checkpoint["task"]
+    elif args.replay:
+        task = load_macro(args.replay)["task"]
+        print_boxed(f"Replaying {args.replay}:\n{task}")
+        wait_with_countdown(5)
+    else:
+        task_prompt = prompt_for_task(logo)
+
+        if task_prompt is None or not task_prompt.text.strip():
+            print_boxed("No task selected, exiting.")
+            sys.exit(0)
+
+        wait_with_countdown(task_prompt.delay_seconds)
+        task = task_prompt.text
+
+    app = IrisController(task, resume_path=args.resume, replay_path=args.replay)
     app.start()
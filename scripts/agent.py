@@ -1,5 +1,11 @@
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
+from scripts.cassette import get_cassette, wrap_client
+from scripts.checkpoint import load_checkpoint, new_checkpoint_path, save_checkpoint
 from scripts.config import *
+from scripts.macros import VERIFIED_ACTIONS, MacroPlayer, MacroRecorder, fingerprints_match, new_macro_path
 from scripts.memory import HierarchicalMemory
 from scripts.native_tools import (
     GUI_TOOL_SCHEMAS,
@@ -8,8 +14,12 @@ from scripts.native_tools import (
     compact_tool_call_for_log,
     format_tool_call_for_memory,
     normalize_tool_call,
+    tool_call_to_action,
     tool_calls_to_actions,
 )
+from scripts.overlay import OverlaySession
+from scripts.streaming import ToolCallAssembler
+from scripts.trajectories import TrajectoryStore, compact_action, format_trajectory_hints
 from scripts.tools import VisionPerceptor, ActionExecutor
 from scripts.utils import DISPLAY_BOX_WIDTH, colorize_terminal, format_agent_loop, format_status_box
 
@@ -29,6 +39,8 @@ Each step includes two images. Both images have a white border with grid labels
 - Mouse marker: the current cursor is marked by a crosshair in both images.
 - Current local mouse grid: the per-step user message gives a `mouse_grid_id`. It is always a Local View ID (`L-xx-yy`) computed from the newest screenshot after the previous action, and the cursor is precisely on that Local View point.
 - Nearby global grid: the per-step user message also gives the nearest Global View ID (`G-xx-yy`) to the current mouse position. This is a coarse nearby reference only; the cursor may be between global grid points.
+- Local-only steps: right after a step that only made fine `L` moves, a step may attach only the Local View to save time. `G` IDs from the most recent Global View stay valid. If you need to see the whole screen again, call `wait` briefly and the next step will include the Global View.
+- Screen change: when available, the per-step user message reports which Global View areas changed since the previous screenshot, or that the previous action produced no visible change. Use it to notice missed clicks early.
 
 You never receive raw absolute screen coordinates. The runtime converts grid IDs to coordinates internally.
 
@@ -90,17 +102,50 @@ When the task is fully complete, call `final_answer` with a concise completion s
 """.strip()
 
 
-def build_step_query(mouse_grid_id, nearest_global_grid_id):
+VISIBLE_EFFECT_ACTIONS = ("click", "double_click", "mouse_down", "mouse_up", "scroll", "type", "hotkey")
+
+
+def describe_screen_change(screen_change, previous_action_types=None):
+    """Turn the change between the last two captures into a short note for the model, or None."""
+    if screen_change is None:
+        return None
+
+    area = "Local View" if screen_change.local_only else "screen"
+    where = " in the Local View" if screen_change.local_only else ""
+    if not screen_change.changed:
+        acted = list(dict.fromkeys(action for action in previous_action_types or [] if action in VISIBLE_EFFECT_ACTIONS))
+        if acted:
+            return (
+                f"none detected{where}. The previous {', '.join(acted)} produced no visible change; "
+                "check whether it missed its target before repeating it."
+            )
+        return f"none detected{where} since the previous screenshot."
+
+    regions = "; ".join(start if start == end else f"{start} to {end}" for start, end in screen_change.grid_regions)
+    fraction = screen_change.changed_fraction
+    fraction_text = "less than 1%" if fraction < 0.01 else f"{fraction:.0%}"
+    return f"{fraction_text} of the {area} changed since the previous screenshot, mainly around {regions}."
+
+
+def build_step_query(mouse_grid_id, nearest_global_grid_id, screen_change_note=None, local_only=False):
+    screen_change_line = f"\n5. Screen change: {screen_change_note}" if screen_change_note else ""
+    if local_only:
+        global_view_line = (
+            "Global View image: omitted in this local-only verification step after a fine Local View move. "
+            "`G-xx-yy` IDs from the most recent Global View remain valid; call `wait` briefly if you need a fresh Global View."
+        )
+    else:
+        global_view_line = "Global View image: full screen, coarse `G-xx-yy` grid, `G` marks in the four border corners."
     return f"""
 ## Current Step
 
 You are seeing the latest screen state after the previous action.
 
 ## Inputs Attached To This Message
-1. Global View image: full screen, coarse `G-xx-yy` grid, `G` marks in the four border corners.
+1. {global_view_line}
 2. Local View image: cursor-anchored crop clipped at screen edges, fine `L-xx-yy` grid, `L` marks in the four border corners.
 3. Nearby global mouse grid: `{nearest_global_grid_id}`.
-4. Current local mouse grid: `{mouse_grid_id}`.
+4. Current local mouse grid: `{mouse_grid_id}`.{screen_change_line}
 
 `{nearest_global_grid_id}` is only the nearest Global View grid point near the current mouse position. The cursor is not necessarily on this Global View point; use it as a coarse whole-screen reference only.
 `{mouse_grid_id}` is the updated Local View grid point where the mouse is currently located in this newest screenshot. The cursor is precisely on this Local View point, and it is not an old grid point from history.
@@ -126,23 +171,245 @@ Do not answer with text only.
 MAX_TOOL_CALL_REPAIR_ATTEMPTS = 2
 
 
+def prompt_cache_key(setting, system_prompt, task_description):
+    """LLM_PROMPT_CACHE_KEY as sent to the endpoint: None when unset, a per-task hash for "auto"."""
+    if not setting:
+        return None
+    if setting.lower() != "auto":
+        return setting
+    digest = hashlib.sha256(f"{system_prompt}\n{task_description}".encode("utf-8")).hexdigest()
+    return f"iris-{digest[:16]}"
+
+
+def open_trajectory_store():
+    if TRAJECTORY_STORE_FILE.lower() in {"", "off", "none"}:
+        return None
+    try:
+        return TrajectoryStore(TRAJECTORY_STORE_FILE)
+    except Exception as e:
+        print(f"Failed to open trajectory store: {e}")
+        return None
+
+
 class IrisAgent:
-    def __init__(self, task_description, pre_callback=None, post_callback=None):
+    def __init__(self, task_description, pre_callback=None, post_callback=None, overlay_rect=None, hints=None):
         self.system_prompt = IRIS_SYSTEM_PROMPT
-        self.memory = HierarchicalMemory(self.system_prompt, task_description)
-        self.vision = VisionPerceptor(pre_callback, post_callback)
-        self.executor = ActionExecutor(pre_callback, post_callback)
-        self.client = OpenAI(**openai_client_kwargs())
+        self.task_description = task_description
+        self.trajectory_store = open_trajectory_store()
+        self.trajectory_actions = []
+        self.llm_calls = 0
+        self.hinted_runs = 0
+        if hints is None:
+            similar = self.trajectory_store.similar(task_description, TRAJECTORY_HINTS) if self.trajectory_store else []
+            hints = format_trajectory_hints(similar)
+            self.hinted_runs = len(similar)
+            cassette = get_cassette()
+            if cassette:
+                # The hints are part of the recorded requests; a replay must start from the same ones
+                hints, self.hinted_runs = cassette.task_hints(task_description, hints, self.hinted_runs)
+        self.memory = HierarchicalMemory(self.system_prompt, task_description, hints=hints)
+        # One hide scope per step: the capture and every action reuse it instead of hiding the window each time
+        self.overlay = OverlaySession(pre_callback, post_callback)
+        # With overlay_rect (mask mode) the window stays visible and is masked out of captures instead
+        self.vision = VisionPerceptor(self.overlay.enter, self.overlay.exit, overlay_rect=overlay_rect)
+        self.executor = ActionExecutor(self.overlay.enter, self.overlay.exit, overlay_rect=overlay_rect)
+        # Built on first use; AgentRunner sets its cancellable client instead
+        self._client = None
         self.step_count = 0
+        self.last_actions = []
+        self.local_only_streak = 0
+        self.prompt_cache_key = prompt_cache_key(LLM_PROMPT_CACHE_KEY, self.system_prompt, task_description)
+        self.step_usage = {}
+        self.checkpoint_path = new_checkpoint_path()
+        macro_path = new_macro_path()
+        self.macro_recorder = MacroRecorder(macro_path, task_description) if macro_path else None
+        self.macro_player = None
+
+    @property
+    def client(self):
+        if getattr(self, "_client", None) is None:
+            self._client = wrap_client(OpenAI(**openai_client_kwargs()))
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    @classmethod
+    def resume(cls, checkpoint_path, pre_callback=None, post_callback=None, overlay_rect=None):
+        """Rebuild an agent from a checkpoint; it continues after the last completed step and keeps writing to the same file."""
+        state = load_checkpoint(checkpoint_path)
+        # The saved hints keep the fixed prefix identical even if the trajectory store changed since
+        agent = cls(
+            state["task"],
+            pre_callback=pre_callback,
+            post_callback=post_callback,
+            overlay_rect=overlay_rect,
+            hints=state.get("hints", ""),
+        )
+        agent.restore_checkpoint(state)
+        agent.checkpoint_path = checkpoint_path
+        return agent
+
+    def replay_macro(self, macro_path):
+        """Replay a recorded macro before asking the model; the normal loop takes over when it ends or stops matching."""
+        self.macro_player = MacroPlayer(macro_path)
+        return self.macro_player
+
+    def checkpoint_state(self, completed=False):
+        return {
+            "task": self.task_description,
+            "completed": completed,
+            "step_count": self.step_count,
+            "mouse_position": [self.executor.mouse_x, self.executor.mouse_y],
+            "local_only_streak": self.local_only_streak,
+            "last_actions": self.last_actions,
+            "llm_calls": self.llm_calls,
+            "trajectory_actions": self.trajectory_actions,
+            "hints": self.memory.hints,
+            "hinted_runs": self.hinted_runs,
+            "macro_path": self.macro_recorder.path if self.macro_recorder else None,
+            "memory": self.memory.snapshot(),
+        }
+
+    def restore_checkpoint(self, state):
+        self.step_count = state["step_count"]
+        self.local_only_streak = state.get("local_only_streak", 0)
+        self.last_actions = state.get("last_actions", [])
+        self.llm_calls = state.get("llm_calls", 0)
+        self.trajectory_actions = state.get("trajectory_actions", [])
+        self.hinted_runs = state.get("hinted_runs", 0)
+        self.memory.restore(state["memory"])
+        if state.get("macro_path") and self.macro_recorder:
+            # Keep appending to the interrupted run's macro
+            self.macro_recorder = MacroRecorder(state["macro_path"], self.task_description)
+        if state.get("mouse_position"):
+            # get_mouse_position() moves the real pointer back here if it drifted
+            self.executor.mouse_x, self.executor.mouse_y = state["mouse_position"]
+
+    def save_checkpoint(self, completed=False):
+        if not getattr(self, "checkpoint_path", None):
+            return
+        try:
+            save_checkpoint(self.checkpoint_path, self.checkpoint_state(completed))
+        except Exception as e:
+            print(f"Failed to save checkpoint: {e}")
+
+    def close(self):
+        """Stop the prefetch capture thread and release the screen grabber."""
+        capture_executor = getattr(self, "_capture_executor", None)
+        if capture_executor is not None:
+            # A prefetched frame nobody will use still finishes, so the overlay is shown again
+            capture_executor.shutdown(wait=True)
+            self._capture_executor = None
+        self._pending_capture = None
+        self.vision.close()
+
+    def record_trajectory(self, feedback):
+        """Add this completed run to the trajectory store so later similar tasks get it as a hint."""
+        if not self.trajectory_store:
+            return
+        cassette = get_cassette()
+        if cassette and cassette.mode == "replay":
+            # A replayed run is not a new one, and recording it would change the hints of the next replay
+            return
+        final_answer = feedback.split("[Task Completed]:", 1)[-1].strip()
+        try:
+            self.trajectory_store.record(
+                self.task_description,
+                self.trajectory_actions,
+                final_answer,
+                self.step_count,
+                llm_calls=self.llm_calls,
+                hinted=self.hinted_runs,
+            )
+        except Exception as e:
+            print(f"Failed to record trajectory: {e}")
+
+    def save_macro(self):
+        if not getattr(self, "macro_recorder", None):
+            return
+        try:
+            self.macro_recorder.save()
+        except Exception as e:
+            print(f"Failed to save macro: {e}")
+
+    def _action_position(self, action_dict, coordinate_map):
+        """The screen point an action acts on: the move target, otherwise the pointer."""
+        if action_dict.get("action_type") == "move":
+            point_id = action_dict.get("point_id")
+            if not coordinate_map or point_id not in coordinate_map:
+                return None
+            return tuple(coordinate_map[point_id])
+        return self.executor.mouse_x, self.executor.mouse_y
+
+    def _pointer_fingerprint(self):
+        try:
+            return self.vision.region_fingerprint(self.executor.mouse_x, self.executor.mouse_y)
+        except Exception as e:
+            print(f"Failed to fingerprint the pointer region: {e}")
+            return None
+
+    def _execute_and_record(self, action_dict, tool_call, coordinate_map, log_callback=None, fingerprint=None):
+        """
+        Execute one action and add it to the macro recording. Presses record the region
+        under the pointer first; replay passes the fingerprint it already verified.
+        """
+        recorder = getattr(self, "macro_recorder", None)
+        if not recorder:
+            return self.executor.execute(action_dict, coordinate_map, log_callback=log_callback)
+        position = self._action_position(action_dict, coordinate_map)
+        if fingerprint is None and action_dict.get("action_type") in VERIFIED_ACTIONS:
+            fingerprint = self._pointer_fingerprint()
+        feedback = self.executor.execute(action_dict, coordinate_map, log_callback=log_callback)
+        if position and not feedback.startswith("Error"):
+            recorder.record(self.step_count, tool_call, action_dict, position, fingerprint)
+        return feedback
+
+    def _llm_request_kwargs(self, messages):
+        self.llm_calls = getattr(self, "llm_calls", 0) + 1
+        kwargs = {
+            "model": LLM_MODEL_NAME,
+            "messages": messages,
+            "tools": GUI_TOOL_SCHEMAS,
+            "tool_choice": "auto",
+            "parallel_tool_calls": True,
+        }
+        if getattr(self, "prompt_cache_key", None):
+            # extra_body keeps older SDKs that do not know the parameter working
+            kwargs["extra_body"] = {"prompt_cache_key": self.prompt_cache_key}
+        return kwargs
+
+    def _record_llm_usage(self, messages, response):
+        usage = self.memory.record_usage(messages, response, tools=GUI_TOOL_SCHEMAS, step=self.step_count)
+        for key, value in (usage or {}).items():
+            self.step_usage[key] = self.step_usage.get(key, 0) + value
 
     def _call_llm_for_action(self, messages):
-        return self.client.chat.completions.create(
-            model=LLM_MODEL_NAME,
-            messages=messages,
-            tools=GUI_TOOL_SCHEMAS,
-            tool_choice="auto",
-            parallel_tool_calls=True,
+        response = self.client.chat.completions.create(**self._llm_request_kwargs(messages))
+        self._record_llm_usage(messages, response)
+        return response
+
+    def _call_llm_streaming(self, messages, on_tool_call):
+        """
+        Stream the completion and pass each tool call to on_tool_call as soon as it is
+        complete. Returns the whole completion in the non-streaming shape, so logging
+        and memory see the same response as without streaming.
+        """
+        stream = self.client.chat.completions.create(
+            **self._llm_request_kwargs(messages),
+            stream=True,
+            stream_options={"include_usage": True},
         )
+        assembler = ToolCallAssembler()
+        for chunk in stream:
+            for tool_call in assembler.feed(chunk):
+                on_tool_call(tool_call)
+        for tool_call in assembler.finish():
+            on_tool_call(tool_call)
+        response = assembler.response()
+        self._record_llm_usage(messages, response)
+        return response
 
     @staticmethod
     def _first_choice(chat_response):
@@ -187,7 +454,161 @@ class IrisAgent:
             log_entries.append({"name": str(name), "arguments": arguments})
         return log_entries
 
+    def _should_observe_local_only(self):
+        """Local-only observation after a step that only made fine Local View moves, capped per streak."""
+        if not LOCAL_ONLY_AFTER_LOCAL_MOVE or getattr(self, "local_only_streak", 0) >= LOCAL_ONLY_MAX_CONSECUTIVE:
+            return False
+        last_actions = getattr(self, "last_actions", None)
+        return bool(last_actions) and all(
+            action.get("action_type") == "move" and str(action.get("point_id", "")).startswith("L-")
+            for action in last_actions
+        )
+
+    def _capture_frame(self, local_only):
+        """Capture and encode the current screen; returns the frame with the perceptor's capture files and screen change."""
+        mouse_x, mouse_y = self.executor.get_mouse_position()
+        frame = self.vision.capture_state(mouse_x, mouse_y, local_only=local_only)
+        encode_frame = getattr(self.memory, "encode_frame", None)
+        if encode_frame:
+            encode_frame(frame)
+        return frame, getattr(self.vision, "last_capture_files", None), getattr(self.vision, "last_screen_change", None)
+
+    def _prefetch_capture(self):
+        """
+        Start the next step's capture now that this step's actions have settled. It runs
+        while the step is formatted, written to memory and checkpointed; the next step
+        picks it up instead of capturing again. The overlay scope entered here keeps the
+        window hidden until the capture is done.
+        """
+        if getattr(self, "_capture_executor", None) is None:
+            self._capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="iris-capture")
+        local_only = self._should_observe_local_only()
+        self.overlay.enter(hide=False)
+
+        def capture():
+            try:
+                return self._capture_frame(local_only)
+            finally:
+                self.overlay.exit()
+
+        try:
+            self._pending_capture = self._capture_executor.submit(capture)
+        except Exception:
+            self.overlay.exit()
+            raise
+
+    def _next_frame(self):
+        pending = getattr(self, "_pending_capture", None)
+        self._pending_capture = None
+        self.step_phases["capture_prefetched"] = pending is not None
+        if pending is not None:
+            return pending.result()
+        return self._capture_frame(self._should_observe_local_only())
+
     def step(self, log_callback=None):
+        """
+        Run one perceive-reason-act step inside an overlay session. The window is hidden
+        for the capture, shown while the model answers, and hidden once more for all
+        actions. Timing and token usage for the step are kept in last_step_timing and
+        the debug log.
+        """
+        started = time.perf_counter()
+        hides, hide_seconds = self.overlay.counters()
+        self.step_usage = {}
+        self.step_phases = {}
+        try:
+            with self.overlay.scope():
+                if getattr(self, "macro_player", None) and self.macro_player.active:
+                    return self._replay_step(log_callback)
+                return self._step(log_callback)
+        finally:
+            step_hides, step_hide_seconds = self.overlay.counters()
+            self.last_step_timing = {
+                "step_seconds": round(time.perf_counter() - started, 4),
+                "overlay_hides": step_hides - hides,
+                "overlay_hide_seconds": round(step_hide_seconds - hide_seconds, 4),
+                # Token usage summed over the step's model calls; cached_tokens is the prompt prefix cache hit
+                **self.step_usage,
+                # Wall time per phase: capture (waiting for a prefetched one), context, llm, act,
+                # bookkeeping, and first_action_seconds from the model request to the first action
+                **self.step_phases,
+            }
+            self.memory.add_step_timing_log(self.step_count, self.last_step_timing)
+
+    def _replay_step(self, log_callback=None):
+        """
+        Replay the next recorded step of the macro without calling the model. Before each
+        press the pointer must be at the recorded point and the region under it must
+        match the recorded fingerprint. On the first mismatch the macro is dropped; if
+        nothing of this step ran yet, the step continues as a normal model step.
+        """
+        if self.step_count >= MAX_STEPS:
+            return "🛑 [Max Steps Reached]. Stopping."
+
+        def emit(message, title="Macro"):
+            print(colorize_terminal(format_status_box(title, message)), flush=True)
+            if log_callback:
+                log_callback(format_status_box(title, message, width=DISPLAY_BOX_WIDTH) + "\n")
+
+        self.executor.get_mouse_position()
+        self.step_count += 1
+        self.last_actions = []
+        tool_log = []
+        feedback_parts = []
+        mismatch = None
+        for entry in self.macro_player.current_step():
+            action_dict = dict(entry["action"])
+            tool_call = entry["tool"]
+            position = tuple(entry["position"])
+            coordinate_map = {action_dict.get("point_id"): position} if action_dict.get("action_type") == "move" else None
+            fingerprint = None
+            if entry.get("fingerprint") is not None:
+                if (self.executor.mouse_x, self.executor.mouse_y) != position:
+                    mismatch = f"the pointer is not at {position} for {tool_call.get('name')}"
+                    break
+                fingerprint = self._pointer_fingerprint()
+                if not fingerprints_match(entry["fingerprint"], fingerprint, MACRO_MATCH_THRESHOLD):
+                    mismatch = f"the screen under the pointer changed before {tool_call.get('name')}"
+                    break
+            if action_dict.get("action_type") == "ask_input":
+                self.overlay.reveal()
+            action_feedback = self._execute_and_record(action_dict, tool_call, coordinate_map, log_callback=log_callback, fingerprint=fingerprint)
+            tool_log.append(tool_call)
+            self.last_actions.append(action_dict)
+            self.trajectory_actions.append(compact_action(tool_call))
+            feedback_parts.append(action_feedback)
+            if "[Task Completed]" in action_feedback:
+                break
+
+        replayed_step = self.macro_player.position + 1
+        if mismatch:
+            self.macro_player.stop()
+            emit(f"Stopped replay at recorded step {replayed_step}: {mismatch}.\nContinuing with the model.")
+            if not tool_log:
+                self.step_count -= 1
+                return self._step(log_callback)
+            feedback_parts.append(f"Replay stopped: {mismatch}.")
+        else:
+            self.macro_player.advance()
+            emit(f"Replayed recorded step {replayed_step}/{len(self.macro_player.steps)}:\n" + "\n".join(compact_action(tool_call) for tool_call in tool_log))
+
+        feedback = "\n".join(feedback_parts)
+        self.memory.add_interaction(
+            "Replayed recorded actions:\n" + "\n".join(compact_action(tool_call) for tool_call in tool_log),
+            f"Execution Result: {feedback}",
+            tool=tool_log,
+            assistant_log_extra={"step": self.step_count, "replayed": True},
+            user_log_extra={"step": self.step_count},
+            log_callback=lambda message: emit(message, title="Memory"),
+        )
+        completed = "[Task Completed]" in feedback
+        if completed:
+            self.record_trajectory(feedback)
+        self.save_macro()
+        self.save_checkpoint(completed=completed)
+        return feedback
+
+    def _step(self, log_callback=None):
         if self.step_count >= MAX_STEPS:
             return "🛑 [Max Steps Reached]. Stopping."
 
@@ -200,16 +621,32 @@ class IrisAgent:
                 log_callback(str(window_message or text) + "\n")
 
         # 1. Perception
-        # Get current mouse position from executor
-        mouse_x, mouse_y = self.executor.get_mouse_position()
-        # Updated to unpack coordinate_map and mouse_grid_id
-        global_image, local_image, coordinate_map, mouse_grid_id, nearest_global_grid_id = self.vision.capture_state(mouse_x, mouse_y)
-        capture_files = getattr(self.vision, "last_capture_files", None)
+        # The capture may already have been taken while the previous step was being saved
+        phase_started = time.perf_counter()
+        frame, capture_files, screen_change = self._next_frame()
+        self.step_phases["capture_seconds"] = round(time.perf_counter() - phase_started, 4)
+        coordinate_map = frame.coordinate_map
+        mouse_grid_id = frame.mouse_grid_id
+        nearest_global_grid_id = frame.nearest_global_grid_id
+        # The perceptor falls back to a full capture when it cannot do a local-only one
+        local_only = frame.local_only
+        self.local_only_streak = getattr(self, "local_only_streak", 0) + 1 if local_only else 0
+        previous_action_types = [action.get("action_type") for action in getattr(self, "last_actions", None) or []]
+        screen_change_note = describe_screen_change(screen_change, previous_action_types)
+        # A missed click is worth remembering; the query with the note is not kept in memory
+        missed_effect = (
+            screen_change is not None
+            and not screen_change.changed
+            and any(action in VISIBLE_EFFECT_ACTIONS for action in previous_action_types)
+        )
+        self.last_actions = []
         
         # 2. Build Context
-        query = build_step_query(mouse_grid_id, nearest_global_grid_id)
-        messages = self.memory.get_full_context(query, images=(global_image, local_image))
+        phase_started = time.perf_counter()
+        query = build_step_query(mouse_grid_id, nearest_global_grid_id, screen_change_note, local_only=local_only)
+        messages = self.memory.get_full_context(query, frame=frame)
         self.memory.add_model_input_log(messages, self.step_count, images=capture_files)
+        self.step_phases["context_seconds"] = round(time.perf_counter() - phase_started, 4)
 
         # 3. Reasoning and native tool selection
         full_response = ""
@@ -219,11 +656,54 @@ class IrisAgent:
         tool_memory_parts = []
         error = None
         
+        feedback_parts = []
+        llm_started = time.perf_counter()
+        act_seconds = 0.0
+
+        def run_action(action_dict, normalized_tool_call):
+            # 4. Execution. Nothing runs after final_answer, even if more calls arrive.
+            nonlocal act_seconds
+            if any("[Task Completed]" in part for part in feedback_parts):
+                return
+            if not self.last_actions:
+                self.step_phases["first_action_seconds"] = round(time.perf_counter() - llm_started, 4)
+            tool_log.append(compact_tool_call_for_log(normalized_tool_call))
+            tool_memory_parts.append(format_tool_call_for_memory(normalized_tool_call))
+            if action_dict.get("action_type") == "ask_input":
+                # The user needs to see the log while answering
+                self.overlay.reveal()
+            action_started = time.perf_counter()
+            action_feedback = self._execute_and_record(action_dict, tool_log[-1], coordinate_map, log_callback=log_callback)
+            act_seconds += time.perf_counter() - action_started
+            self.last_actions.append(action_dict)
+            self.trajectory_actions.append(compact_action(tool_log[-1]))
+            feedback_parts.append(action_feedback)
+            tool_results.append({"action": action_dict, "feedback": action_feedback})
+
+        stream_errors = []
+
+        def run_streamed_tool_call(tool_call):
+            # A bad call stops the rest; the error is raised once the response has been logged
+            if stream_errors:
+                return
+            try:
+                action_pair = tool_call_to_action(tool_call)
+            except ToolCallProtocolError as e:
+                stream_errors.append(e)
+                return
+            run_action(*action_pair)
+
         try:
+            # Keep the live log visible while waiting for the model; the first action hides it again
+            self.overlay.reveal()
             assistant_text_parts = []
             tool_calls = None
             for repair_attempt in range(MAX_TOOL_CALL_REPAIR_ATTEMPTS + 1):
-                chat_response = self._call_llm_for_action(messages)
+                if LLM_STREAM_TOOL_CALLS:
+                    # Each tool call runs as soon as its arguments are complete, while the rest streams in
+                    chat_response = self._call_llm_streaming(messages, run_streamed_tool_call)
+                else:
+                    chat_response = self._call_llm_for_action(messages)
                 choice = self._first_choice(chat_response)
                 assistant_message = self._choice_message(choice)
                 finish_reason = self._choice_finish_reason(choice)
@@ -238,6 +718,9 @@ class IrisAgent:
 
                 self.memory.add_model_output_log(assistant_text, tool=model_output_tool_log, step=self.step_count)
 
+                if stream_errors:
+                    raise stream_errors[0]
+
                 if finish_reason == "length":
                     raise ToolCallProtocolError("model response was truncated before a complete native tool call was available")
 
@@ -252,37 +735,43 @@ class IrisAgent:
                 messages.append({"role": "user", "content": TOOL_CALL_REQUIRED_RETRY_PROMPT})
                 self.memory.add_model_input_log(messages, self.step_count)
 
-            action_pairs = tool_calls_to_actions(tool_calls)
-            feedback_parts = []
-            for action_dict, normalized_tool_call in action_pairs:
-                tool_log.append(compact_tool_call_for_log(normalized_tool_call))
-                tool_memory_parts.append(format_tool_call_for_memory(normalized_tool_call))
-
-                # 4. Execution
-                action_feedback = self.executor.execute(action_dict, coordinate_map, log_callback=log_callback)
-                feedback_parts.append(action_feedback)
-                tool_results.append({"action": action_dict, "feedback": action_feedback})
-                if "[Task Completed]" in action_feedback:
-                    break
+            if not LLM_STREAM_TOOL_CALLS:
+                for action_dict, normalized_tool_call in tool_calls_to_actions(tool_calls):
+                    run_action(action_dict, normalized_tool_call)
 
             feedback = "\n".join(feedback_parts)
         except ToolCallProtocolError as e:
-            feedback = f"Error: {e}"
-            error = feedback
+            error = f"Error: {e}"
+            # With streaming, calls completed before the error have already run
+            feedback = "\n".join(feedback_parts + [error])
         except Exception as e:
             error = f"Error during LLM inference: {e}"
-            emit(
-                format_agent_loop(self.step_count, mouse_grid_id, nearest_global_grid_id, full_response, tool_results, error=error),
-                format_agent_loop(self.step_count, mouse_grid_id, nearest_global_grid_id, full_response, tool_results, error=error, width=DISPLAY_BOX_WIDTH),
-            )
-            return f"Error: {e}"
+            if not feedback_parts:
+                emit(
+                    format_agent_loop(self.step_count, mouse_grid_id, nearest_global_grid_id, full_response, tool_results, error=error, screen_change=screen_change_note, local_only=local_only),
+                    format_agent_loop(self.step_count, mouse_grid_id, nearest_global_grid_id, full_response, tool_results, error=error, screen_change=screen_change_note, local_only=local_only, width=DISPLAY_BOX_WIDTH),
+                )
+                return f"Error: {e}"
+            # Calls that ran while the response streamed in still go to memory, the macro and the checkpoint
+            feedback = "\n".join(feedback_parts + [error])
+        finally:
+            # Model time excludes actions that already ran while the response streamed in
+            self.step_phases["llm_seconds"] = round(time.perf_counter() - llm_started - act_seconds, 4)
+            self.step_phases["act_seconds"] = round(act_seconds, 4)
+
+        # 5. Pipelining. The next capture overlaps the logging, memory (including a blocking
+        # summary) and checkpoint work below. Memory is still updated before this step returns.
+        completed = "[Task Completed]" in feedback
+        phase_started = time.perf_counter()
+        if STEP_PIPELINE and not completed and self.step_count < MAX_STEPS:
+            self._prefetch_capture()
 
         emit(
-            format_agent_loop(self.step_count, mouse_grid_id, nearest_global_grid_id, full_response, tool_results, error=error),
-            format_agent_loop(self.step_count, mouse_grid_id, nearest_global_grid_id, full_response, tool_results, error=error, width=DISPLAY_BOX_WIDTH),
+            format_agent_loop(self.step_count, mouse_grid_id, nearest_global_grid_id, full_response, tool_results, error=error, screen_change=screen_change_note, local_only=local_only),
+            format_agent_loop(self.step_count, mouse_grid_id, nearest_global_grid_id, full_response, tool_results, error=error, screen_change=screen_change_note, local_only=local_only, width=DISPLAY_BOX_WIDTH),
         )
 
-        # 7. Memory
+        # 6. Memory
         def memory_log(message):
             emit(format_status_box("Memory", message), format_status_box("Memory", message, width=DISPLAY_BOX_WIDTH))
 
@@ -291,9 +780,12 @@ class IrisAgent:
         user_log_extra = {"step": self.step_count}
         if capture_files:
             user_log_extra["images"] = capture_files
+        execution_result = f"Execution Result: {feedback}"
+        if missed_effect:
+            execution_result = f"Screen change before this step: {screen_change_note}\n{execution_result}"
         self.memory.add_interaction(
             memory_content,
-            f"Execution Result: {feedback}",
+            execution_result,
             tool=tool_log,
             assistant_log_content=full_response,
             assistant_log_extra=assistant_log_extra,
@@ -301,6 +793,11 @@ class IrisAgent:
             log_callback=memory_log,
             debug_log=False,
         )
+        if completed:
+            self.record_trajectory(feedback)
+        self.save_macro()
+        self.save_checkpoint(completed=completed)
+        self.step_phases["bookkeeping_seconds"] = round(time.perf_counter() - phase_started, 4)
         
         return feedback
 
@@ -0,0 +1,555 @@
+import argparse
+import base64
+import glob
+import os
+import random
+import time
+from contextlib import ExitStack, redirect_stdout
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from scripts import capture, memory, tools
+from scripts.image_encoding import parse_image_encoding
+from scripts.config import (
+    ACTION_SETTLE_SECONDS,
+    CROP_SIZE,
+    GRID_COLOR,
+    GRID_STEP,
+    GRID_WIDTH,
+    LOCAL_GRID_STEP,
+    MEMORY_COMPRESSION_CHUNK_TOKENS,
+    MEMORY_COMPRESSION_WORKERS,
+    TRAJECTORY_HINTS,
+    TRAJECTORY_STORE_FILE,
+)
+from scripts.fake_llm_server import FakeLLMServer
+from scripts.frame import CapturedFrame
+from scripts.trajectories import TrajectoryStore, tokenize
+
+
+RESOLUTIONS = {
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+}
+
+
+def parse_resolutions(raw):
+    names = [part.strip().lower() for part in raw.split(",") if part.strip()]
+    unknown = [name for name in names if name not in RESOLUTIONS]
+    if unknown:
+        raise ValueError(f"Unknown resolution(s): {', '.join(unknown)}")
+    return names
+
+
+def synthetic_screenshot(size):
+    # Noise keeps the paste/composite honest; a flat image would be unrealistically cheap.
+    return Image.effect_noise(size, 64).convert("RGB")
+
+
+def synthetic_desktop(size, seed=0):
+    """Gradient wallpaper, a photo-like panel, and windows with text-like strokes: compresses roughly like a real desktop."""
+    rng = random.Random(seed)
+    width, height = size
+    image = Image.merge(
+        "RGB",
+        (
+            Image.linear_gradient("L").resize(size),
+            Image.new("L", size, 70),
+            Image.linear_gradient("L").rotate(90).resize(size),
+        ),
+    )
+    photo = Image.effect_noise((width // 4, height // 4), 40).convert("RGB")
+    image.paste(photo.filter(ImageFilter.GaussianBlur(2)), (width // 2, height // 2))
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        left = rng.randrange(0, width * 2 // 3)
+        top = rng.randrange(0, height * 2 // 3)
+        right = min(width, left + rng.randrange(width // 4, width // 2))
+        bottom = min(height, top + rng.randrange(height // 4, height // 2))
+        draw.rectangle((left, top, right, bottom), fill=(245, 245, 245), outline=(120, 120, 120))
+        draw.rectangle((left, top, right, top + 28), fill=(210, 215, 225))
+        for y in range(top + 40, bottom - 12, 18):
+            x = left + 12
+            while x < right - 40:
+                word = rng.randrange(12, 60)
+                draw.rectangle((x, y, min(x + word, right - 12), y + 9), fill=(rng.randrange(0, 90),) * 3)
+                x += word + 8
+    return image
+
+
+def encode_png_base64(image):
+    # Same encoding HierarchicalMemory uses for image_url parts
+    buffered = BytesIO()
+    image.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue())
+
+
+def time_call(func, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1000
+
+
+def draw_grid_per_step(image, step, prefix):
+    """
+    The Global View drawing path before the overlay cache: a fresh bordered canvas, every
+    line and label drawn with ImageDraw, and the coordinate map rebuilt on every step.
+    """
+    width, height = image.size
+    padding = 80 if prefix == "G" else 40
+    canvas = Image.new("RGB", (width + 2 * padding, height + 2 * padding), color="white")
+    canvas.paste(image, (padding, padding))
+    draw = ImageDraw.Draw(canvas)
+    font = tools._load_label_font(32 if prefix == "G" else 16)
+    tools._draw_corner_prefix_labels(draw, prefix, padding, canvas.width, canvas.height, font)
+    columns = tools._grid_axis_positions(0, width, step, 0)
+    rows = tools._grid_axis_positions(0, height, step, 0)
+    for index, x in columns:
+        draw.line([(x + padding, padding), (x + padding, canvas.height - padding)], fill=GRID_COLOR, width=GRID_WIDTH)
+        tools._draw_centered_text(draw, x + padding, padding // 2, f"{index:02d}", font)
+        tools._draw_centered_text(draw, x + padding, canvas.height - padding // 2, f"{index:02d}", font)
+    for index, y in rows:
+        draw.line([(padding, y + padding), (canvas.width - padding, y + padding)], fill=GRID_COLOR, width=GRID_WIDTH)
+        tools._draw_centered_text(draw, padding // 2, y + padding, f"{index:02d}", font)
+        tools._draw_centered_text(draw, canvas.width - padding // 2, y + padding, f"{index:02d}", font)
+    coordinate_map = {
+        f"{prefix}-{col:02d}-{row:02d}": (min(x, max(0, width - 1)), min(y, max(0, height - 1)))
+        for col, x in columns
+        for row, y in rows
+    }
+    return canvas, coordinate_map
+
+
+def bench_overlay(args):
+    print("Global view overlay (ms per step): per-step drawing as before the cache, the overlay")
+    print("rendered without the cache, and the cached overlay. Speedup is per-step drawing / cached.")
+    print(f"{'resolution':<12}{'per-step':>12}{'uncached':>12}{'cached':>12}{'speedup':>10}")
+    for name in parse_resolutions(args.resolutions):
+        screenshot = synthetic_screenshot(RESOLUTIONS[name])
+        width, height = screenshot.size
+        overlay_args = (width, height, GRID_STEP, "G", 0, 0, 0, 0, GRID_COLOR, GRID_WIDTH)
+
+        def uncached():
+            overlay = tools._render_grid_overlay(*overlay_args)
+            tools._compose_grid_overlay(screenshot, overlay)
+
+        def cached():
+            overlay = tools._grid_overlay(*overlay_args)
+            tools._compose_grid_overlay(screenshot, overlay)
+
+        cached()
+        per_step_ms = time_call(lambda: draw_grid_per_step(screenshot, GRID_STEP, "G"), args.iterations)
+        uncached_ms = time_call(uncached, args.iterations)
+        cached_ms = time_call(cached, args.iterations)
+        print(f"{name:<12}{per_step_ms:>12.1f}{uncached_ms:>12.1f}{cached_ms:>12.1f}{per_step_ms / cached_ms:>9.1f}x")
+
+
+def bench_global_view(args):
+    print(f"Global view payload: full size vs GLOBAL_MAX_EDGE={args.max_edge} (per step, PNG + base64)")
+    print(f"{'resolution':<12}{'max edge':>10}{'canvas':>12}{'render ms':>11}{'encode ms':>11}{'KiB':>9}")
+    perceptor = tools.VisionPerceptor.__new__(tools.VisionPerceptor)
+    for name in parse_resolutions(args.resolutions):
+        width, height = RESOLUTIONS[name]
+        screenshot = synthetic_desktop((width, height))
+        for max_edge in (0, args.max_edge):
+            with patch.object(tools, "GLOBAL_MAX_EDGE", max_edge):
+                global_image, _ = perceptor._render_global_view(screenshot, width // 2, height // 2)
+                render_ms = time_call(lambda: perceptor._render_global_view(screenshot, width // 2, height // 2), args.iterations)
+            payload = encode_png_base64(global_image)
+            encode_ms = time_call(lambda: encode_png_base64(global_image), args.iterations)
+            canvas = f"{global_image.width}x{global_image.height}"
+            label = max_edge or "full"
+            print(f"{name:<12}{label:>10}{canvas:>12}{render_ms:>11.1f}{encode_ms:>11.1f}{len(payload) / 1024:>9.0f}")
+
+
+DEBUG_SCREENSHOT_DIR = os.path.join(os.path.dirname(__file__), "debug", "screenshot")
+
+
+def load_view_corpus(directory, limit):
+    """Saved debug screenshots grouped by view, newest first. Falls back to synthetic views when none exist."""
+    corpus = {}
+    for view in ("global", "local"):
+        paths = sorted(glob.glob(os.path.join(directory, f"{view}_*.*")), reverse=True)[:limit]
+        corpus[view] = [Image.open(path).convert("RGB") for path in paths]
+    if any(corpus.values()):
+        return corpus, directory
+
+    perceptor = tools.VisionPerceptor.__new__(tools.VisionPerceptor)
+    corpus = {"global": [], "local": []}
+    for seed, name in enumerate(RESOLUTIONS):
+        width, height = RESOLUTIONS[name]
+        screenshot = synthetic_desktop((width, height), seed)
+        corpus["global"].append(perceptor._render_global_view(screenshot, width // 2, height // 2)[0])
+        local_image, left, top, mouse_x, mouse_y = perceptor._crop_local_view(screenshot, width // 2, height // 2)
+        corpus["local"].append(perceptor._draw_grid_with_labels(local_image, LOCAL_GRID_STEP, "L", left, top, mouse_x, mouse_y)[0])
+    return corpus, "synthetic desktops (no saved debug screenshots found)"
+
+
+def bench_encoding(args):
+    profiles = [parse_image_encoding(spec) for spec in args.profiles.split(",") if spec.strip()]
+    corpus, source = load_view_corpus(args.corpus, args.limit)
+    print(f"Upload encoding per view over {source} (mean per image, base64 payload)")
+    print(f"{'view':<8}{'images':>8}{'profile':>16}{'encode ms':>11}{'KiB':>9}{'vs png':>9}")
+    for view, images in corpus.items():
+        if not images:
+            continue
+        baseline = None
+        for encoding in profiles:
+            sizes = [len(base64.b64encode(encoding.encode(image))) for image in images]
+            encode_ms = sum(time_call(lambda: encoding.encode(image), args.iterations) for image in images) / len(images)
+            mean_kib = sum(sizes) / len(sizes) / 1024
+            baseline = baseline or mean_kib
+            print(f"{view:<8}{len(images):>8}{str(encoding):>16}{encode_ms:>11.1f}{mean_kib:>9.0f}{mean_kib / baseline:>8.2f}x")
+
+
+def frames_per_second(grab, seconds):
+    grab()
+    frames = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        grab()
+        frames += 1
+    return frames / (time.perf_counter() - started)
+
+
+def bench_capture(args):
+    names = list(capture.CAPTURE_BACKENDS) if args.backends == "all" else [name.strip() for name in args.backends.split(",")]
+    print(f"Screen capture throughput ({args.seconds:g}s per measurement, region {args.region}x{args.region})")
+    print(f"{'backend':<12}{'full fps':>12}{'region fps':>12}")
+    for name in names:
+        try:
+            backend = capture.CAPTURE_BACKENDS[name]()
+        except Exception as e:
+            print(f"{name:<12}unavailable: {e}")
+            continue
+        try:
+            full_fps = frames_per_second(backend.grab, args.seconds)
+            region = (0, 0, args.region, args.region)
+            region_fps = frames_per_second(lambda: backend.grab(region), args.seconds)
+            print(f"{name:<12}{full_fps:>12.1f}{region_fps:>12.1f}")
+        except Exception as e:
+            print(f"{name:<12}failed: {e}")
+        finally:
+            backend.close()
+
+
+def legacy_estimate_tokens_for_text(text, chars_per_token=4.0):
+    # Per-character loop HierarchicalMemory used before the cached layer totals
+    ascii_chars = 0
+    non_ascii_tokens = 0
+    for char in str(text):
+        if ord(char) < 128 or char.isspace():
+            ascii_chars += 1
+        else:
+            non_ascii_tokens += 1
+    return max(1, int(ascii_chars / max(1.0, chars_per_token)) + non_ascii_tokens)
+
+
+def synthetic_interactions(steps, seed=0):
+    """Assistant/user pairs shaped like real steps: short reasoning, long execution results, some non-ASCII text."""
+    rng = random.Random(seed)
+    words = ["click", "window", "button", "G-12-07", "L-03-11", "menu", "保存", "文件", "scroll", "typed", "result", "dialog"]
+    for index in range(steps):
+        reasoning = " ".join(rng.choice(words) for _ in range(rng.randint(20, 60)))
+        result = " ".join(rng.choice(words) for _ in range(rng.randint(200, 1200)))
+        yield f"Step {index}: {reasoning}", f"Execution Result: {result}"
+
+
+def bench_memory(args):
+    interactions = list(synthetic_interactions(args.steps))
+    checkpoints = sorted({max(1, args.steps // 10), args.steps // 2, args.steps})
+    print(f"Memory bookkeeping per step over a {args.steps}-step history (no compression, ms per step)")
+    print(f"{'steps':>8}{'per-char rescan':>17}{'cached totals':>15}{'speedup':>10}")
+
+    # The old rescan is quadratic over the run, so it is only timed around each checkpoint
+    history = []
+    legacy_ms = {}
+    for index, (assistant, user) in enumerate(interactions, start=1):
+        started = time.perf_counter()
+        history.append({"role": "assistant", "content": assistant})
+        history.append({"role": "user", "content": user})
+        if any(0 <= checkpoint - index < 10 for checkpoint in checkpoints):
+            sum(legacy_estimate_tokens_for_text(step["role"]) + legacy_estimate_tokens_for_text(step["content"]) for step in history)
+            legacy_ms[index] = (time.perf_counter() - started) * 1000
+
+    with patch.object(memory, "OpenAI"), patch.object(memory, "DEBUG_MODE", False), patch.object(
+        memory, "MEMORY_SHORT_TOKEN_BUDGET", 10**12
+    ):
+        hierarchical = memory.HierarchicalMemory("system prompt", "initial task")
+        cached_ms = {}
+        for index, (assistant, user) in enumerate(interactions, start=1):
+            started = time.perf_counter()
+            hierarchical.add_interaction(assistant, user)
+            cached_ms[index] = (time.perf_counter() - started) * 1000
+
+    for checkpoint in checkpoints:
+        # Mean over the 10 steps up to the checkpoint smooths out timer noise
+        window = range(max(1, checkpoint - 9), checkpoint + 1)
+        before = sum(legacy_ms[step] for step in window) / len(window)
+        after = sum(cached_ms[step] for step in window) / len(window)
+        print(f"{checkpoint:>8}{before:>17.3f}{after:>15.3f}{before / after:>9.0f}x")
+
+
+def history_of_tokens(hierarchical, tokens):
+    steps = []
+    for assistant, user in synthetic_interactions(10**6):
+        steps += [{"role": "assistant", "content": assistant}, {"role": "user", "content": user}]
+        if hierarchical.estimate_tokens_for_steps(steps) >= tokens:
+            return steps
+
+
+def bench_compression(args):
+    from openai import OpenAI
+
+    sizes = [int(size) for size in args.tokens.split(",")]
+    summary = "History Summary: " + " ".join(["clicked G-12-07 and the dialog closed"] * (args.summary_tokens // 8))
+    modes = [
+        ("one request", 10**9, 1),
+        (f"chunks of {args.chunk_tokens}", args.chunk_tokens, args.workers),
+    ]
+    print(
+        f"Short memory compression against a fake endpoint: {args.latency:g} s per request + "
+        f"{args.prefill_ms:g} ms per 1k prompt tokens + {args.decode_ms:g} ms per output token"
+    )
+    print(f"{'history':>9}  {'mode':<18}{'requests':>9}{'largest':>9}{'seconds':>9}")
+    with FakeLLMServer(args.latency, args.prefill_ms, args.decode_ms, reply=summary) as server, patch.object(
+        memory, "OpenAI", lambda **kwargs: OpenAI(base_url=server.url, api_key="benchmark", max_retries=0)
+    ), patch.object(memory, "DEBUG_MODE", False), patch.object(memory, "MEMORY_TOKEN_CALIBRATION_FILE", "off"):
+        hierarchical = memory.HierarchicalMemory("system prompt", "initial task")
+        for size in sizes:
+            steps = history_of_tokens(hierarchical, size)
+            for label, chunk_tokens, workers in modes:
+                server.requests.clear()
+                hierarchical._summary_executor = None
+                with patch.object(memory, "MEMORY_COMPRESSION_CHUNK_TOKENS", chunk_tokens), patch.object(
+                    memory, "MEMORY_COMPRESSION_WORKERS", workers
+                ):
+                    started = time.perf_counter()
+                    hierarchical.compress_memory_tree(
+                        steps, memory.SHORT_MEMORY_COMPRESSION_INSTRUCTIONS, memory.SHORT_MEMORY_MERGE_INSTRUCTIONS
+                    )
+                    seconds = time.perf_counter() - started
+                largest = max(request["prompt_tokens"] for request in server.requests)
+                print(f"{size:>9}  {label:<18}{len(server.requests):>9}{largest:>9}{seconds:>9.2f}")
+
+
+def synthetic_task(rng):
+    verbs = ["open", "export", "rename", "send", "archive", "print", "search", "download", "close", "sort"]
+    objects = ["report", "invoice", "settings", "email", "spreadsheet", "browser tab", "folder", "calendar event"]
+    details = ["as pdf", "to the team", "by date", "in dark mode", "for march", "from the desktop", "with a new name"]
+    return f"{rng.choice(verbs)} the {rng.choice(objects)} {rng.choice(details)} #{rng.randint(1, 50)}"
+
+
+def mean(values):
+    return sum(values) / len(values) if values else float("nan")
+
+
+def bench_trajectories(args):
+    store = TrajectoryStore(args.store)
+    runs = {}
+    for trajectory in store.trajectories:
+        key = " ".join(tokenize(trajectory.get("task", "")))
+        runs.setdefault(key, {"before": [], "after": []})["before" if not trajectory.get("hinted") else "after"].append(trajectory)
+    compared = {key: group for key, group in runs.items() if group["before"] and group["after"]}
+
+    print(f"Recorded runs in {args.store}: {len(store.trajectories)} ({len(compared)} tasks run both without and with hints)")
+    if compared:
+        print(f"{'runs':>10}{'steps':>10}{'llm calls':>12}")
+        for label in ("before", "after"):
+            trajectories = [trajectory for group in compared.values() for trajectory in group[label]]
+            calls = [trajectory["llm_calls"] for trajectory in trajectories if trajectory.get("llm_calls") is not None]
+            print(f"{label:>10}{mean([trajectory['step_count'] for trajectory in trajectories]):>10.1f}{mean(calls):>12.1f}")
+    else:
+        print("Run a task family once with TRAJECTORY_HINTS=0 and again with hints to compare steps and model calls.")
+
+    rng = random.Random(0)
+    synthetic = TrajectoryStore(None)
+    synthetic.trajectories = [
+        {"task": synthetic_task(rng), "actions": [], "final_answer": "", "step_count": rng.randint(3, 40)}
+        for _ in range(args.size)
+    ]
+    started = time.perf_counter()
+    synthetic.similar("warm up the index", 1)
+    build_ms = (time.perf_counter() - started) * 1000
+    query_ms = time_call(lambda: synthetic.similar(synthetic_task(rng), TRAJECTORY_HINTS or 3), args.iterations)
+    print(f"Index over {args.size} synthetic runs: build {build_ms:.1f} ms, lookup {query_ms:.2f} ms per task start")
+
+
+class PipelineVision:
+    """Stand-in perceptor: a fixed synthetic desktop after `capture_ms` of simulated grab time."""
+
+    def __init__(self, size, capture_ms):
+        self.desktop = synthetic_desktop(size)
+        self.local = self.desktop.crop((0, 0, CROP_SIZE, CROP_SIZE))
+        self.capture_ms = capture_ms
+        self.last_capture_files = None
+        self.last_screen_change = None
+
+    def capture_state(self, mouse_x, mouse_y, local_only=False):
+        time.sleep(self.capture_ms / 1000)
+        return CapturedFrame(self.desktop, self.local, {"G-00-00": (0, 0)}, "L-00-00", "G-00-00")
+
+
+class PipelineExecutor:
+    def __init__(self, settle_ms):
+        self.settle_ms = settle_ms
+        self.mouse_x = self.mouse_y = 0
+
+    def get_mouse_position(self):
+        return self.mouse_x, self.mouse_y
+
+    def execute(self, action_dict, coordinate_map=None, log_callback=None):
+        time.sleep(self.settle_ms / 1000)
+        return f"Action {action_dict['action_type']} executed."
+
+
+class PipelineCompletions:
+    def __init__(self, llm_ms):
+        self.llm_ms = llm_ms
+
+    def create(self, **kwargs):
+        time.sleep(self.llm_ms / 1000)
+        tool_call = {"id": "call_click", "type": "function", "function": {"name": "click", "arguments": "{}"}}
+        return {
+            "choices": [{"finish_reason": "tool_calls", "message": {"content": "Clicking the next item.", "tool_calls": [tool_call]}}],
+            "usage": {"prompt_tokens": 3000, "completion_tokens": 20},
+        }
+
+
+def bench_pipeline(args):
+    from scripts import agent as agent_module
+
+    size = RESOLUTIONS[args.resolution]
+    vision = PipelineVision(size, args.capture_ms)
+    executor = PipelineExecutor(args.settle_ms)
+    completions = PipelineCompletions(args.llm_ms)
+    client = type("Client", (), {"chat": type("Chat", (), {"completions": completions})()})()
+    phases = ["capture_seconds", "context_seconds", "llm_seconds", "act_seconds", "bookkeeping_seconds"]
+    print(
+        f"{args.steps} steps at {args.resolution}: {args.capture_ms:g} ms grab, {args.llm_ms:g} ms model, "
+        f"{args.settle_ms:g} ms action, {args.log_ms:g} ms per live log write, {args.summary_ms:g} ms blocking summary; "
+        "real encoding, memory and checkpoint writes"
+    )
+    print(f"{'pipeline':<10}" + "".join(f"{phase.removesuffix('_seconds'):>13}" for phase in phases) + f"{'step':>10}")
+
+    def blocking_summary(self, memory_list, instructions, max_tokens=None):
+        time.sleep(args.summary_ms / 1000)
+        return f"History Summary: {len(memory_list)} steps."
+
+    with ExitStack() as stack:
+        if args.summary_ms > 0:
+            # Every step past the recent interactions is summarized before the step returns,
+            # as with MEMORY_BACKGROUND_COMPRESSION=False or a step over the hard budget
+            stack.enter_context(patch.object(memory, "MEMORY_BACKGROUND_COMPRESSION", False))
+            stack.enter_context(patch.object(memory, "MEMORY_SHORT_TOKEN_BUDGET", 1))
+            stack.enter_context(patch.object(memory.HierarchicalMemory, "compress_memory", blocking_summary))
+        rows = run_pipeline_modes(args, agent_module, vision, executor, client, phases)
+    for pipelined, values, per_step in rows:
+        print(f"{'on' if pipelined else 'off':<10}" + "".join(f"{value * 1000:>10.1f} ms" for value in values) + f"{per_step * 1000:>7.1f} ms")
+
+
+def run_pipeline_modes(args, agent_module, vision, executor, client, phases):
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory, redirect_stdout(StringIO()) as quiet, patch.object(
+        memory, "OpenAI", lambda **kwargs: None
+    ), patch.object(memory, "DEBUG_MODE", False), patch.object(memory, "MEMORY_TOKEN_CALIBRATION_FILE", "off"), patch.object(
+        agent_module, "OpenAI", lambda **kwargs: client
+    ), patch.object(agent_module, "VisionPerceptor", lambda *a, **k: vision), patch.object(
+        agent_module, "ActionExecutor", lambda *a, **k: executor
+    ), patch.object(agent_module, "MAX_STEPS", args.steps + 1):
+        rows = []
+        for pipelined in (False, True):
+            iris = agent_module.IrisAgent("benchmark task", hints="")
+            iris.trajectory_store = None
+            iris.macro_recorder = None
+            iris.checkpoint_path = os.path.join(directory, f"checkpoint_{pipelined}.json")
+            timings = []
+            with patch.object(agent_module, "STEP_PIPELINE", pipelined):
+                started = time.perf_counter()
+                for _ in range(args.steps):
+                    iris.step(log_callback=lambda message: time.sleep(args.log_ms / 1000))
+                    timings.append(iris.last_step_timing)
+                per_step = (time.perf_counter() - started) / args.steps
+            # The first step always captures inline
+            timings = timings[1:]
+            rows.append((pipelined, [mean([timing[phase] for timing in timings]) for phase in phases], per_step))
+            quiet.truncate(0)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline micro-benchmarks for the Iris step pipeline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    overlay = subparsers.add_parser("overlay", help="Grid overlay: per-step drawing as before the cache, uncached render and cached layer.")
+    overlay.add_argument("--resolutions", default="1080p,1440p,4k", help="Comma-separated: 1080p, 1440p, 4k.")
+    overlay.add_argument("--iterations", type=int, default=10, help="Timed iterations per resolution.")
+    overlay.set_defaults(func=bench_overlay)
+
+    global_view = subparsers.add_parser("global-view", help="Global view size, render and encode time with downscaling.")
+    global_view.add_argument("--resolutions", default="1080p,1440p,4k", help="Comma-separated: 1080p, 1440p, 4k.")
+    global_view.add_argument("--max-edge", type=int, default=1920, help="GLOBAL_MAX_EDGE to compare against full size.")
+    global_view.add_argument("--iterations", type=int, default=5, help="Timed iterations per measurement.")
+    global_view.set_defaults(func=bench_global_view)
+
+    encoding = subparsers.add_parser("encoding", help="Encode time and payload size per image encoding profile.")
+    encoding.add_argument("--corpus", default=DEBUG_SCREENSHOT_DIR, help="Directory of saved global_* / local_* debug screenshots.")
+    encoding.add_argument("--profiles", default="png,png:1,webp:lossless,webp:85,jpeg:85", help="Comma-separated encodings; the first is the baseline.")
+    encoding.add_argument("--limit", type=int, default=20, help="Newest screenshots to use per view.")
+    encoding.add_argument("--iterations", type=int, default=3, help="Timed iterations per image and profile.")
+    encoding.set_defaults(func=bench_encoding)
+
+    memory_parser = subparsers.add_parser("memory", help="Per-step token accounting cost over a long synthetic history.")
+    memory_parser.add_argument("--steps", type=int, default=1000, help="Assistant/user interactions in the synthetic history.")
+    memory_parser.set_defaults(func=bench_memory)
+
+    compression = subparsers.add_parser(
+        "compression", help="Single-request vs chunked parallel memory compression against a local fake LLM endpoint."
+    )
+    compression.add_argument("--tokens", default="32000,64000,128000", help="Comma-separated history sizes, in estimated tokens.")
+    compression.add_argument("--chunk-tokens", type=int, default=MEMORY_COMPRESSION_CHUNK_TOKENS, help="MEMORY_COMPRESSION_CHUNK_TOKENS for the chunked run.")
+    compression.add_argument("--workers", type=int, default=MEMORY_COMPRESSION_WORKERS, help="MEMORY_COMPRESSION_WORKERS for the chunked run.")
+    compression.add_argument("--latency", type=float, default=0.3, help="Fixed seconds per request.")
+    compression.add_argument("--prefill-ms", type=float, default=40.0, help="Milliseconds per 1k prompt tokens.")
+    compression.add_argument("--decode-ms", type=float, default=2.0, help="Milliseconds per output token.")
+    compression.add_argument("--summary-tokens", type=int, default=300, help="Approximate length of each summary.")
+    compression.set_defaults(func=bench_compression)
+
+    trajectories = subparsers.add_parser("trajectories", help="Steps and model calls per task without and with trajectory hints, plus index cost.")
+    trajectories.add_argument("--store", default=TRAJECTORY_STORE_FILE, help="Trajectory store JSONL to compare runs from.")
+    trajectories.add_argument("--size", type=int, default=5000, help="Synthetic runs for the index timing.")
+    trajectories.add_argument("--iterations", type=int, default=20, help="Timed lookups.")
+    trajectories.set_defaults(func=bench_trajectories)
+
+    pipeline = subparsers.add_parser("pipeline", help="Per-phase step wall time with STEP_PIPELINE off and on.")
+    pipeline.add_argument("--steps", type=int, default=20, help="Agent steps per mode.")
+    pipeline.add_argument("--resolution", default="1080p", choices=sorted(RESOLUTIONS), help="Synthetic screen size.")
+    pipeline.add_argument("--capture-ms", type=float, default=60.0, help="Simulated screenshot grab time.")
+    pipeline.add_argument("--llm-ms", type=float, default=200.0, help="Simulated model latency.")
+    pipeline.add_argument("--settle-ms", type=float, default=ACTION_SETTLE_SECONDS * 1000, help="Simulated action time.")
+    pipeline.add_argument("--log-ms", type=float, default=0.0, help="Simulated cost of each live log window write.")
+    pipeline.add_argument("--summary-ms", type=float, default=0.0, help="Simulated blocking memory summary per step; 0 keeps memory under budget.")
+    pipeline.set_defaults(func=bench_pipeline)
+
+    capture_parser = subparsers.add_parser(
+        "capture",
+        help="Frames per second for each screenshot backend. Needs a display, e.g. "
+        "xvfb-run -s '-screen 0 1920x1080x24' python -m scripts.benchmark capture",
+    )
+    capture_parser.add_argument("--backends", default="all", help="Comma-separated backend names, or all.")
+    capture_parser.add_argument("--seconds", type=float, default=3.0, help="Measurement time per backend and mode.")
+    capture_parser.add_argument("--region", type=int, default=CROP_SIZE, help="Square region size for region grabs.")
+    capture_parser.set_defaults(func=bench_capture)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    # python -m scripts.benchmark overlay
+    main()
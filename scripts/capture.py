@@ -0,0 +1,167 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+import pyautogui
+
+
+class CaptureBackend:
+    """
+    Screen grabber interface. `grab(region)` returns an RGB PIL image of the whole
+    screen, or of `region` given as (left, top, width, height) in screen pixels.
+    """
+    name = "base"
+
+    def grab(self, region=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PyAutoGUICapture(CaptureBackend):
+    """pyautogui/pyscreeze. Portable, but on Linux it shells out to scrot/gnome-screenshot per frame."""
+    name = "pyautogui"
+
+    def grab(self, region=None):
+        image = pyautogui.screenshot(region=region) if region else pyautogui.screenshot()
+        return image if image.mode == "RGB" else image.convert("RGB")
+
+
+class MSSCapture(CaptureBackend):
+    """Optional `mss` package. Uses XShmGetImage on X11 and native APIs on Windows/macOS."""
+    name = "mss"
+
+    def __init__(self):
+        import mss
+
+        # MSS handles are thread-bound; ScreenCapture creates, uses and closes this backend on its grab thread.
+        self._sct = getattr(mss, "MSS", mss.mss)()
+        # Match pyautogui's full-screen area: the X11 root window on Linux, the primary monitor elsewhere.
+        self._screen = self._sct.monitors[0] if sys.platform.startswith("linux") else self._sct.monitors[1]
+
+    def grab(self, region=None):
+        if region:
+            left, top, width, height = region
+            monitor = {"left": left, "top": top, "width": width, "height": height}
+        else:
+            monitor = self._screen
+        shot = self._sct.grab(monitor)
+        return Image.frombytes("RGB", shot.size, shot.bgra, "raw", "BGRX")
+
+    def close(self):
+        self._sct.close()
+
+
+class XlibCapture(CaptureBackend):
+    """
+    Plain X11 GetImage through python-xlib (already a pyautogui dependency on Linux); no
+    subprocess or temp file. It does not use the MIT-SHM extension, so every frame is
+    copied through the X connection; mss, when installed, uses XShmGetImage and is faster.
+    """
+    name = "x11"
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise RuntimeError("x11 capture is only available on Linux")
+        from Xlib import X, display
+
+        self._zpixmap = X.ZPixmap
+        self._display = display.Display()
+        self._root = self._display.screen().root
+        geometry = self._root.get_geometry()
+        if geometry.depth not in (24, 32):
+            self._display.close()
+            raise RuntimeError(f"x11 capture needs a 24/32-bit display, got depth {geometry.depth}")
+        self._size = (geometry.width, geometry.height)
+
+    def grab(self, region=None):
+        left, top, width, height = region or (0, 0, *self._size)
+        raw = self._root.get_image(left, top, width, height, self._zpixmap, 0xFFFFFFFF)
+        return Image.frombytes("RGB", (width, height), raw.data, "raw", "BGRX")
+
+    def close(self):
+        self._display.close()
+
+
+CAPTURE_BACKENDS = {
+    MSSCapture.name: MSSCapture,
+    XlibCapture.name: XlibCapture,
+    PyAutoGUICapture.name: PyAutoGUICapture,
+}
+# Fastest first; pyautogui stays last as the portable fallback.
+AUTO_CAPTURE_ORDER = ("mss", "x11", "pyautogui")
+
+
+def capture_backend_chain(name):
+    name = (name or "auto").lower()
+    if name == "auto":
+        return list(AUTO_CAPTURE_ORDER)
+    if name not in CAPTURE_BACKENDS:
+        raise ValueError(f"Unknown capture backend {name!r}. Choose one of: auto, {', '.join(CAPTURE_BACKENDS)}.")
+    # An explicit choice only falls back to the slower, more portable backends after it.
+    return list(AUTO_CAPTURE_ORDER[AUTO_CAPTURE_ORDER.index(name):])
+
+
+class ScreenCapture:
+    """
+    Grab frames through the configured backend, falling back down the chain when a
+    backend cannot be created or fails. A failed backend is dropped for the rest of the
+    run, except the last one, whose error is raised so the caller can report it.
+
+    Backends are created, used and closed on one dedicated thread: mss and X11
+    connections are bound to the thread that opened them, while captures come from
+    both the step thread and the prefetch thread.
+    """
+
+    def __init__(self, backend="auto", log=print):
+        self.chain = capture_backend_chain(backend)
+        self.log = log
+        self._backends = {}
+        self._grab_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="iris-grab")
+        self._closed = False
+
+    @property
+    def active_backend(self):
+        return self.chain[0]
+
+    def _backend(self, name):
+        if name not in self._backends:
+            self._backends[name] = CAPTURE_BACKENDS[name]()
+        return self._backends[name]
+
+    def grab(self, region=None):
+        return self._grab_thread.submit(self._grab, region).result()
+
+    def _grab(self, region):
+        while True:
+            name = self.chain[0]
+            try:
+                return self._backend(name).grab(region)
+            except Exception as e:
+                if len(self.chain) == 1:
+                    raise
+                self._drop(name)
+                if self.log:
+                    self.log(f"Warning: {name} screen capture unavailable ({e}). Falling back to {self.chain[0]}.")
+
+    def _drop(self, name):
+        self.chain.remove(name)
+        backend = self._backends.pop(name, None)
+        if backend:
+            try:
+                backend.close()
+            except Exception:
+                pass
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._grab_thread.submit(self._close).result()
+        self._grab_thread.shutdown()
+
+    def _close(self):
+        for backend in self._backends.values():
+            backend.close()
+        self._backends = {}
@@ -0,0 +1,246 @@
+import hashlib
+import inspect
+import json
+import os
+import re
+import threading
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from scripts.config import LLM_CASSETTE_FILE, LLM_CASSETTE_MODE, LLM_CASSETTE_STRICT
+
+
+CASSETTE_VERSION = 1
+DATA_URL = re.compile(r"^data:([^;,]+);base64,(.*)$", re.DOTALL)
+
+
+class CassetteMiss(Exception):
+    """Replay found no recorded response for a request."""
+
+
+def _scrub(value):
+    # Images become hashes: the cassette stays small and identical screenshots still match
+    if isinstance(value, dict):
+        return {key: _scrub(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_scrub(item) for item in value]
+    if isinstance(value, str):
+        match = DATA_URL.match(value)
+        if match:
+            return f"data:{match.group(1)};sha256,{hashlib.sha256(match.group(2).encode('ascii')).hexdigest()}"
+    return value
+
+
+def scrub_request(kwargs):
+    """The request as stored in a cassette: JSON-safe, with base64 images replaced by their SHA-256."""
+    return json.loads(json.dumps(_scrub(kwargs), sort_keys=True, default=str))
+
+
+def request_fingerprint(request):
+    # ASCII escapes keep text with lone surrogates (e.g. a truncated emoji in OCR text) encodable
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode("ascii")).hexdigest()
+
+
+def _request_shape(request):
+    return request.get("model"), bool(request.get("tools")), bool(request.get("stream"))
+
+
+def _dump(response):
+    if hasattr(response, "model_dump"):
+        return "sdk", response.model_dump(mode="json")
+    return "dict", json.loads(json.dumps(response, default=str))
+
+
+def _load(kind, data, model):
+    return model.model_validate(data) if kind == "sdk" else data
+
+
+class Cassette:
+    """
+    Recorded model requests and responses in a JSONL file, one exchange per line.
+
+    In "record" mode every exchange is appended as it completes. In "replay" mode the
+    file is loaded once and each request is answered from it without any network: by
+    the fingerprint of the scrubbed request, in recorded order when the same request
+    was made more than once. Without `strict`, a request that was never recorded
+    (different screenshots, for example) gets the next unplayed exchange with the same
+    model, tools and streaming, so a run can be replayed on a changed screen.
+
+    The trajectory hints an agent started with are part of its fixed prefix, so they
+    are recorded too (a "hints" line per agent) and replayed in place of whatever the
+    trajectory store would suggest now.
+    """
+
+    def __init__(self, path, mode, strict=True):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.strict = strict
+        self.entries = []
+        self.hints = []
+        self.played = set()
+        self.misses = 0
+        self._lock = threading.Lock()
+        if mode == "replay":
+            with open(path, "r", encoding="utf-8") as f:
+                lines = [json.loads(line) for line in f if line.strip()]
+            versions = {entry.get("version") for entry in lines}
+            if versions - {CASSETTE_VERSION}:
+                raise ValueError(f"Unsupported cassette version in {path}: {sorted(versions, key=str)}")
+            self.hints = [entry for entry in lines if "hints" in entry]
+            self.entries = [entry for entry in lines if "fingerprint" in entry]
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def record(self, request, kind, response=None, chunks=None):
+        entry = {
+            "version": CASSETTE_VERSION,
+            "fingerprint": request_fingerprint(request),
+            "request": request,
+            "kind": kind,
+        }
+        if chunks is not None:
+            entry["chunks"] = chunks
+        else:
+            entry["response"] = response
+        with self._lock:
+            self.entries.append(entry)
+            self._append(entry)
+
+    def _append(self, entry):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def task_hints(self, task, hints, runs):
+        """
+        The hints (and hinted run count) an agent for `task` starts with: recorded as given,
+        or replayed from the recording, agent by agent. A task recorded without hints keeps
+        the given ones.
+        """
+        with self._lock:
+            if self.mode == "record":
+                entry = {"version": CASSETTE_VERSION, "task": task, "hints": hints, "runs": runs}
+                self.hints.append(entry)
+                self._append(entry)
+                return hints, runs
+            for position, entry in enumerate(self.hints):
+                if entry["task"] == task:
+                    del self.hints[position]
+                    return entry["hints"], entry.get("runs", 0)
+            return hints, runs
+
+    def lookup(self, request):
+        fingerprint = request_fingerprint(request)
+        with self._lock:
+            candidates = [index for index, entry in enumerate(self.entries) if index not in self.played]
+            match = next((index for index in candidates if self.entries[index]["fingerprint"] == fingerprint), None)
+            if match is None and not self.strict:
+                shape = _request_shape(request)
+                match = next((index for index in candidates if _request_shape(self.entries[index]["request"]) == shape), None)
+            if match is None:
+                self.misses += 1
+                raise CassetteMiss(f"no recorded response for request {fingerprint[:12]} in {self.path}")
+            self.played.add(match)
+            return self.entries[match]
+
+    def replay(self, request):
+        entry = self.lookup(request)
+        if "chunks" in entry:
+            return [_load(entry["kind"], chunk, ChatCompletionChunk) for chunk in entry["chunks"]]
+        return _load(entry["kind"], entry["response"], ChatCompletion)
+
+
+class CassetteClient:
+    """`chat.completions.create` that records through, or replays from, a cassette; async when the wrapped client is."""
+
+    def __init__(self, client, cassette):
+        self.client = client
+        self.cassette = cassette
+        create = client.chat.completions.create
+        self.is_async = inspect.iscoroutinefunction(create)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_async if self.is_async else self._create))
+
+    def _create(self, **kwargs):
+        request = scrub_request(kwargs)
+        if self.cassette.mode == "replay":
+            response = self.cassette.replay(request)
+            return iter(response) if kwargs.get("stream") else response
+        response = self.client.chat.completions.create(**kwargs)
+        if kwargs.get("stream"):
+            return self._record_stream(request, response)
+        self.cassette.record(request, *_dump(response))
+        return response
+
+    def _record_stream(self, request, stream):
+        chunks = []
+        kind = "dict"
+        for chunk in stream:
+            kind, data = _dump(chunk)
+            chunks.append(data)
+            yield chunk
+        self.cassette.record(request, kind, chunks=chunks)
+
+    async def _create_async(self, **kwargs):
+        request = scrub_request(kwargs)
+        if self.cassette.mode == "replay":
+            response = self.cassette.replay(request)
+            return self._replay_stream_async(response) if kwargs.get("stream") else response
+        response = await self.client.chat.completions.create(**kwargs)
+        if kwargs.get("stream"):
+            return self._record_stream_async(request, response)
+        self.cassette.record(request, *_dump(response))
+        return response
+
+    async def _replay_stream_async(self, chunks):
+        for chunk in chunks:
+            yield chunk
+
+    async def _record_stream_async(self, request, stream):
+        chunks = []
+        kind = "dict"
+        async for chunk in stream:
+            kind, data = _dump(chunk)
+            chunks.append(data)
+            yield chunk
+        self.cassette.record(request, kind, chunks=chunks)
+
+    def close(self):
+        close = getattr(self.client, "close", None)
+        return close() if close else None
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette():
+    """The process-wide cassette from LLM_CASSETTE_MODE / LLM_CASSETTE_FILE, or None when off."""
+    global _cassette
+    if LLM_CASSETTE_MODE == "off":
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette(LLM_CASSETTE_FILE, LLM_CASSETTE_MODE, strict=LLM_CASSETTE_STRICT)
+        return _cassette
+
+
+def wrap_client(client):
+    """Route a client's chat completions through the cassette when one is configured."""
+    cassette = get_cassette()
+    return CassetteClient(client, cassette) if cassette else client
+
+
+if __name__ == "__main__":
+    # python -m scripts.cassette <cassette.jsonl>
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else LLM_CASSETTE_FILE
+    cassette = Cassette(path, "replay")
+    fingerprints = {entry["fingerprint"] for entry in cassette.entries}
+    streamed = sum(1 for entry in cassette.entries if "chunks" in entry)
+    print(f"{path}: {len(cassette.entries)} exchanges, {len(fingerprints)} distinct requests, {streamed} streamed, {len(cassette.hints)} agents")
+    for entry in cassette.entries[:20]:
+        request = entry["request"]
+        print(f"  {entry['fingerprint'][:12]}  {request.get('model')}  {len(request.get('messages', []))} messages{'  tools' if request.get('tools') else ''}")
@@ -0,0 +1,55 @@
+import json
+import os
+from datetime import datetime
+
+from scripts.config import CHECKPOINT_DIR
+
+
+CHECKPOINT_VERSION = 1
+
+
+def checkpoints_enabled():
+    return CHECKPOINT_DIR.lower() not in {"", "off", "none"}
+
+
+def new_checkpoint_path():
+    """A fresh `<CHECKPOINT_DIR>/<timestamp>.json` path, or None when checkpoints are off."""
+    if not checkpoints_enabled():
+        return None
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(CHECKPOINT_DIR, f"{timestamp}.json")
+
+
+def save_checkpoint(path, state):
+    """
+    Write state as JSON next to path and rename it into place, so a crash mid-write
+    leaves the previous checkpoint intact.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    data = {"version": CHECKPOINT_VERSION, "saved_at": datetime.now().isoformat(timespec="seconds"), **state}
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def load_checkpoint(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    version = data.get("version")
+    if version != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {version!r} in {path}")
+    return data
+
+
+if __name__ == "__main__":
+    # python -m scripts.checkpoint <checkpoint.json>
+    import sys
+
+    checkpoint = load_checkpoint(sys.argv[1])
+    print(f"Task: {checkpoint['task']}")
+    print(f"Steps completed: {checkpoint['step_count']}")
+    print(f"Completed: {checkpoint.get('completed', False)}")
+    print(f"Saved at: {checkpoint['saved_at']}")
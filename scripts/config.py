@@ -30,6 +30,24 @@ LLM_API_KEY = os.getenv("LLM_API_KEY")
 LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME")
 LLM_TIMEOUT_SECONDS = _get_float("LLM_TIMEOUT_SECONDS", 0.0)  # 0 disables explicit timeout
 LLM_MAX_RETRIES = _get_int("LLM_MAX_RETRIES", 1)
+LLM_PROMPT_CACHE_KEY = os.getenv("LLM_PROMPT_CACHE_KEY", "")  # Sent as prompt_cache_key to route a task's requests to one prefix cache; "auto" derives it from the task
+LLM_STREAM_TOOL_CALLS = _get_bool("LLM_STREAM_TOOL_CALLS", False)  # Stream responses and run each tool call as soon as its arguments are complete
+AGENT_STOP_TIMEOUT_SECONDS = _get_float("AGENT_STOP_TIMEOUT_SECONDS", 5.0)  # Triple ESC: time to cancel the model request and flush memory, checkpoint and logs
+LLM_DEADLINE_SECONDS = _get_float("LLM_DEADLINE_SECONDS", 0.0)  # Whole model call including retries, hedges and the stream; 0 disables
+LLM_RETRY_BASE_SECONDS = _get_float("LLM_RETRY_BASE_SECONDS", 1.0)  # First retry backoff, doubled per retry with full jitter
+LLM_RETRY_MAX_SECONDS = _get_float("LLM_RETRY_MAX_SECONDS", 30.0)  # Longest wait between retries, also caps Retry-After
+LLM_HEDGE_PERCENTILE = _get_float("LLM_HEDGE_PERCENTILE", 90.0)  # Duplicate a request still running after this latency percentile; 0 disables
+LLM_HEDGE_MIN_SAMPLES = _get_int("LLM_HEDGE_MIN_SAMPLES", 10)  # Latencies to observe before hedging
+LLM_FALLBACK_MODEL_NAME = os.getenv("LLM_FALLBACK_MODEL_NAME", "")  # Model used after repeated timeouts; empty keeps the model
+LLM_FALLBACK_API_ENDPOINT = os.getenv("LLM_FALLBACK_API_ENDPOINT", "")  # Endpoint for the fallback; empty keeps the endpoint
+LLM_FALLBACK_API_KEY = os.getenv("LLM_FALLBACK_API_KEY", "")
+LLM_FALLBACK_AFTER_TIMEOUTS = _get_int("LLM_FALLBACK_AFTER_TIMEOUTS", 2)  # Consecutive timeouts before switching to the fallback
+LLM_FALLBACK_SECONDS = _get_float("LLM_FALLBACK_SECONDS", 300.0)  # How long to stay on the fallback before trying the primary again
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off").lower()  # off, record (save every model exchange) or replay (answer from the file, no network)
+LLM_CASSETTE_FILE = os.getenv(
+    "LLM_CASSETTE_FILE", os.path.join(os.path.dirname(__file__), "cassettes", "cassette.jsonl")
+)
+LLM_CASSETTE_STRICT = _get_bool("LLM_CASSETTE_STRICT", True)  # Replay: only exact request matches; False falls back to the next recorded exchange
 
 # ===========================
 # Vision Parameters
@@ -37,17 +55,42 @@ LLM_MAX_RETRIES = _get_int("LLM_MAX_RETRIES", 1)
 GRID_STEP = _get_int("GRID_STEP", 100)                    # Global grid line spacing, in pixels
 LOCAL_GRID_STEP = _get_int("LOCAL_GRID_STEP", 20)         # Local fine grid line spacing
 CROP_SIZE = _get_int("CROP_SIZE", 400)                    # Local screenshot width/height, in pixels
+GLOBAL_MAX_EDGE = _get_int("GLOBAL_MAX_EDGE", 0)          # Downscale the Global View screenshot to this longest edge; 0 keeps full size
+CAPTURE_BACKEND = os.getenv("CAPTURE_BACKEND", "auto")    # auto, mss, x11 or pyautogui
 GRID_COLOR = os.getenv("GRID_COLOR", "red")               # Grid marker color
 GRID_WIDTH = _get_int("GRID_WIDTH", 1)                    # Grid marker line width
 MOUSE_COLOR = os.getenv("MOUSE_COLOR", "white")           # Mouse marker color
 MOUSE_WIDTH = _get_int("MOUSE_WIDTH", 4)                  # Mouse marker line width
+CHANGE_BLOCK_SIZE = _get_int("CHANGE_BLOCK_SIZE", 16)     # Screen change fingerprint block size, in pixels
+CHANGE_THRESHOLD = _get_int("CHANGE_THRESHOLD", 12)       # Mean brightness delta that marks a block as changed
+LOCAL_ONLY_AFTER_LOCAL_MOVE = _get_bool("LOCAL_ONLY_AFTER_LOCAL_MOVE", True)  # Capture only the Local View after fine L moves
+LOCAL_ONLY_MAX_CONSECUTIVE = _get_int("LOCAL_ONLY_MAX_CONSECUTIVE", 2)        # Force a Global View after this many local-only steps
+GLOBAL_IMAGE_ENCODING = os.getenv("GLOBAL_IMAGE_ENCODING", "png")  # Upload encoding for the Global View: png[:level], jpeg[:quality], webp[:quality|lossless]
+LOCAL_IMAGE_ENCODING = os.getenv("LOCAL_IMAGE_ENCODING", "png")    # Upload encoding for the Local View
 
 # ===========================
 # Runtime Parameters
 # ===========================
 MAX_STEPS = _get_int("MAX_STEPS", 100)                    # Max steps per task to prevent infinite loops
 DEBUG_MODE = _get_bool("DEBUG_MODE", False)               # Whether to save screenshots locally
+DEBUG_WRITER_QUEUE_SIZE = _get_int("DEBUG_WRITER_QUEUE_SIZE", 256)        # Pending debug writes before the agent waits for the disk
+DEBUG_WRITER_FLUSH_SECONDS = _get_float("DEBUG_WRITER_FLUSH_SECONDS", 1.0) # How often the open debug log is flushed
+OVERLAY_HIDE_TIMEOUT_SECONDS = _get_float("OVERLAY_HIDE_TIMEOUT_SECONDS", 0.5)  # Max wait for the log window to unmap before a screenshot/action
+OVERLAY_HIDE_SETTLE_SECONDS = _get_float("OVERLAY_HIDE_SETTLE_SECONDS", 0.05)   # Extra pause after the unmap, for compositor fade-out
+OVERLAY_CAPTURE_MODE = os.getenv("OVERLAY_CAPTURE_MODE", "hide").lower()       # hide: hide the log window for captures; mask: keep it visible and mask it out
+OVERLAY_MASK_REFRESH_STEPS = _get_int("OVERLAY_MASK_REFRESH_STEPS", 10)       # In mask mode, hide once after this many masked captures to refresh what is under the window
+CHECKPOINT_DIR = os.getenv(                                # Run state saved after every step, for main.py --resume; "off" disables
+    "CHECKPOINT_DIR", os.path.join(os.path.dirname(__file__), "checkpoints")
+)
+TRAJECTORY_STORE_FILE = os.getenv(                         # Completed runs, searched for hints at the start of similar tasks; "off" disables
+    "TRAJECTORY_STORE_FILE", os.path.join(os.path.dirname(__file__), "trajectories", "trajectories.jsonl")
+)
+TRAJECTORY_HINTS = _get_int("TRAJECTORY_HINTS", 3)        # Most similar past runs summarized into the prompt; 0 disables hints
+MACRO_DIR = os.getenv("MACRO_DIR", "off")                  # Record each run's executed actions here, replayable with main.py --replay; "off" (default) disables
+MACRO_VERIFY_SIZE = _get_int("MACRO_VERIFY_SIZE", 64)      # Side of the region under the pointer compared before a replayed click, in pixels
+MACRO_MATCH_THRESHOLD = _get_int("MACRO_MATCH_THRESHOLD", 12)  # Mean brightness delta above which a replayed click is refused
 ACTION_SETTLE_SECONDS = _get_float("ACTION_SETTLE_SECONDS", 0.2)
+STEP_PIPELINE = _get_bool("STEP_PIPELINE", False)  # Capture the next screenshot while the finished step is logged and saved; pays off with blocking memory summaries
 TYPE_INTERVAL_SECONDS = _get_float("TYPE_INTERVAL_SECONDS", 0.01)
 CLIPBOARD_TEXT_THRESHOLD = _get_int("CLIPBOARD_TEXT_THRESHOLD", 30)
 SCROLL_LINE_CLICKS = _get_int("SCROLL_LINE_CLICKS", 100)
@@ -60,7 +103,19 @@ SCROLL_PAGE_CLICKS = _get_int("SCROLL_PAGE_CLICKS", 400)
 MEMORY_SHORT_TOKEN_BUDGET = _get_int("MEMORY_SHORT_TOKEN_BUDGET", 128000)
 MEMORY_LONG_TOKEN_BUDGET = _get_int("MEMORY_LONG_TOKEN_BUDGET", 128000)
 MEMORY_RECENT_INTERACTIONS_TO_KEEP = _get_int("MEMORY_RECENT_INTERACTIONS_TO_KEEP", 3)
-MEMORY_CHARS_PER_TOKEN = _get_float("MEMORY_CHARS_PER_TOKEN", 4.0)
+MEMORY_BACKGROUND_COMPRESSION = _get_bool("MEMORY_BACKGROUND_COMPRESSION", True)  # Summarize memory on a worker thread instead of inside the step
+MEMORY_COMPRESSION_SOFT_RATIO = _get_float("MEMORY_COMPRESSION_SOFT_RATIO", 0.75)  # Start compressing at this fraction of a budget; only the full budget blocks
+MEMORY_COMPRESSION_CHUNK_TOKENS = _get_int("MEMORY_COMPRESSION_CHUNK_TOKENS", 16000)  # Largest history slice per summarization request; longer histories are summarized in chunks and merged
+MEMORY_COMPRESSION_WORKERS = _get_int("MEMORY_COMPRESSION_WORKERS", 4)  # Chunk summaries requested concurrently
+MEMORY_COMPRESSION_RETRY_SECONDS = _get_float("MEMORY_COMPRESSION_RETRY_SECONDS", 10.0)  # Wait after a failed summary, doubled per consecutive failure
+MEMORY_COMPRESSION_RETRY_MAX_SECONDS = _get_float("MEMORY_COMPRESSION_RETRY_MAX_SECONDS", 600.0)  # Longest wait between summary attempts
+MEMORY_CONTEXT_LAYOUT = os.getenv("MEMORY_CONTEXT_LAYOUT", "cache").strip().lower()  # "cache": task before history; "task_last": task moved next to each query
+MEMORY_CHARS_PER_TOKEN = _get_float("MEMORY_CHARS_PER_TOKEN", 4.0)    # Starting chars-per-token, refined from API usage
+MEMORY_IMAGE_TOKENS = _get_int("MEMORY_IMAGE_TOKENS", 1000)            # Starting tokens per screenshot, refined from API usage
+MEMORY_TOKEN_CALIBRATION_FILE = os.getenv(                             # Learned token rates kept across runs; "off" disables saving
+    "MEMORY_TOKEN_CALIBRATION_FILE", os.path.join(os.path.dirname(__file__), "cache", "token_calibration.json")
+)
+MEMORY_TOKEN_CALIBRATION_SAVE_SECONDS = _get_float("MEMORY_TOKEN_CALIBRATION_SAVE_SECONDS", 60.0)  # Shortest time between calibration file writes; the rest is saved when the run ends
 
 
 _WARNED_INVALID_TLS_ENV_VARS = set()
@@ -0,0 +1,142 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+from scripts.config import DEBUG_WRITER_FLUSH_SECONDS, DEBUG_WRITER_QUEUE_SIZE
+
+
+_STOP = object()
+
+
+class DebugWriter:
+    """
+    Background thread for DEBUG_MODE artifacts: screenshot files and JSONL log lines.
+
+    Log files stay open for the whole run and are flushed every `flush_interval`
+    seconds, on flush() and on close(). The queue is bounded; when it is full the
+    caller waits for space, so artifacts are never dropped. After close(), writes
+    happen synchronously on the caller's thread.
+    """
+
+    def __init__(self, max_queue=DEBUG_WRITER_QUEUE_SIZE, flush_interval=DEBUG_WRITER_FLUSH_SECONDS, log=print):
+        self.flush_interval = max(0.05, flush_interval)
+        self.log = log
+        self._queue = queue.Queue(maxsize=max(1, max_queue))
+        self._handles = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="iris-debug-writer", daemon=True)
+        self._thread.start()
+
+    def write_file(self, path, produce):
+        """Write `produce()` bytes to path. produce runs on the writer thread, so encoding is off the step path too."""
+        self._submit(("file", path, produce))
+
+    def append_line(self, path, line):
+        """Append one text line (without the trailing newline) to path."""
+        self._submit(("line", path, line))
+
+    def flush(self):
+        """Block until everything queued so far is on disk."""
+        self._submit(("flush",))
+        if not self._closed:
+            self._queue.join()
+
+    def close(self, timeout=None):
+        """Drain the queue, close the log files and stop the thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _submit(self, task):
+        with self._lock:
+            if not self._closed:
+                self._queue.put(task)
+                return
+        self._write(task, keep_open=False)
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                task = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._flush_handles()
+                last_flush = time.monotonic()
+                continue
+            if task is _STOP:
+                self._queue.task_done()
+                break
+            self._write(task, keep_open=True)
+            self._queue.task_done()
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self._flush_handles()
+                last_flush = time.monotonic()
+        self._close_handles()
+
+    def _write(self, task, keep_open):
+        kind = task[0]
+        try:
+            if kind == "flush":
+                self._flush_handles()
+            elif kind == "file":
+                _, path, produce = task
+                with open(path, "wb") as f:
+                    f.write(produce())
+            elif kind == "line":
+                _, path, line = task
+                if keep_open:
+                    handle = self._handles.get(path)
+                    if handle is None:
+                        handle = self._handles[path] = open(path, "a", encoding="utf-8")
+                    handle.write(line + "\n")
+                else:
+                    with open(path, "a", encoding="utf-8") as f:
+                        f.write(line + "\n")
+        except Exception as e:
+            if self.log:
+                target = os.path.basename(task[1]) if kind != "flush" else "debug logs"
+                self.log(f"Failed to write {target}: {e}")
+
+    def _flush_handles(self):
+        for handle in self._handles.values():
+            try:
+                handle.flush()
+            except Exception as e:
+                if self.log:
+                    self.log(f"Failed to flush debug log: {e}")
+
+    def _close_handles(self):
+        for handle in self._handles.values():
+            try:
+                handle.close()
+            except Exception:
+                pass
+        self._handles = {}
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_debug_writer():
+    """The shared writer, started on first use and drained at interpreter exit."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = DebugWriter()
+            atexit.register(_writer.close)
+        return _writer
+
+
+def close_debug_writer(timeout=5.0):
+    """Drain pending artifacts. Call before os._exit(), which skips atexit handlers."""
+    with _writer_lock:
+        writer = _writer
+    if writer is not None:
+        writer.close(timeout)
@@ -0,0 +1,78 @@
+import re
+
+from scripts.trajectories import compress_actions
+
+
+# Feedback worth keeping without a model: failures, missed clicks, user answers and completion
+KEEP_LINE = re.compile(r"error|fail|no visible change|user response|\[task completed\]|replay stopped", re.IGNORECASE)
+SUMMARY_PREFIXES = ("History Summary", "Long Term Memory")
+EXTRACT_TITLE = "(extracted locally, no model summary):"
+MAX_STATE_CHARS = 600
+
+
+def _extract_lines(step):
+    content = str(step.get("content", "")).strip()
+    if content.startswith(SUMMARY_PREFIXES):
+        first, _, rest = content.partition("\n")
+        if first.endswith(EXTRACT_TITLE):
+            # An earlier extract: its lines carry over, its stale markers do not
+            return [line for line in rest.splitlines() if not line.startswith(("... ", "Last state:"))], None
+        # Model summaries are already dense; keep them whole
+        return [" ".join(content.split())], None
+    lines = []
+    note = []
+    tool = None
+    for line in content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("Tool call:"):
+            tool = line[len("Tool call:"):].strip()
+        elif line.startswith("Arguments:") and tool is not None:
+            lines.append(f"{tool} {line[len('Arguments:'):].strip()}")
+            tool = None
+        else:
+            line = line.removeprefix("Execution Result:").strip()
+            if KEEP_LINE.search(line):
+                lines.append(line)
+            note.append(line)
+    return lines, " ".join(note)
+
+
+def extractive_summary(steps, max_tokens, estimate_tokens, header="History Summary"):
+    """
+    Summarize memory steps without a model. Keeps tool calls with their arguments,
+    errors, user answers, completion notes and earlier summaries, collapses repeats
+    to "xN", and ends with the last assistant note and result as the final state.
+    The oldest lines are dropped until the text fits max_tokens.
+    """
+    lines = []
+    last_notes = {}
+    for step in steps:
+        step_lines, note = _extract_lines(step)
+        lines.extend(step_lines)
+        if note:
+            last_notes[step.get("role", "")] = note
+    lines = compress_actions(lines)
+    title = f"{header} {EXTRACT_TITLE}"
+    state = " -> ".join(last_notes[role] for role in ("assistant", "user") if role in last_notes)[:MAX_STATE_CHARS]
+    # The final state may use up to a third of the budget
+    while state and estimate_tokens(f"Last state: {state}") > max_tokens // 3:
+        state = state[: int(len(state) * 0.8)]
+    tail = [f"Last state: {state}"] if state else []
+
+    kept = []
+    budget = max_tokens - estimate_tokens("\n".join([title, *tail])) - 10
+    for line in reversed(lines):
+        cost = estimate_tokens(line) + 1
+        if cost > budget:
+            break
+        kept.append(line)
+        budget -= cost
+    kept.reverse()
+    omitted = len(lines) - len(kept)
+    body = ([f"... {omitted} earlier entries omitted"] if omitted else []) + kept + tail
+    text = "\n".join([title, *body])
+    while estimate_tokens(text) > max_tokens and len(text) > len(title):
+        text = text[: max(len(title), int(len(text) * 0.9))]
+    return text
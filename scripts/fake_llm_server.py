@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeLLMServer:
+    """
+    Local OpenAI-compatible /v1/chat/completions endpoint for offline benchmarks.
+
+    Every request sleeps for latency + prefill per 1k prompt tokens + decode per
+    completion token, then answers with `reply` (a string, or a callable taking the
+    request body). Prompt tokens are estimated at four characters per token. Each
+    handled request is kept in `requests` with its model, prompt tokens and timing.
+
+    To inject a long tail or failures, `latency` may be a callable taking the request
+    index, and `fault` a callable taking the index and body that returns None or a
+    (status, headers) error to answer with after the same delay.
+    """
+
+    def __init__(self, latency=0.3, prefill_ms_per_1k=40.0, decode_ms_per_token=2.0, reply="OK", completion_tokens=None, fault=None):
+        self.latency = latency
+        self.fault = fault
+        self.received = 0
+        self.prefill_ms_per_1k = prefill_ms_per_1k
+        self.decode_ms_per_token = decode_ms_per_token
+        self.reply = reply
+        self.completion_tokens = completion_tokens
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    @staticmethod
+    def prompt_tokens(body):
+        text = []
+        for message in body.get("messages", []):
+            content = message.get("content")
+            text.append(content if isinstance(content, str) else json.dumps(content))
+        return sum(len(part or "") for part in text) // 4
+
+    def respond(self, body):
+        """The response body for one request, or an (status, headers) error tuple from `fault`."""
+        with self._lock:
+            index = self.received
+            self.received += 1
+        prompt_tokens = self.prompt_tokens(body)
+        content = self.reply(body) if callable(self.reply) else self.reply
+        completion_tokens = self.completion_tokens or max(1, len(content) // 4)
+        latency = self.latency(index) if callable(self.latency) else self.latency
+        error = self.fault(index, body) if self.fault else None
+        started = time.perf_counter()
+        time.sleep(latency + self.prefill_ms_per_1k * prompt_tokens / 1e6 + self.decode_ms_per_token * completion_tokens / 1e3)
+        with self._lock:
+            self.requests.append(
+                {
+                    "index": index,
+                    "model": body.get("model"),
+                    "prompt_tokens": prompt_tokens,
+                    "started": started,
+                    "finished": time.perf_counter(),
+                    "status": error[0] if error else 200,
+                }
+            )
+        if error:
+            return error
+        return {
+            "id": f"chatcmpl-fake-{len(self.requests)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model") or "fake-model",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                response = fake.respond(body)
+                status, headers = 200, {}
+                if isinstance(response, tuple):
+                    status, headers = response
+                    response = {"error": {"message": f"injected {status}", "type": "fake_error", "code": status}}
+                payload = json.dumps(response).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    for name, value in headers.items():
+                        self.send_header(name, str(value))
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on this request, e.g. a cancelled hedge
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+if __name__ == "__main__":
+    # python -m scripts.fake_llm_server
+    from openai import OpenAI
+
+    with FakeLLMServer(latency=0.1) as server:
+        client = OpenAI(base_url=server.url, api_key="fake")
+        response = client.chat.completions.create(model="fake-model", messages=[{"role": "user", "content": "ping"}])
+        print(f"{server.url}: {response.choices[0].message.content!r}, usage {response.usage.prompt_tokens}/{response.usage.completion_tokens}")
@@ -0,0 +1,59 @@
+import base64
+import threading
+from dataclasses import dataclass, field
+
+
+VIEWS = ("global", "local")
+
+
+@dataclass(frozen=True)
+class CapturedFrame:
+    """
+    One capture_state result: the annotated views, the coordinate map and the mouse grid IDs.
+    Encoded bytes are cached per (view, encoding), so the debug archive and the model
+    request share a single encode of each view. global_image is None for local-only steps.
+    """
+    global_image: object
+    local_image: object
+    coordinate_map: object
+    mouse_grid_id: str
+    nearest_global_grid_id: str
+    _encoded: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+    _locks: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+    _locks_guard: object = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    @property
+    def local_only(self):
+        return self.global_image is None
+
+    def images(self):
+        return self.global_image, self.local_image
+
+    def image(self, view):
+        if view not in VIEWS:
+            raise KeyError(view)
+        return self.global_image if view == "global" else self.local_image
+
+    def _cached(self, key, build):
+        # One lock per entry: concurrent callers wait for the first encode instead of repeating it.
+        with self._locks_guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._encoded:
+                self._encoded[key] = build()
+            return self._encoded[key]
+
+    def encoded(self, view, encoding):
+        image = self.image(view)
+        if image is None:
+            raise ValueError(f"{view} view was not captured in this frame")
+        return self._cached((view, encoding), lambda: encoding.encode(image))
+
+    def encoded_base64(self, view, encoding):
+        return self._cached(
+            (view, encoding, "base64"),
+            lambda: base64.b64encode(self.encoded(view, encoding)).decode("utf-8"),
+        )
+
+    def filename(self, view, encoding, timestamp):
+        return f"{view}_{timestamp}.{encoding.extension}"
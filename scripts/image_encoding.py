@@ -0,0 +1,99 @@
+import base64
+from dataclasses import dataclass
+from functools import lru_cache
+from io import BytesIO
+
+from PIL import Image
+
+from scripts.config import GLOBAL_IMAGE_ENCODING, LOCAL_IMAGE_ENCODING
+
+
+# format: (Pillow format, MIME type, file extension)
+IMAGE_FORMATS = {
+    "png": ("PNG", "image/png", "png"),
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+    "webp": ("WEBP", "image/webp", "webp"),
+}
+FORMAT_ALIASES = {"jpg": "jpeg"}
+
+
+@dataclass(frozen=True)
+class ImageEncoding:
+    """
+    How a view is encoded for upload. `option` is the PNG compress_level (0-9), the
+    JPEG/WebP quality (1-100), or None for Pillow's default; WebP may be lossless.
+    """
+    format: str = "png"
+    option: int = None
+    lossless: bool = False
+
+    @property
+    def mime_type(self):
+        return IMAGE_FORMATS[self.format][1]
+
+    @property
+    def extension(self):
+        return IMAGE_FORMATS[self.format][2]
+
+    def save_kwargs(self):
+        if self.format == "png":
+            return {} if self.option is None else {"compress_level": self.option}
+        if self.format == "webp" and self.lossless:
+            return {"lossless": True}
+        return {} if self.option is None else {"quality": self.option}
+
+    def encode(self, image):
+        if self.format == "jpeg" and image.mode != "RGB":
+            image = image.convert("RGB")
+        buffered = BytesIO()
+        image.save(buffered, format=IMAGE_FORMATS[self.format][0], **self.save_kwargs())
+        return buffered.getvalue()
+
+    def encode_base64(self, image):
+        return base64.b64encode(self.encode(image)).decode("utf-8")
+
+    def __str__(self):
+        if self.lossless:
+            return f"{self.format}:lossless"
+        return self.format if self.option is None else f"{self.format}:{self.option}"
+
+
+def parse_image_encoding(spec):
+    """
+    Parse `png`, `png:1`, `jpeg:85`, `webp:80` or `webp:lossless` into an ImageEncoding.
+    Raises ValueError for unknown formats, out-of-range options, or a format this Pillow build cannot write.
+    """
+    name, _, option = (spec or "png").strip().lower().partition(":")
+    name = FORMAT_ALIASES.get(name, name)
+    if name not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image encoding {spec!r}. Use png[:0-9], jpeg[:1-100] or webp[:1-100|lossless].")
+    Image.init()
+    if IMAGE_FORMATS[name][0] not in Image.SAVE:
+        raise ValueError(f"This Pillow build cannot write {name} images; choose another image encoding.")
+
+    if not option:
+        return ImageEncoding(name)
+    if name == "webp" and option == "lossless":
+        return ImageEncoding(name, lossless=True)
+    try:
+        value = int(option)
+    except ValueError:
+        raise ValueError(f"Invalid option in image encoding {spec!r}.") from None
+    low, high = (0, 9) if name == "png" else (1, 100)
+    if not low <= value <= high:
+        raise ValueError(f"Image encoding {spec!r}: {name} option must be between {low} and {high}.")
+    return ImageEncoding(name, value)
+
+
+@lru_cache(maxsize=None)
+def configured_view_encodings():
+    """(global, local) encodings from GLOBAL_IMAGE_ENCODING and LOCAL_IMAGE_ENCODING, parsed once."""
+    return parse_image_encoding(GLOBAL_IMAGE_ENCODING), parse_image_encoding(LOCAL_IMAGE_ENCODING)
+
+
+if __name__ == "__main__":
+    # python -m scripts.image_encoding
+    sample = Image.effect_noise((256, 256), 32).convert("RGB")
+    for spec in ("png", "png:1", "jpeg:85", "webp:80", "webp:lossless"):
+        encoding = parse_image_encoding(spec)
+        print(f"{str(encoding):<14}{encoding.mime_type:<12}{len(encoding.encode(sample)):>8} bytes")
@@ -0,0 +1,316 @@
+import asyncio
+import inspect
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from types import SimpleNamespace
+
+import openai
+from openai import AsyncOpenAI
+
+from scripts.config import *
+
+
+RETRYABLE_STATUS = {408, 409, 429}
+TIMEOUT_ERRORS = (asyncio.TimeoutError, TimeoutError, openai.APITimeoutError)
+
+
+def retry_after_seconds(error):
+    """The server's Retry-After (or retry-after-ms) wait in seconds, if the error carries one."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    if isinstance(error, TIMEOUT_ERRORS + (openai.APIConnectionError,)):
+        return True
+    status = getattr(error, "status_code", None)
+    return status is not None and (status in RETRYABLE_STATUS or status >= 500)
+
+
+_STREAM_END = object()
+
+
+async def _next_chunk(iterator):
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return _STREAM_END
+
+
+class PolicyStream:
+    """
+    A streamed response as RequestPolicy hands it out. prime() reads the first chunk,
+    so a streamed attempt is only answered once tokens arrive, and after that every
+    chunk must arrive before `ends`, the call's deadline.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.ends = None
+        self._iterator = stream.__aiter__()
+        self._first = None
+
+    async def prime(self):
+        try:
+            self._first = await _next_chunk(self._iterator)
+        except BaseException:
+            await self.close()
+            raise
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._first is not None:
+            chunk, self._first = self._first, None
+        elif self.ends is None:
+            chunk = await _next_chunk(self._iterator)
+        else:
+            try:
+                chunk = await asyncio.wait_for(_next_chunk(self._iterator), max(0.0, self.ends - time.monotonic()))
+            except asyncio.TimeoutError:
+                await self.close()
+                raise asyncio.TimeoutError("streamed response exceeded its deadline") from None
+        if chunk is _STREAM_END:
+            raise StopAsyncIteration
+        return chunk
+
+    async def close(self):
+        close = getattr(self.stream, "close", None) or getattr(self.stream, "aclose", None)
+        if close:
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+
+
+async def _discard(response):
+    if isinstance(response, PolicyStream):
+        await response.close()
+
+
+class LatencyWindow:
+    """The last `size` successful request latencies, for the hedge delay."""
+
+    def __init__(self, size=100):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, percent):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class RequestPolicy:
+    """
+    Drop-in async `chat.completions.create` over a primary client and an optional
+    fallback, for AsyncClientBridge. Each call gets a deadline covering all of its
+    attempts and, for a stream, reading the whole stream. Once `hedge_min_samples`
+    latencies have been seen, a request still unanswered after the `hedge_percentile`
+    latency is duplicated, the first answer wins and the other request is cancelled;
+    a stream counts as answered at its first chunk. Retryable errors (timeouts,
+    connection errors, 408/409/429/5xx) are retried up to `max_retries` times after
+    the server's Retry-After, or after a jittered exponential backoff. After
+    `fallback_after` timeouts in a row, requests go to the fallback model/endpoint
+    for `fallback_seconds`.
+    """
+
+    def __init__(
+        self,
+        client,
+        fallback_client=None,
+        fallback_model=None,
+        deadline=LLM_DEADLINE_SECONDS,
+        attempt_timeout=LLM_TIMEOUT_SECONDS,
+        max_retries=LLM_MAX_RETRIES,
+        retry_base_seconds=LLM_RETRY_BASE_SECONDS,
+        retry_max_seconds=LLM_RETRY_MAX_SECONDS,
+        hedge_percentile=LLM_HEDGE_PERCENTILE,
+        hedge_min_samples=LLM_HEDGE_MIN_SAMPLES,
+        fallback_after=LLM_FALLBACK_AFTER_TIMEOUTS,
+        fallback_seconds=LLM_FALLBACK_SECONDS,
+    ):
+        self.client = client
+        self.fallback_client = fallback_client
+        self.fallback_model = fallback_model
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.fallback_after = fallback_after
+        self.fallback_seconds = fallback_seconds
+        # Time to a full response and time to a stream's first chunk are tracked apart
+        self.latencies = {(route, streamed): LatencyWindow() for route in ("primary", "fallback") for streamed in (False, True)}
+        self.consecutive_timeouts = 0
+        self.fallback_until = 0.0
+        self.hedges = 0
+        self.retries = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @property
+    def has_fallback(self):
+        return self.fallback_client is not None or bool(self.fallback_model)
+
+    def _route(self, kwargs):
+        if self.has_fallback and time.monotonic() < self.fallback_until:
+            request = dict(kwargs, model=self.fallback_model or kwargs.get("model"))
+            return "fallback", self.fallback_client or self.client, request
+        return "primary", self.client, kwargs
+
+    def hedge_delay(self, route, streamed=False):
+        window = self.latencies[route, streamed]
+        if self.hedge_percentile <= 0 or len(window.samples) < self.hedge_min_samples:
+            return None
+        return window.percentile(self.hedge_percentile)
+
+    def backoff_seconds(self, retry, error):
+        jittered = random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * 2**retry))
+        retry_after = retry_after_seconds(error)
+        if retry_after is None:
+            return jittered
+        # The server's wait is a minimum; the jitter keeps retries from many agents apart
+        return min(self.retry_max_seconds, retry_after) + random.uniform(0, self.retry_base_seconds / 4)
+
+    async def _send(self, client, request):
+        started = time.monotonic()
+        response = await client.chat.completions.create(**request)
+        if request.get("stream"):
+            response = await PolicyStream(response).prime()
+        return response, time.monotonic() - started
+
+    async def _attempt(self, route, client, request, timeout):
+        """One attempt, hedged once if it outlives the latency percentile; the slower request is cancelled."""
+        started = time.monotonic()
+        streamed = bool(request.get("stream"))
+        pending = {asyncio.ensure_future(self._send(client, request))}
+        hedge_delay = self.hedge_delay(route, streamed)
+        error = None
+        try:
+            if hedge_delay is not None and (timeout is None or hedge_delay < timeout):
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done:
+                    self.hedges += 1
+                    pending.add(asyncio.ensure_future(self._send(client, request)))
+            while pending:
+                remaining = None if timeout is None else max(0.0, timeout - (time.monotonic() - started))
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError(f"no response within {timeout:g}s")
+                answered = [task for task in done if task.exception() is None]
+                if answered:
+                    response, seconds = answered[0].result()
+                    for task in answered[1:]:
+                        await _discard(task.result()[0])
+                    self.latencies[route, streamed].add(seconds)
+                    return response
+                error = next(iter(done)).exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def create(self, deadline=None, **kwargs):
+        deadline = self.deadline if deadline is None else deadline
+        ends = time.monotonic() + deadline if deadline and deadline > 0 else None
+        retry = 0
+        while True:
+            route, client, request = self._route(kwargs)
+            timeouts = [self.attempt_timeout if self.attempt_timeout > 0 else None]
+            if ends is not None:
+                timeouts.append(max(0.0, ends - time.monotonic()))
+            timeout = min((value for value in timeouts if value is not None), default=None)
+            try:
+                response = await self._attempt(route, client, request, timeout)
+            except Exception as e:
+                if isinstance(e, TIMEOUT_ERRORS) and route == "primary":
+                    self._primary_timed_out()
+                # A client error such as 400 or 401 is reported as it is, even past the deadline
+                if not is_retryable(e):
+                    raise
+                if ends is not None and time.monotonic() >= ends:
+                    raise asyncio.TimeoutError(f"model request exceeded its {deadline:g}s deadline") from e
+                if retry >= self.max_retries:
+                    raise
+                wait = self.backoff_seconds(retry, e)
+                if ends is not None and time.monotonic() + wait >= ends:
+                    raise
+                self.retries += 1
+                retry += 1
+                await asyncio.sleep(wait)
+                continue
+            if route == "primary":
+                self.consecutive_timeouts = 0
+            if isinstance(response, PolicyStream):
+                response.ends = ends
+            return response
+
+    def _primary_timed_out(self):
+        self.consecutive_timeouts += 1
+        if self.has_fallback and self.consecutive_timeouts >= self.fallback_after:
+            self.consecutive_timeouts = 0
+            self.fallback_until = time.monotonic() + self.fallback_seconds
+            print(f"Model requests keep timing out; using the fallback for {self.fallback_seconds:g}s.")
+
+    async def close(self):
+        for client in {id(client): client for client in (self.client, self.fallback_client) if client}.values():
+            await client.close()
+
+
+def request_policy_client():
+    """A RequestPolicy over AsyncOpenAI clients from the LLM_* settings; retries are the policy's, not the SDK's."""
+    kwargs = dict(openai_client_kwargs(), max_retries=0)
+    fallback_client = None
+    if LLM_FALLBACK_API_ENDPOINT or LLM_FALLBACK_API_KEY:
+        fallback_kwargs = dict(kwargs)
+        if LLM_FALLBACK_API_ENDPOINT:
+            fallback_kwargs["base_url"] = LLM_FALLBACK_API_ENDPOINT
+        if LLM_FALLBACK_API_KEY:
+            fallback_kwargs["api_key"] = LLM_FALLBACK_API_KEY
+        fallback_client = AsyncOpenAI(**fallback_kwargs)
+    return RequestPolicy(AsyncOpenAI(**kwargs), fallback_client=fallback_client, fallback_model=LLM_FALLBACK_MODEL_NAME or None)
+
+
+if __name__ == "__main__":
+    # python -m scripts.llm_policy
+    from scripts.fake_llm_server import FakeLLMServer
+
+    async def main():
+        # Every tenth request stalls for 3 s
+        with FakeLLMServer(latency=lambda index: 3.0 if index % 10 == 9 else 0.05, prefill_ms_per_1k=0, decode_ms_per_token=0) as server:
+            for hedge_percentile in (0, 90):
+                policy = RequestPolicy(AsyncOpenAI(base_url=server.url, api_key="fake", max_retries=0), hedge_percentile=hedge_percentile, deadline=0)
+                started = time.perf_counter()
+                slowest = 0.0
+                for _ in range(40):
+                    call_started = time.perf_counter()
+                    await policy.create(model="fake-model", messages=[{"role": "user", "content": "ping"}])
+                    slowest = max(slowest, time.perf_counter() - call_started)
+                print(
+                    f"hedge p{hedge_percentile}: 40 calls in {time.perf_counter() - started:.2f} s, "
+                    f"slowest {slowest:.2f} s, {policy.hedges} hedged"
+                )
+                await policy.close()
+
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+from scripts.config import MACRO_DIR
+
+
+MACRO_VERSION = 1
+# Actions that press at the pointer; the region under the pointer is checked before replaying them
+VERIFIED_ACTIONS = {"click", "double_click", "mouse_down"}
+
+
+def macros_enabled():
+    return MACRO_DIR.lower() not in {"", "off", "none"}
+
+
+def new_macro_path():
+    """A fresh `<MACRO_DIR>/<timestamp>.json` path, or None when macro recording is off."""
+    if not macros_enabled():
+        return None
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(MACRO_DIR, f"{timestamp}.json")
+
+
+def fingerprints_match(recorded, current, threshold):
+    """True when both fingerprints cover the same blocks and differ by at most threshold on average."""
+    if recorded is None or current is None:
+        return False
+    recorded = np.asarray(recorded, dtype=np.int16)
+    current = np.asarray(current, dtype=np.int16)
+    if recorded.shape != current.shape or recorded.size == 0:
+        return False
+    return float(np.abs(recorded - current).mean()) <= threshold
+
+
+class MacroRecorder:
+    """
+    Records the actions a run executed, grouped by agent step, as a JSON macro. Each
+    entry keeps the tool call, the action, the screen point it acted on and, for
+    presses, the block fingerprint of the region under the pointer just before the
+    press. An existing file is continued, so a resumed run keeps one macro.
+    """
+
+    def __init__(self, path, task):
+        self.path = path
+        self.task = task
+        self.steps = []
+        if path and os.path.exists(path):
+            self.steps = load_macro(path)["steps"]
+
+    def record(self, step, tool_call, action_dict, position, fingerprint=None):
+        if not self.steps or self.steps[-1]["step"] != step:
+            self.steps.append({"step": step, "actions": []})
+        if fingerprint is not None:
+            fingerprint = np.asarray(fingerprint).tolist()
+        self.steps[-1]["actions"].append({
+            "tool": tool_call,
+            "action": action_dict,
+            "position": [int(position[0]), int(position[1])],
+            "fingerprint": fingerprint,
+        })
+
+    def save(self):
+        """Write the macro next to path and rename it into place."""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = {
+            "version": MACRO_VERSION,
+            "task": self.task,
+            "saved_at": datetime.now().isoformat(timespec="seconds"),
+            "steps": self.steps,
+        }
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+
+def load_macro(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    version = data.get("version")
+    if version != MACRO_VERSION:
+        raise ValueError(f"Unsupported macro version {version!r} in {path}")
+    return data
+
+
+class MacroPlayer:
+    """Walks a recorded macro one agent step at a time until it ends or is stopped."""
+
+    def __init__(self, path):
+        data = load_macro(path)
+        self.path = path
+        self.task = data.get("task", "")
+        self.steps = [step["actions"] for step in data.get("steps", []) if step.get("actions")]
+        self.position = 0
+        self.stopped = False
+
+    @property
+    def active(self):
+        return not self.stopped and self.position < len(self.steps)
+
+    def current_step(self):
+        return self.steps[self.position]
+
+    def advance(self):
+        self.position += 1
+
+    def stop(self):
+        self.stopped = True
+
+
+if __name__ == "__main__":
+    # python -m scripts.macros <macro.json>
+    import sys
+
+    macro = load_macro(sys.argv[1])
+    print(f"Task: {macro['task']}")
+    for step in macro["steps"]:
+        for entry in step["actions"]:
+            check = "checked" if entry.get("fingerprint") is not None else "unchecked"
+            print(f"{step['step']:>3}  {entry['tool'].get('name', '')} {json.dumps(entry['tool'].get('arguments', {}), ensure_ascii=False)}  at {tuple(entry['position'])} ({check})")
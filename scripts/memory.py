@@ -1,9 +1,16 @@
+from scripts.cassette import wrap_client
 from scripts.config import *
+from scripts.debug_writer import get_debug_writer
+from scripts.extractive import extractive_summary
+from scripts.frame import VIEWS
+from scripts.image_encoding import ImageEncoding, configured_view_encodings
+from scripts.tokens import TokenCalibration, TokenCountedLayer, count_text, tokens_for_counts
 from openai import OpenAI
-import base64
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
 import json
 import os
+import time
 from datetime import datetime
 
 
@@ -54,6 +61,21 @@ Format:
 """.strip()
 
 
+SHORT_MEMORY_MERGE_INSTRUCTIONS = """
+## Compression Task
+The provided entries are summaries of consecutive parts of one interaction history, oldest first. Merge them into one concise operational memory paragraph.
+
+Include:
+- The latest known UI state.
+- The concrete actions taken and their results.
+- Any errors, failed attempts, or uncertainty.
+- The next relevant state or pending goal if the task is not finished.
+
+Format:
+`History Summary: ...`
+""".strip()
+
+
 LONG_MEMORY_COMPRESSION_INSTRUCTIONS = """
 ## Compression Task
 Consolidate the provided historical summaries into one high-level long-term memory.
@@ -86,19 +108,67 @@ def build_memory_summary_user_prompt(instructions, memory_list):
 """.strip()
 
 
+@dataclass(frozen=True)
+class CompressionResult:
+    """Summaries for the first `short_count` short memory steps and, when consolidated, the first `long_count` long memory entries."""
+    short_count: int
+    short_summary: str = None
+    long_count: int = 0
+    long_summary: str = None
+    messages: list = field(default_factory=list)
+
+
+def _field(value, name):
+    # OpenAI SDK objects and the plain dicts used by tests and other clients
+    if isinstance(value, dict):
+        return value.get(name)
+    return getattr(value, name, None)
+
+
+def _cached_prompt_tokens(usage):
+    """Prompt tokens served from the provider's prefix cache (OpenAI style, or DeepSeek's prompt_cache_hit_tokens)."""
+    details = _field(usage, "prompt_tokens_details")
+    cached = _field(details, "cached_tokens") if details is not None else None
+    if cached is None:
+        cached = _field(usage, "prompt_cache_hit_tokens")
+    return cached or 0
+
+
+def _plain(value):
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return value
+
+
 class HierarchicalMemory:
-    def __init__(self, system_prompt, initial_task):
+    def __init__(self, system_prompt, initial_task, hints=""):
         self.system_prompt = system_prompt
         self.initial_task = initial_task
+        # Hints from similar past runs ride along with the task, so they stay in the fixed prefix
+        self.hints = hints
         self.fixed_layer = [
             {"role": "system", "content": system_prompt},
-            {"role": "user", "content": initial_task}
+            {"role": "user", "content": f"{initial_task}\n\n{hints}" if hints else initial_task}
         ]
         self.long_memory_layer = []
         self.short_memory_layer = []
         self._fixed_input_logged = False
-        
-        self.client = OpenAI(**openai_client_kwargs())
+        # Encodings for the (global, local) views passed to get_full_context
+        self.image_encodings = configured_view_encodings()
+        self._compression_executor = None
+        self._summary_executor = None
+        self._pending_compression = None
+        self._compression_log = self._compression_logger(None)
+        self._compression_failures = 0
+        self._compression_retry_at = 0.0
+        # Screenshots sent with the latest query; they share the short memory budget
+        self._query_images = 0
+        calibration_path = None if MEMORY_TOKEN_CALIBRATION_FILE.lower() in {"", "off", "none"} else MEMORY_TOKEN_CALIBRATION_FILE
+        self.token_calibration = TokenCalibration(
+            calibration_path, model=LLM_MODEL_NAME, save_interval=MEMORY_TOKEN_CALIBRATION_SAVE_SECONDS
+        )
+        # Built on first use, so a runner that sets its own client never opens this one
+        self._client = None
 
         # Initialize debug log path
         if DEBUG_MODE:
@@ -108,22 +178,67 @@ class HierarchicalMemory:
                 os.makedirs(log_dir)
             self.debug_save_path = os.path.join(log_dir, f"{timestamp}.jsonl")
 
+    @property
+    def client(self):
+        """The summarizer's chat client: the runner's cancellable one, or a blocking OpenAI client."""
+        if self._client is None:
+            self._client = wrap_client(OpenAI(**openai_client_kwargs()))
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    @property
+    def long_memory_layer(self):
+        return self._long_memory_layer
+
+    @long_memory_layer.setter
+    def long_memory_layer(self, steps):
+        self._long_memory_layer = self._token_counted(steps)
+
+    @property
+    def short_memory_layer(self):
+        return self._short_memory_layer
+
+    @short_memory_layer.setter
+    def short_memory_layer(self, steps):
+        self._short_memory_layer = self._token_counted(steps)
+
+    def _token_counted(self, steps):
+        if isinstance(steps, TokenCountedLayer) and steps.measure == self.measure_step:
+            return steps
+        return TokenCountedLayer(steps, measure=self.measure_step, to_tokens=self.tokens_for_counts)
+
+    def snapshot(self):
+        """The long and short layers as plain lists, for checkpoints. A pending background summary is not included; its steps are still in short memory."""
+        return {"long_memory_layer": list(self.long_memory_layer), "short_memory_layer": list(self.short_memory_layer)}
+
+    def restore(self, state):
+        self.long_memory_layer = state.get("long_memory_layer", [])
+        self.short_memory_layer = state.get("short_memory_layer", [])
+
     def _append_to_log(self, steps: list[dict]):
-        """Helper to append steps to the JSONL log file"""
+        """Helper to append steps to the JSONL log file through the background debug writer"""
         try:
-            with open(self.debug_save_path, 'a', encoding='utf-8') as f:
-                for step in steps:
-                    log_step = {
-                        "step": step.get("step", 0),
-                        "timestamp": datetime.now().isoformat(timespec="microseconds"),
-                    }
-                    for key, value in step.items():
-                        if key not in {"step", "timestamp"}:
-                            log_step[key] = value
-                    f.write(json.dumps(log_step, ensure_ascii=False) + "\n")
+            writer = get_debug_writer()
+            for step in steps:
+                log_step = {
+                    "step": step.get("step", 0),
+                    "timestamp": datetime.now().isoformat(timespec="microseconds"),
+                }
+                for key, value in step.items():
+                    if key not in {"step", "timestamp"}:
+                        log_step[key] = value
+                # Serialize now so later changes to the step cannot leak into the queued line
+                writer.append_line(self.debug_save_path, json.dumps(log_step, ensure_ascii=False))
         except Exception as e:
             print(f"Failed to write to debug log: {e}")
 
+    def flush_debug_log(self):
+        """Wait until every queued debug log line has been written."""
+        get_debug_writer().flush()
+
     def _content_text_for_log(self, content):
         if isinstance(content, str):
             return content
@@ -139,7 +254,8 @@ class HierarchicalMemory:
         if not DEBUG_MODE:
             return
 
-        fixed_prefix_present = messages[:len(self.fixed_layer)] == self.fixed_layer
+        # In the task_last layout the task message sits after the history, not in the prefix
+        fixed_prefix_present = all(message in messages for message in self.fixed_layer)
         log_steps = []
         if fixed_prefix_present and not self._fixed_input_logged:
             for message in self.fixed_layer:
@@ -184,6 +300,11 @@ class HierarchicalMemory:
             log_step["tool"] = tool
         self._append_to_log([log_step])
 
+    def add_step_timing_log(self, step, timing):
+        if not DEBUG_MODE:
+            return
+        self._append_to_log([{"step": step, "direction": "timing", **timing}])
+
     def add_step(self, role, content, tool=None, log_content=None, log_extra=None, log_callback=None, compress=True, debug_log=True):
         """
         Add a new step to short_memory_layer.
@@ -235,26 +356,113 @@ class HierarchicalMemory:
         )
         self.compress_context(log_callback)
 
+    def token_rates(self):
+        """(chars_per_token, tokens_per_image), calibrated from API usage when available."""
+        return self.token_calibration.rates(MEMORY_CHARS_PER_TOKEN, MEMORY_IMAGE_TOKENS)
+
+    def save_token_calibration(self):
+        """Write the calibration learned since the last periodic save."""
+        self.token_calibration.save()
+
+    def short_token_budget(self):
+        """MEMORY_SHORT_TOKEN_BUDGET less the estimated tokens of the screenshots sent with each query."""
+        return max(0, MEMORY_SHORT_TOKEN_BUDGET - int(self._query_images * self.token_rates()[1]))
+
+    def tokens_for_counts(self, ascii_chars, other_chars):
+        return tokens_for_counts(ascii_chars, other_chars, self.token_rates()[0])
+
     def estimate_tokens_for_text(self, text):
-        text = str(text)
-        ascii_chars = 0
-        non_ascii_tokens = 0
-        for char in text:
-            if ord(char) < 128:
-                ascii_chars += 1
-            elif char.isspace():
-                ascii_chars += 1
-            else:
-                non_ascii_tokens += 1
+        return max(1, self.tokens_for_counts(*count_text(text)))
+
+    def measure_step(self, step):
+        role_ascii, role_other = count_text(step.get("role", ""))
+        content_ascii, content_other = count_text(step.get("content", ""))
+        return role_ascii + content_ascii, role_other + content_other
 
-        ascii_tokens = int(ascii_chars / max(1.0, MEMORY_CHARS_PER_TOKEN))
-        return max(1, ascii_tokens + non_ascii_tokens)
+    def estimate_tokens_for_step(self, step):
+        return self.tokens_for_counts(*self.measure_step(step))
 
     def estimate_tokens_for_steps(self, steps):
-        return sum(
-            self.estimate_tokens_for_text(step.get("role", "")) + self.estimate_tokens_for_text(step.get("content", ""))
-            for step in steps
-        )
+        if isinstance(steps, TokenCountedLayer):
+            return steps.total_tokens
+        return sum(self.estimate_tokens_for_step(step) for step in steps)
+
+    def measure_request(self, messages, tools=None):
+        """(ascii_chars, other_chars, images) of a chat request, including tool schemas and tool call arguments."""
+        parts = [json.dumps(tools, ensure_ascii=False)] if tools else []
+        images = 0
+        for message in messages:
+            parts.append(message.get("role", ""))
+            content = message.get("content")
+            if isinstance(content, list):
+                for item in content:
+                    if isinstance(item, dict) and item.get("type") == "image_url":
+                        images += 1
+                parts.append(self._content_text_for_log(content))
+            elif content is not None:
+                parts.append(str(content))
+            for tool_call in message.get("tool_calls") or []:
+                parts.append(json.dumps(tool_call, ensure_ascii=False, default=str))
+        ascii_chars, other_chars = count_text("\n".join(parts))
+        return ascii_chars, other_chars, images
+
+    def estimate_request_tokens(self, messages, tools=None):
+        ascii_chars, other_chars, images = self.measure_request(messages, tools)
+        chars_per_token, image_tokens = self.token_rates()
+        return tokens_for_counts(ascii_chars, other_chars, chars_per_token) + int(images * image_tokens)
+
+    def record_usage(self, messages, response, tools=None, step=0):
+        """
+        Feed `response.usage` into the token calibration: prompt tokens against the request
+        text and images, completion tokens against the returned text and tool calls.
+        Returns {"prompt_tokens", "completion_tokens", "cached_tokens"}, or None when the
+        response has no usage. Errors never reach the caller.
+        """
+        try:
+            usage = _field(response, "usage")
+            if usage is None:
+                return None
+            prompt_tokens = _field(usage, "prompt_tokens") or 0
+            completion_tokens = _field(usage, "completion_tokens") or 0
+            summary = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "cached_tokens": _cached_prompt_tokens(usage),
+            }
+            estimated = self.estimate_request_tokens(messages, tools)
+            self.token_calibration.observe(*self.measure_request(messages, tools), prompt_tokens)
+
+            # Hidden reasoning is billed as completion tokens but is not in the returned text
+            details = _field(usage, "completion_tokens_details")
+            completion_tokens -= (_field(details, "reasoning_tokens") if details is not None else 0) or 0
+            choices = _field(response, "choices") or []
+            if choices:
+                message = _field(choices[0], "message")
+                output = {
+                    "role": "",
+                    "content": _field(message, "content") or "",
+                    "tool_calls": [_plain(call) for call in _field(message, "tool_calls") or []],
+                }
+                ascii_chars, other_chars, _ = self.measure_request([output])
+                self.token_calibration.observe(ascii_chars, other_chars, 0, completion_tokens)
+            self.token_calibration.save_if_due()
+
+            if DEBUG_MODE:
+                chars_per_token, image_tokens = self.token_rates()
+                self._append_to_log([{
+                    "step": step,
+                    "direction": "usage",
+                    "prompt_tokens": prompt_tokens,
+                    "estimated_prompt_tokens": estimated,
+                    "completion_tokens": summary["completion_tokens"],
+                    "cached_tokens": summary["cached_tokens"],
+                    "chars_per_token": round(chars_per_token, 3),
+                    "image_tokens": round(image_tokens, 1),
+                }])
+            return summary
+        except Exception as e:
+            print(f"Failed to record token usage: {e}")
+            return None
 
     def compress_memory(self, memory_list, instructions, max_tokens=None):
         """
@@ -270,87 +478,242 @@ class HierarchicalMemory:
             messages=messages_for_summary,
             max_tokens=max_tokens
         )
+        self.record_usage(messages_for_summary, response)
         return response.choices[0].message.content
 
+    def _chunk_steps(self, steps):
+        """
+        Split steps into consecutive chunks of at most MEMORY_COMPRESSION_CHUNK_TOKENS
+        estimated tokens. A chunk always takes at least two entries, so each merge level
+        at least halves the entry count even when single entries are large.
+        """
+        chunks, current, current_tokens = [], [], 0
+        for step in steps:
+            tokens = self.estimate_tokens_for_step(step)
+            if len(current) >= 2 and current_tokens + tokens > MEMORY_COMPRESSION_CHUNK_TOKENS:
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append(step)
+            current_tokens += tokens
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _summarize_chunks(self, chunks, instructions):
+        if self._summary_executor is None:
+            self._summary_executor = ThreadPoolExecutor(
+                max_workers=max(1, MEMORY_COMPRESSION_WORKERS), thread_name_prefix="iris-summary"
+            )
+        futures = [self._summary_executor.submit(self.compress_memory, chunk, instructions) for chunk in chunks]
+        return [future.result() for future in futures]
+
+    def compress_memory_tree(self, memory_list, instructions, merge_instructions=None):
+        """
+        compress_memory for inputs of any length. The entries are summarized in chunks of
+        MEMORY_COMPRESSION_CHUNK_TOKENS, MEMORY_COMPRESSION_WORKERS at a time, and the
+        chunk summaries are merged the same way, level by level, until one request covers
+        the rest. Every request stays near the chunk size and the number of levels grows
+        with the logarithm of the history length. Input that fits one chunk is a single
+        compress_memory call, as before.
+        """
+        entries = list(memory_list)
+        while True:
+            chunks = self._chunk_steps(entries)
+            if len(chunks) <= 1:
+                return self.compress_memory(entries, instructions)
+            summaries = self._summarize_chunks(chunks, instructions)
+            entries = [{"role": "assistant", "content": summary} for summary in summaries]
+            instructions = merge_instructions or instructions
+
     def compress_context(self, log_callback=None):
         """
-        Trigger compression when short_memory_layer length reaches the limit.
+        Compress old short memory into long memory once it passes the soft budget
+        (MEMORY_COMPRESSION_SOFT_RATIO of the short budget). The short budget is
+        MEMORY_SHORT_TOKEN_BUDGET less the screenshots each query carries.
+
+        With MEMORY_BACKGROUND_COMPRESSION the summary is written on a worker thread and
+        the steps being summarized stay in short memory until it is ready, so the
+        agent keeps going with the uncompressed layers. The caller only waits when
+        short memory is over the full budget.
+
+        After a failed summary the model is not asked again until a backoff of
+        MEMORY_COMPRESSION_RETRY_SECONDS, doubled per consecutive failure, has passed.
+        Whatever is still over a full budget afterwards is compressed locally by
+        extraction, so the next request never exceeds the budgets.
         """
-        def log(msg):
-            if log_callback:
-                log_callback(msg)
-            else:
-                print(msg)
+        log = self._compression_logger(log_callback)
+        self.apply_compression()
 
-        short_tokens = self.estimate_tokens_for_steps(self.short_memory_layer)
-        if short_tokens <= MEMORY_SHORT_TOKEN_BUDGET:
-            return
+        if self._pending_compression is not None and self.short_memory_layer.total_tokens > self.short_token_budget():
+            log("⏳ Short memory is over budget, waiting for the running compression...")
+            self.wait_for_compression()
 
-        log(f"⏳ Compressing short memory ({short_tokens} estimated tokens)...")
+        try:
+            self._start_compression(log)
+        finally:
+            if self._pending_compression is None:
+                self._enforce_budgets(log)
+
+    def _start_compression(self, log):
+        short_tokens = self.short_memory_layer.total_tokens
+        short_budget = self.short_token_budget()
+        if self._pending_compression is not None or short_tokens <= short_budget * MEMORY_COMPRESSION_SOFT_RATIO:
+            return
 
         keep_messages = max(0, MEMORY_RECENT_INTERACTIONS_TO_KEEP * 2)
-        if keep_messages and len(self.short_memory_layer) > keep_messages:
-            steps_to_compress = self.short_memory_layer[:-keep_messages]
-            self.short_memory_layer = self.short_memory_layer[-keep_messages:]
-        elif keep_messages:
+        compress_count = len(self.short_memory_layer) - keep_messages
+        if compress_count <= 0:
+            return
+        if time.monotonic() < self._compression_retry_at:
+            # Backing off after a failed summary; _enforce_budgets still holds the full budgets
             return
+
+        blocking = not MEMORY_BACKGROUND_COMPRESSION or short_tokens > short_budget
+        log(f"⏳ Compressing short memory ({short_tokens} estimated tokens){'' if blocking else ' in the background'}...")
+        # Snapshots: the worker never touches the live layers, apply_compression swaps the result in
+        snapshot = (self.short_memory_layer[:compress_count], list(self.long_memory_layer))
+        self._compression_log = log
+        if blocking:
+            self._apply_compression_result(self._compress_snapshot(*snapshot))
         else:
-            steps_to_compress = self.short_memory_layer
-            self.short_memory_layer = []
-        
+            if self._compression_executor is None:
+                self._compression_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="iris-memory")
+            self._pending_compression = self._compression_executor.submit(self._compress_snapshot, *snapshot)
+
+    def _compression_logger(self, log_callback):
+        def log(msg):
+            if log_callback:
+                log_callback(msg)
+            else:
+                print(msg)
+        return log
+
+    def _compress_snapshot(self, steps_to_compress, long_memories):
+        """Summarize a snapshot of both layers. Runs on the worker thread and returns a CompressionResult."""
+        messages = []
         try:
-            summary = self.compress_memory(
+            summary = self.compress_memory_tree(
                 steps_to_compress,
                 SHORT_MEMORY_COMPRESSION_INSTRUCTIONS,
-                max_tokens=None
+                SHORT_MEMORY_MERGE_INSTRUCTIONS,
             )
-            
-            # Append summary to long_memory_layer
-            self.long_memory_layer.append({"role": "assistant", "content": summary})
-            log(f"✅ Short memory compressed. Summary: {summary[:100]}...")
-            
+            messages.append(f"✅ Short memory compressed. Summary: {summary[:100]}...")
         except Exception as e:
-            log(f"❌ Error compressing short memory: {e}")
-            # If failed, maybe put back the uncompressed ones or keep them
-            # Simple handling here: print error, do not lose data (put back)
-            self.short_memory_layer = steps_to_compress + self.short_memory_layer
-            return
+            # Nothing is removed from short memory, so no data is lost
+            messages.append(f"❌ Error compressing short memory: {e}")
+            return CompressionResult(len(steps_to_compress), None, messages=messages)
 
-        # 2. Check if Long Memory needs compression
-        long_tokens = self.estimate_tokens_for_steps(self.long_memory_layer)
-        if long_tokens >= MEMORY_LONG_TOKEN_BUDGET:
-            log(f"⏳ Compressing long memory ({long_tokens} estimated tokens)...")
-            # Compress Long Memory
-            long_memories_to_compress = self.long_memory_layer
-            self.long_memory_layer = []
-            
-            try:
-                summary = self.compress_memory(
-                    long_memories_to_compress,
-                    LONG_MEMORY_COMPRESSION_INSTRUCTIONS,
-                    max_tokens=None
-                )
-                self.long_memory_layer.insert(0, {"role": "assistant", "content": summary})
-                log(f"✅ Long memory compressed. Summary: {summary[:100]}...")
-                
-            except Exception as e:
-                log(f"❌ Error compressing long memory: {e}")
-                self.long_memory_layer = long_memories_to_compress + self.long_memory_layer
-
-    def _encode_image(self, image):
-        buffered = BytesIO()
-        image.save(buffered, format="PNG")
-        return base64.b64encode(buffered.getvalue()).decode('utf-8')
-
-    def get_full_context(self, query, images=None):
+        # 2. Check if Long Memory needs compression, including the new summary
+        long_memories = long_memories + [{"role": "assistant", "content": summary}]
+        long_tokens = self.estimate_tokens_for_steps(long_memories)
+        if long_tokens < MEMORY_LONG_TOKEN_BUDGET * MEMORY_COMPRESSION_SOFT_RATIO:
+            return CompressionResult(len(steps_to_compress), summary, messages=messages)
+
+        messages.append(f"⏳ Compressing long memory ({long_tokens} estimated tokens)...")
+        try:
+            long_summary = self.compress_memory_tree(long_memories, LONG_MEMORY_COMPRESSION_INSTRUCTIONS)
+            messages.append(f"✅ Long memory compressed. Summary: {long_summary[:100]}...")
+        except Exception as e:
+            messages.append(f"❌ Error compressing long memory: {e}")
+            long_summary = None
+        return CompressionResult(len(steps_to_compress), summary, len(long_memories), long_summary, messages)
+
+    def _enforce_budgets(self, log):
+        """Compress locally, without the model, whatever is still over a full budget."""
+        short = self.short_memory_layer
+        short_budget = self.short_token_budget()
+        if short.total_tokens > short_budget:
+            # The recent pairs stay verbatim, as with a model summary
+            count = len(short) - max(0, MEMORY_RECENT_INTERACTIONS_TO_KEEP * 2)
+            if count > 0:
+                summary = extractive_summary(short[:count], short_budget // 4, self.estimate_tokens_for_text)
+                del short[:count]
+                self.long_memory_layer.append({"role": "assistant", "content": summary})
+                log(f"🧹 Short memory compressed locally ({count} entries) while the summarizer is unavailable.")
+
+        long = self.long_memory_layer
+        # A single entry is already a consolidated summary; extracting from it would only lose detail
+        if len(long) > 1 and long.total_tokens > MEMORY_LONG_TOKEN_BUDGET:
+            summary = extractive_summary(
+                list(long), MEMORY_LONG_TOKEN_BUDGET // 2, self.estimate_tokens_for_text, header="Long Term Memory"
+            )
+            self.long_memory_layer = [{"role": "assistant", "content": summary}]
+            log(f"🧹 Long memory consolidated locally ({len(long)} entries) while the summarizer is unavailable.")
+
+    def _apply_compression_result(self, result):
+        for message in result.messages:
+            self._compression_log(message)
+        if result.short_summary is None:
+            self._compression_failures += 1
+            delay = min(
+                MEMORY_COMPRESSION_RETRY_MAX_SECONDS,
+                MEMORY_COMPRESSION_RETRY_SECONDS * 2 ** (self._compression_failures - 1),
+            )
+            self._compression_retry_at = time.monotonic() + delay
+            self._compression_log(f"⏸️ Next memory compression attempt in {delay:g} s.")
+            return
+        self._compression_failures = 0
+        self._compression_retry_at = 0.0
+        # Short memory only grows at the end while a compression runs, so the summarized steps are still the first ones
+        del self.short_memory_layer[:result.short_count]
+        self.long_memory_layer.append({"role": "assistant", "content": result.short_summary})
+        if result.long_summary is not None:
+            del self.long_memory_layer[:result.long_count]
+            self.long_memory_layer.insert(0, {"role": "assistant", "content": result.long_summary})
+
+    def apply_compression(self):
+        """Swap in a finished background compression. Returns False while one is still running."""
+        future = self._pending_compression
+        if future is None:
+            return True
+        if not future.done():
+            return False
+        self._pending_compression = None
+        self._apply_compression_result(future.result())
+        return True
+
+    def wait_for_compression(self, timeout=None):
+        """Block until the running background compression, if any, is swapped in."""
+        future = self._pending_compression
+        if future is not None:
+            wait([future], timeout=timeout)
+        return self.apply_compression()
+
+    def _encode_image(self, image, encoding=ImageEncoding()):
+        return encoding.encode_base64(image)
+
+    def encode_frame(self, frame):
+        """Encode the frame's views the way get_full_context sends them; the frame caches the result."""
+        for view, encoding in zip(VIEWS, self.image_encodings):
+            if frame.image(view) is not None:
+                frame.encoded_base64(view, encoding)
+
+    def get_full_context(self, query, images=None, frame=None):
         """
         Concatenate in order: Fixed -> Long Term -> Short Term -> query.
         Return messages list in OpenAI format.
+        Everything before the query is a stable prefix for provider-side prompt caching:
+        the fixed layer never changes, long memory only changes when a compression is
+        swapped in, and short memory is only appended to in between. The query and its
+        images are the only per-step part, so they always go last.
+        With MEMORY_CONTEXT_LAYOUT=task_last the task message is moved from the fixed layer
+        to just before the query, so it is restated next to each screenshot; only the task
+        message and the query then fall outside the cached prefix.
+        With a CapturedFrame, its views are used as the images and its cached encodings are reused.
         """
+        if frame is not None:
+            images = frame.images()
+        self._query_images = sum(image is not None for image in images or ())
+        # Use a background summary as soon as it is ready
+        swapping = self._pending_compression is not None
+        if self.apply_compression() and swapping:
+            # The summary may have failed, or short memory grown past its budget while it ran
+            self._enforce_budgets(self._compression_log)
         messages = []
+        task_last = MEMORY_CONTEXT_LAYOUT == "task_last"
         
         # 1. Fixed Layer
-        messages.extend(self.fixed_layer)
+        messages.extend(self.fixed_layer[:1] if task_last else self.fixed_layer)
         
         # 2. Long Term Memory
         messages.extend(self.long_memory_layer)
@@ -358,26 +721,24 @@ class HierarchicalMemory:
         # 3. Short Term Memory
         messages.extend(self.short_memory_layer)
         
+        if task_last:
+            messages.extend(self.fixed_layer[1:])
+        
         # 4. Query (Current Step)        
         user_content = [{"type": "text", "text": query}]
         
-        if images:
-            global_img, local_img = images
-            # Encode images
-            global_base64 = self._encode_image(global_img)
-            local_base64 = self._encode_image(local_img)
-            
-            user_content.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/png;base64,{global_base64}",
-                    "detail": "high"
-                }
-            })
+        # Images are (global, local); local-only steps pass None for the global view.
+        for view, image, encoding in zip(VIEWS, images or (), self.image_encodings):
+            if image is None:
+                continue
+            if frame is not None:
+                data = frame.encoded_base64(view, encoding)
+            else:
+                data = self._encode_image(image, encoding)
             user_content.append({
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/png;base64,{local_base64}",
+                    "url": f"data:{encoding.mime_type};base64,{data}",
                     "detail": "high"
                 }
             })
@@ -0,0 +1,78 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class OverlaySession:
+    """
+    Reference-counted hide scope for the live log window.
+
+    The first enter() hides the window and it is shown again when the outermost
+    scope exits. Scopes opened inside it, such as the capture and each action of an
+    agent step, reuse the hidden window instead of hiding and showing it again;
+    scope() opens an outer scope without hiding anything itself.
+    reveal() shows the window inside a scope, for example while waiting for the
+    model; the next enter() hides it again.
+    """
+
+    def __init__(self, hide=None, show=None):
+        self.hide = hide
+        self.show = show
+        self.depth = 0
+        self.hidden = False
+        self.hide_count = 0
+        self.hide_seconds = 0.0
+        self._lock = threading.RLock()
+
+    def enter(self, hide=True):
+        with self._lock:
+            self.depth += 1
+            if self.hidden or not hide:
+                return
+            started = time.perf_counter()
+            try:
+                if self.hide:
+                    self.hide()
+            except Exception:
+                self.depth -= 1
+                raise
+            finally:
+                self.hide_count += 1
+                self.hide_seconds += time.perf_counter() - started
+            self.hidden = True
+
+    def exit(self):
+        with self._lock:
+            if self.depth == 0:
+                return
+            self.depth -= 1
+            if self.depth == 0:
+                self.reveal()
+
+    def reveal(self):
+        with self._lock:
+            if not self.hidden:
+                return
+            self.hidden = False
+            if self.show:
+                self.show()
+
+    @contextmanager
+    def scope(self):
+        """Hold the session open without hiding; the first nested enter() hides and the window stays hidden until the scope ends."""
+        self.enter(hide=False)
+        try:
+            yield self
+        finally:
+            self.exit()
+
+    def counters(self):
+        return self.hide_count, self.hide_seconds
+
+    def __enter__(self):
+        self.enter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.exit()
+        return False
@@ -0,0 +1,222 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+from types import SimpleNamespace
+
+from scripts.cassette import wrap_client
+from scripts.config import *
+from scripts.debug_writer import get_debug_writer
+from scripts.llm_policy import request_policy_client
+
+
+class RequestCancelled(Exception):
+    """Raised in the step thread when the runner cancels its model request."""
+
+
+_STREAM_END = object()
+
+
+async def _next_chunk(iterator):
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return _STREAM_END
+
+
+class AsyncClientBridge:
+    """
+    Blocking `chat.completions.create` for a step running in a worker thread, backed by
+    an AsyncOpenAI client. Each request, and each chunk of a streamed one, runs as a task
+    on the runner's event loop, so cancel() aborts it mid-flight; the waiting thread then
+    gets RequestCancelled. Requests made after cancel() fail straight away.
+    """
+
+    def __init__(self, async_client, loop):
+        self.async_client = async_client
+        self.loop = loop
+        self.cancelled = False
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def run(self, coroutine):
+        with self._lock:
+            if self.cancelled:
+                coroutine.close()
+                raise RequestCancelled("model request cancelled")
+            future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+            self._pending.add(future)
+        try:
+            return future.result()
+        except concurrent.futures.CancelledError:
+            raise RequestCancelled("model request cancelled") from None
+        finally:
+            with self._lock:
+                self._pending.discard(future)
+
+    def create(self, **kwargs):
+        response = self.run(self.async_client.chat.completions.create(**kwargs))
+        if kwargs.get("stream"):
+            return self._chunks(response)
+        return response
+
+    def _chunks(self, stream):
+        iterator = stream.__aiter__()
+        try:
+            while True:
+                chunk = self.run(_next_chunk(iterator))
+                if chunk is _STREAM_END:
+                    return
+                yield chunk
+        finally:
+            close = getattr(stream, "close", None)
+            if close and not self.loop.is_closed():
+                asyncio.run_coroutine_threadsafe(close(), self.loop)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            pending = list(self._pending)
+        for future in pending:
+            future.cancel()
+
+
+class AgentRunner:
+    """
+    Runs an IrisAgent on an asyncio event loop. Each step (capture, actions, memory) runs
+    in a worker thread, and its model requests and memory summaries are AsyncOpenAI tasks
+    on the loop, sent through a RequestPolicy. stop() cancels the requests in flight, lets
+    the step finish, then flushes memory, the checkpoint, the macro and the debug log, all
+    within stop_timeout seconds. Runners do not share state, so several can run on one loop.
+    """
+
+    def __init__(self, agent, log_callback=None, async_client=None, stop_timeout=AGENT_STOP_TIMEOUT_SECONDS):
+        self.agent = agent
+        self.log_callback = log_callback
+        self.async_client = async_client
+        self.stop_timeout = stop_timeout
+        self.bridge = None
+        self.stop_requested = False
+        self.stopped_at = None
+        self.final_feedback = None
+        self._loop = None
+        self._stop_event = None
+
+    def stop(self):
+        """Request a graceful stop; safe to call from any thread, before or during run()."""
+        self.stop_requested = True
+        if self.stopped_at is None:
+            self.stopped_at = time.monotonic()
+        loop, event = self._loop, self._stop_event
+        if loop is not None and event is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(event.set)
+
+    def _remaining(self):
+        if self.stopped_at is None:
+            return self.stop_timeout
+        return max(0.0, self.stopped_at + self.stop_timeout - time.monotonic())
+
+    async def run(self):
+        """Run steps until the task completes, MAX_STEPS is reached or stop() is called; returns the final feedback."""
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        if self.stop_requested:
+            self._stop_event.set()
+        # Deadlines, hedging, retries and the fallback model wrap the AsyncOpenAI client
+        client = self.async_client or wrap_client(request_policy_client())
+        self.bridge = AsyncClientBridge(client, self._loop)
+        # Memory summaries go through the same bridge, so stop() cancels them as well
+        self.agent.client = self.bridge
+        self.agent.memory.client = self.bridge
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="iris-step")
+        stop_waiter = asyncio.ensure_future(self._stop_event.wait())
+        step = None
+        try:
+            while not self._stop_event.is_set():
+                step = self._loop.run_in_executor(executor, self.agent.step, self.log_callback)
+                await asyncio.wait({step, stop_waiter}, return_when=asyncio.FIRST_COMPLETED)
+                if not step.done():
+                    break
+                feedback = step.result()
+                if "[Max Steps Reached]" in feedback or "[Task Completed]" in feedback:
+                    self.final_feedback = feedback
+                    break
+        finally:
+            stop_waiter.cancel()
+            if self.stop_requested:
+                # Cancels the step's model request and any memory summary in flight
+                self.bridge.cancel()
+            if step is not None and not step.done():
+                # Actions are not interruptible; the step ends as soon as its model request is cancelled
+                await asyncio.wait({step}, timeout=self._remaining())
+            step_finished = step is None or step.done()
+            await self._flush(step_finished)
+            self.bridge.cancel()
+            if step_finished:
+                # A step still running past the deadline may be using the screen grabber
+                closing = self._loop.run_in_executor(None, self.agent.close)
+                await asyncio.wait({closing}, timeout=self._remaining())
+            executor.shutdown(wait=False)
+            if self.async_client is None:
+                await asyncio.wait({asyncio.ensure_future(client.close())}, timeout=self._remaining())
+        return self.final_feedback
+
+    async def _flush(self, step_finished):
+        def flush():
+            memory = self.agent.memory
+            # A finished run keeps a running background summary if it lands in time; after
+            # stop() it was cancelled and its steps stay in short memory
+            memory.wait_for_compression(timeout=self._remaining())
+            # Token rates are only saved periodically while running
+            memory.save_token_calibration()
+            if step_finished:
+                # A step still running past the deadline would leave half a step in the files
+                self.agent.save_macro()
+                self.agent.save_checkpoint()
+            if DEBUG_MODE:
+                get_debug_writer().flush()
+
+        flushing = self._loop.run_in_executor(None, flush)
+        done, _ = await asyncio.wait({flushing}, timeout=self._remaining() if self.stop_requested else None)
+        if flushing in done:
+            flushing.result()
+        else:
+            print(f"Stopped without finishing the final flush after {self.stop_timeout:g}s.")
+
+
+if __name__ == "__main__":
+    # python -m scripts.runner
+    from openai import AsyncOpenAI
+
+    from scripts.fake_llm_server import FakeLLMServer
+
+    class SleepyAgent:
+        memory = SimpleNamespace(wait_for_compression=lambda timeout=None: True, save_token_calibration=lambda: None)
+        client = None
+
+        def step(self, log_callback=None):
+            try:
+                self.client.chat.completions.create(model="fake-model", messages=[{"role": "user", "content": "ping"}])
+            except RequestCancelled as e:
+                return f"Error: {e}"
+            return "stepped"
+
+        def save_macro(self):
+            print("Macro saved.")
+
+        def save_checkpoint(self, completed=False):
+            print("Checkpoint saved.")
+
+        def close(self):
+            pass
+
+    async def main():
+        with FakeLLMServer(latency=30) as server:
+            runner = AgentRunner(SleepyAgent(), async_client=AsyncOpenAI(base_url=server.url, api_key="fake"), stop_timeout=2)
+            asyncio.get_running_loop().call_later(0.5, runner.stop)
+            started = time.perf_counter()
+            await runner.run()
+            print(f"Stopped a 30 s model request after {time.perf_counter() - started:.2f} s.")
+
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class ScreenChange:
+    """
+    Changed screen regions between two consecutive captures, in screen pixels. With
+    local_only, only the Local View was compared and changed_fraction is a fraction of it.
+    """
+    regions: tuple
+    changed_fraction: float
+    grid_regions: tuple = ()
+    local_only: bool = False
+
+    @property
+    def changed(self):
+        return bool(self.regions)
+
+
+def screen_fingerprint(image, block_size):
+    """Downsample a screenshot to per-block mean brightness; cheap to keep and compare."""
+    factor = max(1, int(block_size))
+    return np.asarray(image.convert("L").reduce(factor), dtype=np.int16)
+
+
+def _connected_boxes(mask):
+    """
+    Bounding boxes (col0, row0, col1, row1) of 8-connected True blocks, inclusive.
+    Each row is split into runs of consecutive True blocks with numpy, and only the
+    runs are joined in Python, so the cost follows the number of runs rather than the
+    number of changed blocks.
+    """
+    rows, cols = mask.shape
+    edges = np.diff(np.pad(mask, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+    run_rows, starts = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[1] - 1
+    if not len(starts):
+        return []
+
+    # Runs in row-major keys; a run touches the runs of the next row that overlap it widened by one block
+    width = cols + 2
+    start_keys = run_rows * width + starts
+    end_keys = run_rows * width + ends
+    first = np.searchsorted(end_keys, (run_rows + 1) * width + starts - 1, side="left")
+    last = np.searchsorted(start_keys, (run_rows + 1) * width + ends + 1, side="right")
+    counts = np.maximum(0, last - first)
+    sources = np.repeat(np.arange(len(starts)), counts)
+    targets = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+    parent = list(range(len(starts)))
+
+    def find(run):
+        while parent[run] != run:
+            parent[run] = parent[parent[run]]
+            run = parent[run]
+        return run
+
+    for source, target in zip(sources.tolist(), targets.tolist()):
+        source, target = find(source), find(target)
+        if source != target:
+            # The earliest run is the root, so boxes come out in row-major order of their first block
+            parent[max(source, target)] = min(source, target)
+
+    roots, labels = np.unique([find(run) for run in range(len(parent))], return_inverse=True)
+    boxes = np.empty((len(roots), 4), dtype=np.int64)
+    boxes[:, :2] = [cols, rows]
+    boxes[:, 2:] = -1
+    np.minimum.at(boxes[:, 0], labels, starts)
+    np.minimum.at(boxes[:, 1], labels, run_rows)
+    np.maximum.at(boxes[:, 2], labels, ends)
+    np.maximum.at(boxes[:, 3], labels, run_rows)
+    return [tuple(int(value) for value in box) for box in boxes]
+
+
+def detect_screen_change(previous, current, block_size, threshold, screen_size, max_regions=5):
+    """
+    Compare two fingerprints and return a ScreenChange, or None when they are not comparable.
+    Regions are sorted by area and capped at max_regions; a mostly changed screen is
+    reported as one region instead of being split into many fragments.
+    """
+    if previous is None or current is None or previous.shape != current.shape:
+        return None
+
+    mask = np.abs(current - previous) > threshold
+    changed_fraction = float(mask.mean()) if mask.size else 0.0
+    if not mask.any():
+        return ScreenChange(regions=(), changed_fraction=0.0)
+
+    if changed_fraction > 0.5:
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        block_boxes = [(int(cols[0]), int(rows[0]), int(cols[-1]), int(rows[-1]))]
+    else:
+        block_boxes = _connected_boxes(mask)
+
+    width, height = screen_size
+    regions = [
+        (
+            col0 * block_size,
+            row0 * block_size,
+            min(width, (col1 + 1) * block_size),
+            min(height, (row1 + 1) * block_size),
+        )
+        for col0, row0, col1, row1 in block_boxes
+    ]
+    regions.sort(key=lambda box: (box[2] - box[0]) * (box[3] - box[1]), reverse=True)
+    return ScreenChange(regions=tuple(regions[:max_regions]), changed_fraction=changed_fraction)
@@ -0,0 +1,91 @@
+import json
+
+
+def _get(value, name, default=None):
+    # Streaming chunks from the OpenAI SDK, or plain dicts from tests and other clients
+    if isinstance(value, dict):
+        return value.get(name, default)
+    return getattr(value, name, default)
+
+
+def _arguments_complete(arguments):
+    try:
+        return isinstance(json.loads(arguments), dict)
+    except (TypeError, ValueError):
+        return False
+
+
+class ToolCallAssembler:
+    """
+    Rebuilds a chat completion from `stream=True` chunks and releases each native tool
+    call as soon as it is complete: when its arguments parse as a JSON object, or when
+    the next tool call starts. Calls still open at the end of the stream are released
+    by finish(), except after a "length" cut-off, where they are left for the caller's
+    truncation handling. response() returns the whole completion in the non-streaming
+    dict shape, with the full assistant text, every tool call and the usage chunk.
+    """
+
+    def __init__(self):
+        self.content_parts = []
+        self.tool_calls = []
+        self.finish_reason = None
+        self.usage = None
+        self._released = 0
+
+    def feed(self, chunk):
+        """Add one chunk; returns the tool calls it completed, in order."""
+        usage = _get(chunk, "usage")
+        if usage is not None:
+            self.usage = usage
+        for choice in _get(chunk, "choices") or []:
+            delta = _get(choice, "delta") or {}
+            content = _get(delta, "content")
+            if content:
+                self.content_parts.append(content)
+            for tool_delta in _get(delta, "tool_calls") or []:
+                self._add_tool_delta(tool_delta)
+            if _get(choice, "finish_reason"):
+                self.finish_reason = _get(choice, "finish_reason")
+        return self._release(final=False)
+
+    def _add_tool_delta(self, tool_delta):
+        index = _get(tool_delta, "index")
+        if index is None:
+            index = len(self.tool_calls) - 1 if self.tool_calls and not _get(tool_delta, "id") else len(self.tool_calls)
+        while len(self.tool_calls) <= index:
+            self.tool_calls.append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+        tool_call = self.tool_calls[index]
+        if _get(tool_delta, "id"):
+            tool_call["id"] = _get(tool_delta, "id")
+        function = _get(tool_delta, "function") or {}
+        if _get(function, "name"):
+            tool_call["function"]["name"] += _get(function, "name")
+        if _get(function, "arguments"):
+            tool_call["function"]["arguments"] += _get(function, "arguments")
+
+    def _release(self, final):
+        released = []
+        while self._released < len(self.tool_calls):
+            tool_call = self.tool_calls[self._released]
+            followed = self._released + 1 < len(self.tool_calls)
+            complete = tool_call["function"]["name"] and _arguments_complete(tool_call["function"]["arguments"])
+            if not (complete or followed or (final and self.finish_reason != "length")):
+                break
+            released.append(tool_call)
+            self._released += 1
+        return released
+
+    def finish(self):
+        """Tool calls still open when the stream ended."""
+        return self._release(final=True)
+
+    @property
+    def content(self):
+        return "".join(self.content_parts)
+
+    def response(self):
+        message = {"role": "assistant", "content": self.content or None, "tool_calls": list(self.tool_calls)}
+        return {
+            "choices": [{"index": 0, "finish_reason": self.finish_reason, "message": message}],
+            "usage": self.usage,
+        }
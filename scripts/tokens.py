@@ -0,0 +1,225 @@
+import json
+import os
+import re
+import threading
+import time
+
+
+# Non-ASCII characters that still count as whitespace (NBSP, ideographic space, ...)
+_NON_ASCII_SPACE = re.compile(r"[^\S\x00-\x7f]")
+
+
+def count_text(text):
+    """
+    Split text into (ascii_chars, other_chars). ASCII characters and whitespace are
+    priced at 1/chars_per_token tokens each, every other character at one token.
+    All counting runs in C: str.isascii() short-circuits plain text, and mixed text
+    is split with an ASCII encode and a regex.
+    """
+    text = str(text)
+    if text.isascii():
+        return len(text), 0
+    ascii_chars = len(text.encode("ascii", "ignore")) + len(_NON_ASCII_SPACE.findall(text))
+    return ascii_chars, len(text) - ascii_chars
+
+
+def tokens_for_counts(ascii_chars, other_chars, chars_per_token):
+    return int(ascii_chars / max(1.0, chars_per_token)) + other_chars
+
+
+class TokenCountedLayer(list):
+    """
+    A memory layer (list of message dicts) that caches each entry's character counts
+    and keeps the layer totals up to date on append and removal, so budget checks do
+    not re-read the whole history every step. The counts are priced on demand by
+    `to_tokens(ascii_chars, other_chars)`, so a recalibrated chars-per-token applies
+    to the whole layer at once. Entries are treated as immutable once added; replace
+    an entry instead of editing its content in place.
+    """
+
+    def __init__(self, steps=(), measure=None, to_tokens=None):
+        super().__init__(steps)
+        self.measure = measure
+        self.to_tokens = to_tokens
+        self._recount()
+
+    @property
+    def total_tokens(self):
+        return self.to_tokens(self.ascii_chars, self.other_chars)
+
+    def _add(self, counts, sign):
+        self.ascii_chars += sign * counts[0]
+        self.other_chars += sign * counts[1]
+
+    def append(self, step):
+        counts = self.measure(step)
+        super().append(step)
+        self._counts.append(counts)
+        self._add(counts, 1)
+
+    def extend(self, steps):
+        for step in steps:
+            self.append(step)
+
+    def insert(self, index, step):
+        counts = self.measure(step)
+        super().insert(index, step)
+        self._counts.insert(index, counts)
+        self._add(counts, 1)
+
+    def pop(self, index=-1):
+        step = super().pop(index)
+        self._add(self._counts.pop(index), -1)
+        return step
+
+    def clear(self):
+        super().clear()
+        self._recount()
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        removed = self._counts[index] if isinstance(index, slice) else [self._counts[index]]
+        del self._counts[index]
+        for counts in removed:
+            self._add(counts, -1)
+
+    # Rarely used mutators: apply, then re-measure the whole layer
+    def _recount(self):
+        self._counts = [self.measure(step) for step in self]
+        self.ascii_chars = sum(counts[0] for counts in self._counts)
+        self.other_chars = sum(counts[1] for counts in self._counts)
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._recount()
+
+    def __iadd__(self, steps):
+        self.extend(steps)
+        return self
+
+    def __imul__(self, count):
+        super().__imul__(count)
+        self._recount()
+        return self
+
+    def remove(self, step):
+        self.pop(self.index(step))
+
+    def reverse(self):
+        super().reverse()
+        self._counts.reverse()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._recount()
+
+
+# A prior observation: this many ASCII characters priced at the configured chars-per-token
+_PRIOR_CHARS = 4000.0
+
+
+class TokenCalibration:
+    """
+    Learns chars-per-token and tokens-per-image from the usage the API reports.
+
+    Each observation is (ascii_chars, other_chars, images, tokens) for one request or
+    completion, fitted as tokens - other_chars = ascii_chars / chars_per_token
+    + images * image_tokens by exponentially weighted least squares. The configured
+    values enter as one pseudo-observation each, so a handful of requests cannot
+    swing the estimate far and an unseen model starts from the configuration.
+    Fits are kept per model and persisted to `path` as JSON: `save_if_due()` writes at
+    most once every `save_interval` seconds, `save()` writes any unsaved observations.
+    """
+
+    FIELDS = ("count", "aa", "ak", "kk", "ay", "ky")
+
+    def __init__(self, path=None, model=None, decay=0.95, prior_weight=1.0, save_interval=0.0):
+        self.path = path
+        self.model = model or "default"
+        self.decay = decay
+        self.prior_weight = prior_weight
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._sums = dict.fromkeys(self.FIELDS, 0.0)
+        self._models = {}
+        self.load()
+
+    @property
+    def observations(self):
+        return int(self._sums["count"])
+
+    def observe(self, ascii_chars, other_chars, images, tokens):
+        target = tokens - other_chars
+        if tokens <= 0 or target <= 0 or ascii_chars + images <= 0:
+            return
+        with self._lock:
+            sums = self._sums
+            for key in self.FIELDS[1:]:
+                sums[key] *= self.decay
+            sums["count"] += 1
+            sums["aa"] += ascii_chars * ascii_chars
+            sums["ak"] += ascii_chars * images
+            sums["kk"] += images * images
+            sums["ay"] += ascii_chars * target
+            sums["ky"] += images * target
+            self._dirty = True
+
+    def rates(self, chars_per_token, image_tokens):
+        """Calibrated (chars_per_token, image_tokens), starting from the configured values."""
+        with self._lock:
+            sums = dict(self._sums)
+        if not sums["count"]:
+            return chars_per_token, image_tokens
+
+        weight = self.prior_weight
+        aa = sums["aa"] + weight * _PRIOR_CHARS * _PRIOR_CHARS
+        ak = sums["ak"]
+        kk = sums["kk"] + weight
+        ay = sums["ay"] + weight * _PRIOR_CHARS * _PRIOR_CHARS / max(1.0, chars_per_token)
+        ky = sums["ky"] + weight * image_tokens
+        determinant = aa * kk - ak * ak
+        if determinant <= 0:
+            return chars_per_token, image_tokens
+        tokens_per_char = (ay * kk - ak * ky) / determinant
+        per_image = (aa * ky - ak * ay) / determinant
+        calibrated_chars = 1.0 / tokens_per_char if tokens_per_char > 0 else 12.0
+        return min(12.0, max(1.0, calibrated_chars)), min(20000.0, max(0.0, per_image))
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._models = dict(data.get("models", {}))
+            saved = self._models.get(self.model, {})
+            self._sums = {key: float(saved.get(key, 0.0)) for key in self.FIELDS}
+        except Exception as e:
+            print(f"Ignored unreadable token calibration {self.path}: {e}")
+
+    def save_if_due(self):
+        """Save unless the last save was less than `save_interval` seconds ago."""
+        if time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        # Parallel summaries save concurrently; the lock also keeps them off each other's temp file
+        with self._lock:
+            self._dirty = False
+            self._saved_at = time.monotonic()
+            self._models[self.model] = dict(self._sums)
+            data = {"models": dict(self._models)}
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                temp_path = f"{self.path}.tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=2, sort_keys=True)
+                os.replace(temp_path, self.path)
+            except Exception as e:
+                print(f"Failed to save token calibration: {e}")
@@ -1,10 +1,17 @@
 import time
 import os
 import math
+from collections.abc import Mapping
+from dataclasses import dataclass, replace
 from datetime import datetime
 from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont
+from scripts.capture import ScreenCapture
 from scripts.config import *
+from scripts.debug_writer import get_debug_writer
+from scripts.frame import VIEWS, CapturedFrame
+from scripts.image_encoding import configured_view_encodings
+from scripts.screen_change import detect_screen_change, screen_fingerprint
 from scripts.terminal_input import prompt_for_user_input
 from scripts.utils import DISPLAY_BOX_WIDTH, colorize_terminal, format_status_box
 import pyautogui
@@ -25,14 +32,267 @@ def _load_label_font(size):
     return ImageFont.load_default()
 
 
+@dataclass(frozen=True)
+class GridOverlay:
+    """Pre-rendered border, labels and grid lines for one view geometry."""
+    size: tuple
+    padding: int
+    border_patches: tuple
+    line_patches: tuple
+
+
+def _draw_centered_text(draw, center_x, center_y, text, font, fill="black"):
+    bbox = draw.textbbox((0, 0), text, font=font)
+    text_w = bbox[2] - bbox[0]
+    text_h = bbox[3] - bbox[1]
+    draw.text(
+        (center_x - text_w / 2 - bbox[0], center_y - text_h / 2 - bbox[1]),
+        text,
+        fill=fill,
+        font=font,
+    )
+
+
+def _draw_corner_prefix_labels(draw, prefix, padding, width, height, font):
+    label = str(prefix).upper()
+    centers = (
+        (padding // 2, padding // 2),
+        (width - padding // 2, padding // 2),
+        (padding // 2, height - padding // 2),
+        (width - padding // 2, height - padding // 2),
+    )
+    for center_x, center_y in centers:
+        _draw_centered_text(draw, center_x, center_y, label, font, fill="black")
+
+
+def _grid_axis_range(anchor, size, step, anchor_index):
+    """
+    Return the first and last label index of one grid axis.
+    Labels are contiguous: the axis runs from the anchor outwards in both directions,
+    stopping at the image edges and never producing negative labels.
+    """
+    min_delta = max(math.ceil((0 - anchor) / step), -anchor_index)
+    max_delta = math.floor((size - anchor) / step)
+    return anchor_index + min_delta, anchor_index + max_delta
+
+
+def _grid_axis_positions(anchor, size, step, anchor_index):
+    first, last = _grid_axis_range(anchor, size, step, anchor_index)
+    return [(index, anchor + (index - anchor_index) * step) for index in range(first, last + 1)]
+
+
+def _parse_point_id(point_id):
+    if not isinstance(point_id, str):
+        return None
+    parts = point_id.split("-")
+    if len(parts) != 3 or not all(part.isascii() and part.isdigit() for part in parts[1:]):
+        return None
+    prefix, col, row = parts[0], int(parts[1]), int(parts[2])
+    # Only the canonical two-digit form is a valid ID, e.g. G-05-03 but not G-5-3.
+    if point_id != f"{prefix}-{col:02d}-{row:02d}":
+        return None
+    return prefix, col, row
+
+
+@dataclass(frozen=True)
+class GridGeometry:
+    """Arithmetic description of one labelled grid; points are never enumerated up front."""
+    prefix: str
+    step: int
+    width: int
+    height: int
+    offset_x: int = 0
+    offset_y: int = 0
+    anchor_x: int = 0
+    anchor_y: int = 0
+    anchor_col: int = 0
+    anchor_row: int = 0
+
+    def columns(self):
+        return _grid_axis_range(self.anchor_x, self.width, self.step, self.anchor_col)
+
+    def rows(self):
+        return _grid_axis_range(self.anchor_y, self.height, self.step, self.anchor_row)
+
+    def resolve(self, col, row):
+        """Map a column/row label to global screen coordinates, or None when off the grid."""
+        first_col, last_col = self.columns()
+        first_row, last_row = self.rows()
+        if not (first_col <= col <= last_col and first_row <= row <= last_row):
+            return None
+        x = self.anchor_x + (col - self.anchor_col) * self.step
+        y = self.anchor_y + (row - self.anchor_row) * self.step
+        # Points on the far edge are clamped onto the last image pixel
+        x = min(x, max(0, self.width - 1))
+        y = min(y, max(0, self.height - 1))
+        return self.offset_x + x, self.offset_y + y
+
+
+class GridResolver(Mapping):
+    """
+    Read-only mapping from grid point IDs to global screen coordinates.
+    IDs are parsed and resolved arithmetically on lookup, so building one per step
+    costs nothing proportional to the screen size. Later grids win on duplicate prefixes.
+    """
+
+    def __init__(self, *grids):
+        self.grids = tuple(grids)
+
+    def _effective_grids(self):
+        return [
+            grid for index, grid in enumerate(self.grids)
+            if all(later.prefix != grid.prefix for later in self.grids[index + 1:])
+        ]
+
+    def __getitem__(self, point_id):
+        parsed = _parse_point_id(point_id)
+        if parsed:
+            prefix, col, row = parsed
+            grid = next((grid for grid in reversed(self.grids) if grid.prefix == prefix), None)
+            point = grid.resolve(col, row) if grid else None
+            if point is not None:
+                return point
+        raise KeyError(point_id)
+
+    def __iter__(self):
+        for grid in self._effective_grids():
+            first_col, last_col = grid.columns()
+            first_row, last_row = grid.rows()
+            for col in range(first_col, last_col + 1):
+                for row in range(first_row, last_row + 1):
+                    yield f"{grid.prefix}-{col:02d}-{row:02d}"
+
+    def __len__(self):
+        total = 0
+        for grid in self._effective_grids():
+            first_col, last_col = grid.columns()
+            first_row, last_row = grid.rows()
+            total += max(0, last_col - first_col + 1) * max(0, last_row - first_row + 1)
+        return total
+
+    def __repr__(self):
+        return f"GridResolver({', '.join(repr(grid) for grid in self.grids)})"
+
+
+def _render_grid_overlay(
+    width, height, step, prefix, anchor_x, anchor_y, anchor_col, anchor_row, grid_color, grid_width, grid_size=None
+):
+    """
+    Render the white labelled border and grid lines once as an RGBA layer.
+    The image area stays transparent so a screenshot can be composited underneath.
+
+    width/height are the image size. grid_size is the (width, height) the grid is laid
+    out in, i.e. screen pixels for a downscaled Global View; lines are projected onto
+    the image and the labels and border shrink with it.
+    """
+    grid_width_px, grid_height_px = grid_size or (width, height)
+    scale_x = width / grid_width_px if grid_width_px else 1.0
+    scale_y = height / grid_height_px if grid_height_px else 1.0
+    scale = min(1.0, scale_x, scale_y)
+    font_size = 32 if prefix == "G" else 16
+    padding = 80 if prefix == "G" else 40
+    if scale < 1.0:
+        font_size = max(12, round(font_size * scale))
+        padding = max(32, round(padding * scale))
+
+    new_width = width + 2 * padding
+    new_height = height + 2 * padding
+    layer = Image.new("RGBA", (new_width, new_height), color="white")
+    layer.paste((0, 0, 0, 0), (padding, padding, padding + width, padding + height))
+    draw = ImageDraw.Draw(layer)
+
+    font = _load_label_font(font_size)
+    _draw_corner_prefix_labels(draw, prefix, padding, new_width, new_height, font)
+
+    columns = [(index, round(x * scale_x)) for index, x in _grid_axis_positions(anchor_x, grid_width_px, step, anchor_col)]
+    rows = [(index, round(y * scale_y)) for index, y in _grid_axis_positions(anchor_y, grid_height_px, step, anchor_row)]
+
+    # Draw vertical lines and X-axis labels on the top and bottom borders
+    for col_index, x in columns:
+        draw_x = x + padding
+        draw.line([(draw_x, padding), (draw_x, new_height - padding)], fill=grid_color, width=grid_width)
+        label = f"{col_index:02d}"
+        _draw_centered_text(draw, draw_x, padding // 2, label, font, fill="black")
+        _draw_centered_text(draw, draw_x, new_height - padding // 2, label, font, fill="black")
+
+    # Draw horizontal lines and Y-axis labels on the left and right borders
+    for row_index, y in rows:
+        draw_y = y + padding
+        draw.line([(padding, draw_y), (new_width - padding, draw_y)], fill=grid_color, width=grid_width)
+        label = f"{row_index:02d}"
+        _draw_centered_text(draw, padding // 2, draw_y, label, font, fill="black")
+        _draw_centered_text(draw, new_width - padding // 2, draw_y, label, font, fill="black")
+
+    # Split the layer into opaque border strips and thin line strips over the image area,
+    # so composing a step only touches the pixels the overlay actually covers.
+    image_box = (padding, padding, padding + width, padding + height)
+    border_boxes = (
+        (0, 0, new_width, padding),
+        (0, padding + height, new_width, new_height),
+        (0, padding, padding, padding + height),
+        (padding + width, padding, new_width, padding + height),
+    )
+    border_patches = tuple(
+        (box[:2], layer.crop(box).convert("RGB")) for box in border_boxes if box[2] > box[0] and box[3] > box[1]
+    )
+    margin = grid_width + 1
+    line_boxes = [(x + padding - margin, image_box[1], x + padding + margin + 1, image_box[3]) for _, x in columns]
+    line_boxes += [(image_box[0], y + padding - margin, image_box[2], y + padding + margin + 1) for _, y in rows]
+    line_patches = []
+    for left, top, right, bottom in line_boxes:
+        box = (max(left, image_box[0]), max(top, image_box[1]), min(right, image_box[2]), min(bottom, image_box[3]))
+        if box[2] > box[0] and box[3] > box[1]:
+            line_patches.append((box[:2], layer.crop(box)))
+
+    return GridOverlay(
+        size=layer.size,
+        padding=padding,
+        border_patches=border_patches,
+        line_patches=tuple(line_patches),
+    )
+
+
+# The global view geometry only changes with the screen size, and the local view
+# only while the crop is truncated at a screen edge, so a few entries cover a run.
+_grid_overlay = lru_cache(maxsize=8)(_render_grid_overlay)
+
+
+def _compose_grid_overlay(image, overlay):
+    canvas = Image.new("RGB", overlay.size, color="white")
+    for position, patch in overlay.border_patches:
+        canvas.paste(patch, position)
+    canvas.paste(image, (overlay.padding, overlay.padding))
+    for position, patch in overlay.line_patches:
+        canvas.paste(patch, position, patch)
+    return canvas
+
+
+def _intersect_boxes(first, second):
+    left, top = max(first[0], second[0]), max(first[1], second[1])
+    right, bottom = min(first[2], second[2]), min(first[3], second[3])
+    return (left, top, right, bottom) if right > left and bottom > top else None
+
+
+def _point_in_box(x, y, box, margin=0):
+    return box[0] - margin <= x < box[2] + margin and box[1] - margin <= y < box[3] + margin
+
+
 class VisionPerceptor:
-    def __init__(self, pre_callback=None, post_callback=None):
+    def __init__(self, pre_callback=None, post_callback=None, overlay_rect=None):
         self.debug_dir = os.path.join(os.path.dirname(__file__), "debug", "screenshot")
         if not os.path.exists(self.debug_dir):
             os.makedirs(self.debug_dir)
         self.pre_callback = pre_callback
         self.post_callback = post_callback
         self.last_capture_files = None
+        self.last_screen_change = None
+        self._previous_fingerprint = None
+        self.screen_capture = ScreenCapture(CAPTURE_BACKEND)
+        self.screen_size = None
+        # Overlay exclusion: returns the live log window's (left, top, right, bottom) on screen, or None
+        self.overlay_rect = overlay_rect
+        self._overlay_backdrop = None
+        self._masked_captures = 0
 
     def _draw_mouse(self, image, local_x, local_y, r=8):
         draw = ImageDraw.Draw(image)
@@ -43,28 +303,6 @@ class VisionPerceptor:
         draw.line((local_x, local_y-r, local_x, local_y+r), fill=MOUSE_COLOR, width=MOUSE_WIDTH)
         return image
 
-    def _draw_centered_text(self, draw, center_x, center_y, text, font, fill="black"):
-        bbox = draw.textbbox((0, 0), text, font=font)
-        text_w = bbox[2] - bbox[0]
-        text_h = bbox[3] - bbox[1]
-        draw.text(
-            (center_x - text_w / 2 - bbox[0], center_y - text_h / 2 - bbox[1]),
-            text,
-            fill=fill,
-            font=font,
-        )
-
-    def _draw_corner_prefix_labels(self, draw, prefix, padding, width, height, font):
-        label = str(prefix).upper()
-        centers = (
-            (padding // 2, padding // 2),
-            (width - padding // 2, padding // 2),
-            (padding // 2, height - padding // 2),
-            (width - padding // 2, height - padding // 2),
-        )
-        for center_x, center_y in centers:
-            self._draw_centered_text(draw, center_x, center_y, label, font, fill="black")
-
     def _draw_grid_with_labels(
         self,
         image,
@@ -76,10 +314,14 @@ class VisionPerceptor:
         anchor_y=0,
         anchor_col=0,
         anchor_row=0,
+        grid_size=None,
     ):
         """
         Draws a grid on the image and adds a white border with labels.
-        Returns the processed image and a dictionary mapping IDs to GLOBAL coordinates.
+        Returns the processed image and a GridResolver mapping IDs to GLOBAL coordinates.
+
+        The border, labels and grid lines come from a cached overlay layer, so only the
+        screenshot paste and the layer composite are paid on every step.
         
         :param image: The PIL image to draw on.
         :param step: Grid step size.
@@ -90,86 +332,56 @@ class VisionPerceptor:
         :param anchor_y: Y coordinate where the grid starts expanding from.
         :param anchor_col: Column label assigned to anchor_x.
         :param anchor_row: Row label assigned to anchor_y.
+        :param grid_size: Screen-pixel size the image was downscaled from; defaults to the image size.
         """
         width, height = image.size
-        font_size = 32 if prefix == "G" else 16
-        padding = 80 if prefix == "G" else 40
-        
-        # Create a new canvas with white border
-        new_width = width + 2 * padding
-        new_height = height + 2 * padding
-        canvas = Image.new('RGB', (new_width, new_height), color='white')
-        
-        # Paste the original image in the center
-        canvas.paste(image, (padding, padding))
-        draw = ImageDraw.Draw(canvas)
-        
-        font = _load_label_font(font_size)
-
-        coordinate_map = {}
-        self._draw_corner_prefix_labels(draw, prefix, padding, new_width, new_height, font)
+        grid_width, grid_height = grid_size or image.size
+        overlay = _grid_overlay(
+            width,
+            height,
+            step,
+            prefix,
+            anchor_x,
+            anchor_y,
+            anchor_col,
+            anchor_row,
+            GRID_COLOR,
+            GRID_WIDTH,
+            (grid_width, grid_height),
+        )
+        grid = GridGeometry(
+            prefix, step, grid_width, grid_height, offset_x, offset_y, anchor_x, anchor_y, anchor_col, anchor_row
+        )
+        return _compose_grid_overlay(image, overlay), GridResolver(grid)
 
-        columns = self._grid_axis_positions(anchor_x, width, step, anchor_col)
-        rows = self._grid_axis_positions(anchor_y, height, step, anchor_row)
+    def _global_view_size(self, width, height):
+        longest = max(width, height)
+        if GLOBAL_MAX_EDGE <= 0 or longest <= GLOBAL_MAX_EDGE:
+            return width, height
+        scale = GLOBAL_MAX_EDGE / longest
+        return max(1, round(width * scale)), max(1, round(height * scale))
 
-        # Draw vertical lines and X-axis labels
-        for col_index, x in columns:
-            # Line on the image
-            draw_x = x + padding
-            draw.line([(draw_x, padding), (draw_x, new_height - padding)], fill=GRID_COLOR, width=GRID_WIDTH)
-            
-            # Label on top border
-            label = f"{col_index:02d}"
-            self._draw_centered_text(draw, draw_x, padding // 2, label, font, fill="black")
-            
-            # Label on bottom border
-            self._draw_centered_text(draw, draw_x, new_height - padding // 2, label, font, fill="black")
-
-        # Draw horizontal lines and Y-axis labels
-        for row_index, y in rows:
-            # Line on the image
-            draw_y = y + padding
-            draw.line([(padding, draw_y), (new_width - padding, draw_y)], fill=GRID_COLOR, width=GRID_WIDTH)
-            
-            # Label on left border
-            label = f"{row_index:02d}"
-            self._draw_centered_text(draw, padding // 2, draw_y, label, font, fill="black")
-            
-            # Label on right border
-            self._draw_centered_text(draw, new_width - padding // 2, draw_y, label, font, fill="black")
-
-        # Generate Coordinate Map
-        # Re-iterate to populate map (or do it in the loops above, but nested is easier for map)
-
-        for c, x in columns:
-            for r, y in rows:
-                # ID format: PREFIX-XX-YY
-                point_id = f"{prefix}-{c:02d}-{r:02d}"
-
-                # Local coordinate on the image (not canvas)
-                local_img_x = min(x, max(0, width - 1))
-                local_img_y = min(y, max(0, height - 1))
-
-                # Global coordinate
-                global_x = offset_x + local_img_x
-                global_y = offset_y + local_img_y
-
-                coordinate_map[point_id] = (global_x, global_y)
-
-        return canvas, coordinate_map
-
-    def _grid_axis_positions(self, anchor, size, step, anchor_index):
-        min_delta = math.ceil((0 - anchor) / step)
-        max_delta = math.floor((size - anchor) / step)
-        positions = []
-        for delta in range(min_delta, max_delta + 1):
-            index = anchor_index + delta
-            if index < 0:
-                continue
-            pos = anchor + delta * step
-            if 0 <= pos <= size:
-                positions.append((index, pos))
-        return positions
+    def _render_global_view(self, screenshot, mouse_x, mouse_y):
+        """
+        Global view uses GRID_STEP and prefix 'G'. With GLOBAL_MAX_EDGE the screenshot is
+        downscaled first; the grid is still laid out in screen pixels, so G IDs keep
+        resolving to real screen coordinates.
+        """
+        view_size = self._global_view_size(*screenshot.size)
+        if view_size == screenshot.size:
+            global_image_raw = screenshot.copy()
+        else:
+            # Area averaging keeps thin text legible and compresses better than bilinear;
+            # reducing_gap lets Pillow take the fast integer reduce() path first.
+            global_image_raw = screenshot.resize(view_size, Image.Resampling.BOX, reducing_gap=1.0)
+        scale_x = view_size[0] / screenshot.width
+        scale_y = view_size[1] / screenshot.height
+
+        # Draw mouse on global view
+        self._draw_mouse(
+            global_image_raw, round(mouse_x * scale_x), round(mouse_y * scale_y), r=max(8, round(16 * scale_x))
+        )
+        return self._draw_grid_with_labels(global_image_raw, GRID_STEP, "G", 0, 0, grid_size=screenshot.size)
 
     def _nearest_grid_id(self, x, y, width, height, step, prefix):
         max_col = len(range(0, width + 1, step)) - 1
@@ -178,13 +390,77 @@ class VisionPerceptor:
         row = max(0, min(round(y / step), max_row))
         return f"{prefix}-{col:02d}-{row:02d}"
 
-    def _crop_local_view(self, screenshot, mouse_x, mouse_y):
+    def _update_screen_change(self, screenshot):
+        """
+        Compare this capture with the previous one and store the result in last_screen_change.
+        Regions are also expressed as Global View grid ranges, since the model never sees raw coordinates.
+        """
+        fingerprint = screen_fingerprint(screenshot, CHANGE_BLOCK_SIZE)
+        change = detect_screen_change(
+            getattr(self, "_previous_fingerprint", None),
+            fingerprint,
+            CHANGE_BLOCK_SIZE,
+            CHANGE_THRESHOLD,
+            screenshot.size,
+        )
+        self._previous_fingerprint = fingerprint
+        self.last_screen_change = self._with_grid_regions(change, screenshot.size)
+        return self.last_screen_change
+
+    def _update_local_screen_change(self, local_image, left, top):
+        """
+        Compare a local-only capture with the same blocks of the last full-screen fingerprint,
+        so a change (or a missing one) inside the Local View is still reported. Changes
+        outside the Local View are not seen until the next full capture.
+        """
+        previous = getattr(self, "_previous_fingerprint", None)
+        block = CHANGE_BLOCK_SIZE
+        # Only whole fingerprint blocks inside the crop can be compared
+        col0, row0 = -(-left // block), -(-top // block)
+        col1, row1 = (left + local_image.width) // block, (top + local_image.height) // block
+        if previous is None or col1 <= col0 or row1 <= row0:
+            self.last_screen_change = None
+            return None
+        x0, y0 = col0 * block - left, row0 * block - top
+        compared = local_image.crop((x0, y0, x0 + (col1 - col0) * block, y0 + (row1 - row0) * block))
+        fingerprint = screen_fingerprint(compared, block)
+        window = (slice(row0, row1), slice(col0, col1))
+        change = detect_screen_change(previous[window], fingerprint, block, CHANGE_THRESHOLD, compared.size)
+        if change is not None:
+            # The next full capture is compared against what was last seen here
+            previous[window] = fingerprint
+            offset_x, offset_y = col0 * block, row0 * block
+            regions = tuple(
+                (region_left + offset_x, region_top + offset_y, region_right + offset_x, region_bottom + offset_y)
+                for region_left, region_top, region_right, region_bottom in change.regions
+            )
+            change = replace(change, regions=regions, local_only=True)
+        self.last_screen_change = self._with_grid_regions(change, self.screen_size)
+        return self.last_screen_change
+
+    def _with_grid_regions(self, change, screen_size):
+        if change is None:
+            return None
+        width, height = screen_size
+        grid_regions = tuple(
+            (
+                self._nearest_grid_id(left, top, width, height, GRID_STEP, "G"),
+                self._nearest_grid_id(right, bottom, width, height, GRID_STEP, "G"),
+            )
+            for left, top, right, bottom in change.regions
+        )
+        return replace(change, grid_regions=grid_regions)
+
+    def _local_view_box(self, mouse_x, mouse_y, width, height):
         crop_half = CROP_SIZE // 2
         left = max(0, mouse_x - crop_half)
         top = max(0, mouse_y - crop_half)
-        right = min(screenshot.width, mouse_x + crop_half)
-        bottom = min(screenshot.height, mouse_y + crop_half)
+        right = min(width, mouse_x + crop_half)
+        bottom = min(height, mouse_y + crop_half)
+        return left, top, right, bottom
 
+    def _crop_local_view(self, screenshot, mouse_x, mouse_y):
+        left, top, right, bottom = self._local_view_box(mouse_x, mouse_y, screenshot.width, screenshot.height)
         local_image = screenshot.crop((left, top, right, bottom))
         local_mouse_x = mouse_x - left
         local_mouse_y = mouse_y - top
@@ -196,9 +472,61 @@ class VisionPerceptor:
         row = max(0, round(crop_half / LOCAL_GRID_STEP))
         return f"L-{col:02d}-{row:02d}", col, row
 
-    def _capture_screenshot(self):
+    def _overlay_exclusion(self, capture_box):
+        """
+        Decide how to keep the log window out of a capture of capture_box.
+        Returns (hide, mask_box, rect): hide the window first, or paste the remembered
+        backdrop over mask_box; rect is the window rectangle read for this capture.
+        Without an overlay_rect provider the window is always hidden, as before.
+        """
+        provider = getattr(self, "overlay_rect", None)
+        if provider is None:
+            return True, None, None
+        rect = provider()
+        if rect is None:
+            return False, None, None
+        rect = tuple(rect)
+        if capture_box is None:
+            return True, None, rect
+        mask_box = _intersect_boxes(rect, capture_box)
+        if mask_box is None:
+            return False, None, rect
+        backdrop = getattr(self, "_overlay_backdrop", None)
+        if backdrop and backdrop[0] == rect and self._masked_captures < OVERLAY_MASK_REFRESH_STEPS:
+            return False, mask_box, rect
+        # No usable backdrop yet, the window moved, or the backdrop is due for a refresh
+        return True, None, rect
+
+    def _remember_overlay_backdrop(self, screenshot, rect):
+        box = _intersect_boxes(rect, (0, 0, screenshot.width, screenshot.height)) if rect else None
+        if box is None:
+            return
+        self._overlay_backdrop = (rect, box, screenshot.crop(box))
+        self._masked_captures = 0
+
+    def _mask_overlay(self, image, mask_box, origin_x=0, origin_y=0):
+        """Paste the pixels last seen under the window over mask_box; image starts at (origin_x, origin_y) on screen."""
+        _, backdrop_box, backdrop = self._overlay_backdrop
+        box = _intersect_boxes(mask_box, backdrop_box)
+        if box is None:
+            return image
+        patch = backdrop.crop((box[0] - backdrop_box[0], box[1] - backdrop_box[1], box[2] - backdrop_box[0], box[3] - backdrop_box[1]))
+        image.paste(patch, (box[0] - origin_x, box[1] - origin_y))
+        self._masked_captures += 1
+        return image
+
+    def close(self):
+        """Close the screen grabber and its thread; a later capture opens a new one."""
+        screen_capture = getattr(self, "screen_capture", None)
+        self.screen_capture = None
+        if screen_capture is not None:
+            screen_capture.close()
+
+    def _capture_screenshot(self, region=None):
+        if getattr(self, "screen_capture", None) is None:
+            self.screen_capture = ScreenCapture(CAPTURE_BACKEND)
         try:
-            return pyautogui.screenshot()
+            return self.screen_capture.grab(region)
         except FileNotFoundError as e:
             missing_path = f" Missing path: {e.filename}." if getattr(e, "filename", None) else ""
             raise RuntimeError(
@@ -210,30 +538,61 @@ class VisionPerceptor:
         except Exception as e:
             raise RuntimeError(f"Unable to capture screenshot: {e}") from e
 
-    def capture_state(self, mouse_x, mouse_y):
+    def capture_state(self, mouse_x, mouse_y, local_only=False):
+        """
+        Capture the Global and Local views around the mouse and return them as a CapturedFrame.
+        With local_only, only the Local View region is grabbed from the screen and the
+        returned global image is None. This needs the screen size from an earlier full
+        capture; without one, a full capture is taken instead.
+        """
         self.last_capture_files = None
-        if self.pre_callback:
+        self.last_screen_change = None
+        screen_size = getattr(self, "screen_size", None)
+        local_only = bool(local_only and screen_size)
+        if local_only:
+            width, height = screen_size
+            mouse_x = max(0, min(mouse_x, width - 1))
+            mouse_y = max(0, min(mouse_y, height - 1))
+            left, top, right, bottom = self._local_view_box(mouse_x, mouse_y, width, height)
+            capture_box = (left, top, right, bottom)
+        else:
+            capture_box = (0, 0, *screen_size) if screen_size else None
+        hide_overlay, mask_box, overlay_rect = self._overlay_exclusion(capture_box)
+        if hide_overlay and self.pre_callback:
             self.pre_callback()
 
         try:
-            # Capture screenshot
-            screenshot = self._capture_screenshot()
-
-            # Ensure mouse coordinates are within screenshot bounds.
-            # This handles multi-monitor setups where mouse might be outside the primary screen.
-            mouse_x = max(0, min(mouse_x, screenshot.width - 1))
-            mouse_y = max(0, min(mouse_y, screenshot.height - 1))
-
-            # 1. Generate Global View
-            # Global view uses GRID_STEP and prefix 'G'
-            global_image_raw = screenshot.copy()
-
-            # Draw mouse on global view
-            self._draw_mouse(global_image_raw, mouse_x, mouse_y, r=16)
-            global_image, global_map = self._draw_grid_with_labels(global_image_raw, GRID_STEP, "G", 0, 0)
+            if local_only:
+                # Capture only the Local View region
+                local_image_raw = self._capture_screenshot((left, top, right - left, bottom - top))
+                if mask_box:
+                    self._mask_overlay(local_image_raw, mask_box, left, top)
+                self._update_local_screen_change(local_image_raw, left, top)
+                local_mouse_x = mouse_x - left
+                local_mouse_y = mouse_y - top
+                global_image = None
+                global_map = GridResolver(GridGeometry("G", GRID_STEP, width, height))
+            else:
+                # Capture screenshot
+                screenshot = self._capture_screenshot()
+                if mask_box:
+                    self._mask_overlay(screenshot, mask_box)
+                elif hide_overlay and overlay_rect:
+                    self._remember_overlay_backdrop(screenshot, overlay_rect)
+                self.screen_size = width, height = screenshot.size
+                self._update_screen_change(screenshot)
+
+                # Ensure mouse coordinates are within screenshot bounds.
+                # This handles multi-monitor setups where mouse might be outside the primary screen.
+                mouse_x = max(0, min(mouse_x, screenshot.width - 1))
+                mouse_y = max(0, min(mouse_y, screenshot.height - 1))
+
+                # 1. Generate Global View
+                global_image, global_map = self._render_global_view(screenshot, mouse_x, mouse_y)
+
+                # 2. Generate Local View. The crop stops at the screen edge; no off-screen area is padded.
+                local_image_raw, left, top, local_mouse_x, local_mouse_y = self._crop_local_view(screenshot, mouse_x, mouse_y)
 
-            # 2. Generate Local View. The crop stops at the screen edge; no off-screen area is padded.
-            local_image_raw, left, top, local_mouse_x, local_mouse_y = self._crop_local_view(screenshot, mouse_x, mouse_y)
             mouse_grid_id, local_mouse_col, local_mouse_row = self._local_mouse_grid_id()
 
             # Local view uses LOCAL_GRID_STEP and prefix 'L'
@@ -253,39 +612,75 @@ class VisionPerceptor:
                 anchor_row=local_mouse_row,
             )
 
-            # Merge maps
-            full_coordinate_map = {**global_map, **local_map}
+            # Merge maps. G IDs stay resolvable in local-only steps because the screen geometry is unchanged.
+            full_coordinate_map = GridResolver(*global_map.grids, *local_map.grids)
 
             nearest_global_grid_id = self._nearest_grid_id(
                 mouse_x,
                 mouse_y,
-                screenshot.width,
-                screenshot.height,
+                width,
+                height,
                 GRID_STEP,
                 "G",
             )
 
-            # Debug archive
+            frame = CapturedFrame(global_image, local_image, full_coordinate_map, mouse_grid_id, nearest_global_grid_id)
+
+            # Debug archive. Views are saved with the upload encoding on the debug writer thread,
+            # and the request reuses the bytes it encodes.
             if DEBUG_MODE:
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-                global_file = f"global_{timestamp}.png"
-                local_file = f"local_{timestamp}.png"
-                global_path = os.path.join(self.debug_dir, global_file)
-                local_path = os.path.join(self.debug_dir, local_file)
-                global_image.save(global_path)
-                local_image.save(local_path)
-                self.last_capture_files = {"global": global_file, "local": local_file}
-
-            return global_image, local_image, full_coordinate_map, mouse_grid_id, nearest_global_grid_id
+                writer = get_debug_writer()
+                self.last_capture_files = {}
+                for view, encoding in zip(VIEWS, configured_view_encodings()):
+                    if frame.image(view) is None:
+                        continue
+                    filename = frame.filename(view, encoding, timestamp)
+                    writer.write_file(
+                        os.path.join(self.debug_dir, filename),
+                        lambda view=view, encoding=encoding: frame.encoded(view, encoding),
+                    )
+                    self.last_capture_files[view] = filename
+
+            return frame
+        finally:
+            if hide_overlay and self.post_callback:
+                self.post_callback()
+
+    def region_fingerprint(self, x, y, size=MACRO_VERIFY_SIZE, block_size=8):
+        """
+        Block brightness fingerprint of the size x size region centred on (x, y), cut at
+        the screen edge. Macro replay compares it against the recording before a click;
+        the log window is kept out of the grab the same way as for captures.
+        """
+        half = max(1, size // 2)
+        # Macro replay can run before any full capture has recorded the screen size
+        screen_size = getattr(self, "screen_size", None) or tuple(pyautogui.size())
+        x = max(0, min(x, screen_size[0] - 1))
+        y = max(0, min(y, screen_size[1] - 1))
+        left, top = max(0, x - half), max(0, y - half)
+        right, bottom = min(x + half, screen_size[0]), min(y + half, screen_size[1])
+        hide_overlay, mask_box, _ = self._overlay_exclusion((left, top, right, bottom))
+        if hide_overlay and self.pre_callback:
+            self.pre_callback()
+        try:
+            image = self._capture_screenshot((left, top, right - left, bottom - top))
+            if mask_box:
+                self._mask_overlay(image, mask_box, left, top)
+            return screen_fingerprint(image, block_size)
         finally:
-            if self.post_callback:
+            if hide_overlay and self.post_callback:
                 self.post_callback()
 
 
 class ActionExecutor:
-    def __init__(self, pre_callback=None, post_callback=None):
+    # Actions that act at the pointer; only these can land on the live log window
+    POINTER_ACTIONS = {"move", "click", "double_click", "mouse_down", "mouse_up", "scroll"}
+
+    def __init__(self, pre_callback=None, post_callback=None, overlay_rect=None):
         self.pre_callback = pre_callback
         self.post_callback = post_callback
+        self.overlay_rect = overlay_rect
         # Initialize mouse position
         try:
             self.mouse_x, self.mouse_y = pyautogui.position()
@@ -322,15 +717,37 @@ class ActionExecutor:
             
         return self.mouse_x, self.mouse_y
 
+    def _action_needs_overlay_hide(self, action_dict, coordinate_map=None):
+        """
+        Without an overlay_rect provider every action hides the window, as before. With one
+        (mask mode), only pointer actions whose target lies on the window need it hidden.
+        """
+        action_type = action_dict.get("action_type")
+        if action_type == "ask_input":
+            return False
+        provider = getattr(self, "overlay_rect", None)
+        if provider is None:
+            return True
+        rect = provider()
+        if rect is None or action_type not in self.POINTER_ACTIONS:
+            return False
+        x, y = self.mouse_x, self.mouse_y
+        if action_type == "move":
+            point_id = action_dict.get("point_id")
+            if not coordinate_map or point_id not in coordinate_map:
+                return False
+            x, y = coordinate_map[point_id]
+        return _point_in_box(x, y, rect, margin=2)
+
     def execute(self, action_dict, coordinate_map=None, log_callback=None):
         action_type = action_dict.get("action_type")
-        is_user_input = action_type == "ask_input"
-        if self.pre_callback and not is_user_input:
+        hide_overlay = self._action_needs_overlay_hide(action_dict, coordinate_map)
+        if self.pre_callback and hide_overlay:
             self.pre_callback()
         try:
             return self._execute_action(action_dict, coordinate_map, log_callback=log_callback)
         finally:
-            if self.post_callback and not is_user_input:
+            if self.post_callback and hide_overlay:
                 self.post_callback()
             if ACTION_SETTLE_SECONDS > 0 and action_type not in {"wait", "ask_input"}:
                 time.sleep(ACTION_SETTLE_SECONDS)
@@ -489,14 +906,15 @@ if __name__ == "__main__":
         print("Testing VisionPerceptor...")
         vision = VisionPerceptor()
         # Need to pass mouse coordinates now
-        global_img, local_img, coord_map, mouse_id, nearest_global_id = vision.capture_state(500, 500)
+        frame = vision.capture_state(500, 500)
         print(f"Capture successful.")
-        print(f"Global size: {global_img.size}")
-        print(f"Local size: {local_img.size}")
-        print(f"Map size: {len(coord_map)}")
-        print(f"Mouse ID: {mouse_id}")
-        print(f"Nearest Global ID: {nearest_global_id}")
-        print(f"Sample G point: {list(coord_map.keys())[0]} -> {list(coord_map.values())[0]}")
+        print(f"Global size: {frame.global_image.size}")
+        print(f"Local size: {frame.local_image.size}")
+        print(f"Map size: {len(frame.coordinate_map)}")
+        print(f"Mouse ID: {frame.mouse_grid_id}")
+        print(f"Nearest Global ID: {frame.nearest_global_grid_id}")
+        sample_id = next(iter(frame.coordinate_map))
+        print(f"Sample G point: {sample_id} -> {frame.coordinate_map[sample_id]}")
     except Exception as e:
         print(f"VisionPerceptor test failed: {e}")
 
@@ -0,0 +1,185 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from datetime import datetime
+
+
+MAX_HINT_ACTIONS = 40
+MAX_ACTION_CHARS = 120
+MAX_ANSWER_CHARS = 300
+
+# Words that would match almost any task description
+STOPWORDS = {
+    "a", "an", "and", "as", "at", "by", "for", "from", "in", "into", "it", "of", "on", "or",
+    "please", "the", "then", "to", "with",
+}
+
+
+def tokenize(text):
+    """Lowercase ASCII words without stopwords; other scripts (CJK, ...) contribute one token per character."""
+    tokens = []
+    for word in re.findall(r"\w+", str(text).lower()):
+        if word.isascii():
+            if word not in STOPWORDS:
+                tokens.append(word)
+        else:
+            tokens.extend(word)
+    return tokens
+
+
+def compact_action(tool_call):
+    """One line per executed tool call, e.g. `move {"point_id": "G-12-07"}`."""
+    arguments = json.dumps(tool_call.get("arguments", {}), ensure_ascii=False)
+    line = f"{tool_call.get('name', '')} {arguments}"
+    return line if len(line) <= MAX_ACTION_CHARS else line[:MAX_ACTION_CHARS - 3] + "..."
+
+
+def compress_actions(actions):
+    """Collapse consecutive repeats: ["scroll ...", "scroll ..."] -> ["scroll ... x2"]."""
+    compressed = []
+    previous, count = None, 0
+    for action in list(actions) + [None]:
+        if action == previous:
+            count += 1
+            continue
+        if previous is not None:
+            compressed.append(previous if count == 1 else f"{previous} x{count}")
+        previous, count = action, 1
+    return compressed
+
+
+class BM25Index:
+    """Okapi BM25 over short documents (task descriptions)."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(tokenize(document)) for document in documents]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        total = len(self.term_counts)
+        self.idf = {
+            term: math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def scores(self, query):
+        terms = [term for term in set(tokenize(query)) if term in self.idf]
+        results = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / (self.average_length or 1.0))
+            score = 0.0
+            for term in terms:
+                frequency = counts.get(term, 0)
+                if frequency:
+                    score += self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            results.append(score)
+        return results
+
+    def top(self, query, k):
+        """(index, score) of the k best matches with a positive score."""
+        ranked = sorted(enumerate(self.scores(query)), key=lambda item: item[1], reverse=True)
+        return [(index, score) for index, score in ranked[:k] if score > 0]
+
+
+class TrajectoryStore:
+    """
+    Completed runs in an append-only JSONL file: task text, the compressed tool-call
+    sequence, final answer, step count and model calls. Only successful runs are
+    recorded. Identical tasks keep their shortest run in the index, so repeats of one
+    task do not crowd out other similar tasks.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.trajectories = self._load()
+        self._index = None
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return []
+        trajectories = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    trajectories.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return trajectories
+
+    def record(self, task, actions, final_answer, step_count, llm_calls=None, hinted=0):
+        trajectory = {
+            "task": task,
+            "actions": compress_actions(actions),
+            "final_answer": final_answer,
+            "step_count": step_count,
+            "llm_calls": llm_calls,
+            "hinted": hinted,
+            "completed_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(trajectory, ensure_ascii=False) + "\n")
+        self.trajectories.append(trajectory)
+        self._index = None
+        return trajectory
+
+    def _best_per_task(self):
+        best = {}
+        for trajectory in self.trajectories:
+            key = " ".join(tokenize(trajectory.get("task", "")))
+            current = best.get(key)
+            if current is None or trajectory.get("step_count", 0) < current.get("step_count", 0):
+                best[key] = trajectory
+        return list(best.values())
+
+    def similar(self, task, k):
+        """Up to k past trajectories whose task text best matches `task`, best first."""
+        if k <= 0 or not self.trajectories:
+            return []
+        if self._index is None:
+            candidates = self._best_per_task()
+            self._index = (candidates, BM25Index([trajectory["task"] for trajectory in candidates]))
+        candidates, index = self._index
+        return [candidates[position] for position, _ in index.top(task, k)]
+
+
+def format_trajectory_hints(trajectories):
+    """Summarize past runs for the fixed layer. Empty when there is nothing to add."""
+    if not trajectories:
+        return ""
+    sections = []
+    for trajectory in trajectories:
+        actions = trajectory.get("actions", [])
+        shown = actions[:MAX_HINT_ACTIONS]
+        if len(actions) > len(shown):
+            shown = shown + [f"... {len(actions) - len(shown)} more"]
+        answer = str(trajectory.get("final_answer") or "")[:MAX_ANSWER_CHARS]
+        sections.append(
+            f"### Past task ({trajectory.get('step_count', '?')} steps)\n"
+            f"{trajectory.get('task', '')}\n"
+            f"Actions:\n" + "\n".join(f"- {action}" for action in shown)
+            + (f"\nFinal answer: {answer}" if answer else "")
+        )
+    return (
+        "## Hints From Similar Past Runs\n"
+        "These similar tasks were completed before. Reuse the approach where it fits, "
+        "but grid IDs and layouts may differ; always trust the current screenshots.\n\n"
+        + "\n\n".join(sections)
+    )
+
+
+if __name__ == "__main__":
+    # python -m scripts.trajectories "<task>"
+    import sys
+
+    from scripts.config import TRAJECTORY_HINTS, TRAJECTORY_STORE_FILE
+
+    store = TrajectoryStore(TRAJECTORY_STORE_FILE)
+    print(f"{len(store.trajectories)} trajectories in {TRAJECTORY_STORE_FILE}")
+    print(format_trajectory_hints(store.similar(" ".join(sys.argv[1:]), TRAJECTORY_HINTS)) or "No similar runs.")
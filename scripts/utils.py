@@ -6,6 +6,8 @@ import queue
 import re
 import shutil
 import sys
+import threading
+import time
 import unicodedata
 
 logo = """
@@ -147,7 +149,7 @@ def _classify_output_line(line, current_section=None):
             style = "success"
         elif current_section == "Tool Calls":
             style = "tool"
-        elif "Screen captured" in inner or "Nearby global mouse grid" in inner or "Current local mouse grid" in inner:
+        elif "Screen captured" in inner or "Screen change" in inner or "Nearby global mouse grid" in inner or "Current local mouse grid" in inner:
             style = "muted"
 
     return {"kind": "content" if is_box_content else "plain", "text": content, "style": style}, next_section
@@ -207,6 +209,8 @@ def format_agent_loop(
     reasoning="",
     tool_results=None,
     error=None,
+    screen_change=None,
+    local_only=False,
     width=None,
     measure=get_display_width,
 ):
@@ -218,17 +222,14 @@ def format_agent_loop(
         _border("├", "┤", content_width),
     ]
 
-    _section(
-        lines,
-        "Perception",
-        [
-            "Screen captured: Global View + Local View",
-            f"Nearby global mouse grid: {nearest_global_grid_id or '-'}",
-            f"Current local mouse grid: {mouse_grid_id}",
-        ],
-        content_width,
-        measure=measure,
-    )
+    perception = [
+        "Screen captured: Local View only (region capture)" if local_only else "Screen captured: Global View + Local View",
+        f"Nearby global mouse grid: {nearest_global_grid_id or '-'}",
+        f"Current local mouse grid: {mouse_grid_id}",
+    ]
+    if screen_change:
+        perception.append(f"Screen change: {screen_change}")
+    _section(lines, "Perception", perception, content_width, measure=measure)
 
     _section(
         lines,
@@ -330,6 +331,12 @@ class DisplayWindow:
         # Message queue
         self.msg_queue = queue.Queue()
 
+        # Screen rectangle of the window while it is mapped, kept current on the Tk thread
+        # so the agent thread can read it without calling into Tk
+        self._screen_rect = None
+        for sequence in ("<Configure>", "<Map>", "<Unmap>"):
+            self.root.bind(sequence, self._update_screen_rect, add="+")
+
         # Bind ESC key to quit application completely
         self.root.bind("<Escape>", self.quit_app)
         
@@ -340,6 +347,19 @@ class DisplayWindow:
         """Thread-safe logging method"""
         self.msg_queue.put(message)
 
+    def _update_screen_rect(self, event=None):
+        if event is not None and event.widget is not self.root:
+            return
+        if (event is not None and str(event.type) == "Unmap") or not self.root.winfo_ismapped():
+            self._screen_rect = None
+            return
+        left, top = self.root.winfo_rootx(), self.root.winfo_rooty()
+        self._screen_rect = (left, top, left + self.root.winfo_width(), top + self.root.winfo_height())
+
+    def screen_rect(self):
+        """Thread-safe (left, top, right, bottom) of the visible window on screen, or None while hidden."""
+        return self._screen_rect
+
     def _configure_tags(self):
         self.text_widget.tag_configure("box", foreground="#60a5fa")
         self.text_widget.tag_configure("section", foreground="#fbbf24")
@@ -435,6 +455,27 @@ class DisplayWindow:
         """Thread-safe hide window"""
         self.root.after(0, self.hide_window)
 
+    def safe_hide_and_wait(self, timeout=0.5, poll_ms=10):
+        """
+        Thread-safe hide that blocks until Tk reports the window unmapped, or until timeout.
+        Returns True when the unmap was confirmed. Must not be called from the Tk thread.
+        """
+        hidden = threading.Event()
+        deadline = time.monotonic() + timeout
+
+        def poll():
+            if not self.root.winfo_ismapped() or not self.root.winfo_viewable():
+                hidden.set()
+            elif time.monotonic() < deadline:
+                self.root.after(poll_ms, poll)
+
+        def hide_and_poll():
+            self.hide_window()
+            poll()
+
+        self.root.after(0, hide_and_poll)
+        return hidden.wait(timeout)
+
     def safe_unhide(self):
         """Thread-safe show window"""
         self.root.after(0, self.unhide_window)
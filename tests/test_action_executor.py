@@ -17,6 +17,10 @@ os.environ.setdefault("MOUSE_COLOR", "white")
 os.environ.setdefault("MOUSE_WIDTH", "4")
 os.environ.setdefault("MAX_STEPS", "100")
 os.environ.setdefault("DEBUG_MODE", "False")
+os.environ.setdefault("MEMORY_TOKEN_CALIBRATION_FILE", "off")
+os.environ.setdefault("CHECKPOINT_DIR", "off")
+os.environ.setdefault("MACRO_DIR", "off")
+os.environ.setdefault("TRAJECTORY_STORE_FILE", "off")
 os.environ.setdefault("ACTION_SETTLE_SECONDS", "0.2")
 os.environ.setdefault("TYPE_INTERVAL_SECONDS", "0.01")
 os.environ.setdefault("CLIPBOARD_TEXT_THRESHOLD", "30")
@@ -75,6 +79,44 @@ class ActionExecutorTests(unittest.TestCase):
         move_to.assert_called_once()
         sleep.assert_called_once_with(tools.ACTION_SETTLE_SECONDS)
 
+    @patch("scripts.tools.time.sleep")
+    @patch("scripts.tools.pyautogui.moveTo")
+    def test_move_resolves_point_through_grid_resolver(self, move_to, sleep):
+        executor, _ = self.make_executor()
+        resolver = tools.GridResolver(tools.GridGeometry("G", 100, 500, 300))
+
+        result = executor.execute({"action_type": "move", "point_id": "G-02-01"}, resolver)
+        missing = executor.execute({"action_type": "move", "point_id": "G-09-09"}, resolver)
+
+        self.assertEqual(result, "Action move to G-02-01 executed.")
+        self.assertEqual((executor.mouse_x, executor.mouse_y), (200, 100))
+        self.assertEqual(missing, "Error: Point ID 'G-09-09' not found in coordinate map.")
+        move_to.assert_called_once()
+
+    @patch("scripts.tools.time.sleep")
+    @patch("scripts.tools.pyautogui.click")
+    @patch("scripts.tools.pyautogui.moveTo")
+    def test_mask_mode_hides_window_only_for_pointer_targets_on_it(self, move_to, click, sleep):
+        executor, events = self.make_executor()
+        executor.overlay_rect = lambda: (400, 0, 500, 300)
+        coordinate_map = {"G-01-01": (100, 100), "G-04-01": (450, 100)}
+
+        executor.execute({"action_type": "move", "point_id": "G-01-01"}, coordinate_map)
+        executor.execute({"action_type": "click"}, coordinate_map)
+        self.assertEqual(events, [])
+
+        executor.execute({"action_type": "move", "point_id": "G-04-01"}, coordinate_map)
+        executor.execute({"action_type": "click"}, coordinate_map)
+        self.assertEqual(events, ["pre", "post", "pre", "post"])
+
+        with patch("scripts.tools.pyautogui.hotkey"):
+            executor.execute({"action_type": "hotkey", "keys": ["ctrl", "s"]}, coordinate_map)
+        self.assertEqual(len(events), 4)
+
+        executor.overlay_rect = lambda: None
+        executor.execute({"action_type": "click"}, coordinate_map)
+        self.assertEqual(len(events), 4)
+
     @patch("scripts.tools.time.sleep")
     def test_callbacks_run_for_early_error_return(self, sleep):
         executor, events = self.make_executor()
@@ -1,9 +1,11 @@
 import json
 import os
+import threading
 import unittest
 from copy import deepcopy
 from contextlib import redirect_stdout
 from io import StringIO
+from unittest import mock
 
 os.environ.setdefault("LLM_API_ENDPOINT", "http://example.invalid/v1")
 os.environ.setdefault("LLM_API_KEY", "sk-test")
@@ -17,12 +19,19 @@ os.environ.setdefault("MOUSE_COLOR", "white")
 os.environ.setdefault("MOUSE_WIDTH", "4")
 os.environ.setdefault("MAX_STEPS", "100")
 os.environ.setdefault("DEBUG_MODE", "False")
+os.environ.setdefault("MEMORY_TOKEN_CALIBRATION_FILE", "off")
+os.environ.setdefault("CHECKPOINT_DIR", "off")
+os.environ.setdefault("MACRO_DIR", "off")
+os.environ.setdefault("TRAJECTORY_STORE_FILE", "off")
 os.environ.setdefault("MEMORY_SHORT_TOKEN_BUDGET", "128000")
 os.environ.setdefault("MEMORY_LONG_TOKEN_BUDGET", "128000")
 os.environ.setdefault("MEMORY_RECENT_INTERACTIONS_TO_KEEP", "3")
 os.environ.setdefault("MEMORY_CHARS_PER_TOKEN", "4")
 
-from scripts.agent import IrisAgent
+from scripts.agent import IrisAgent, prompt_cache_key
+from scripts.frame import CapturedFrame
+from scripts.overlay import OverlaySession
+from scripts.screen_change import ScreenChange
 
 
 class FakeMemory:
@@ -31,9 +40,15 @@ class FakeMemory:
         self.steps = []
         self.model_inputs = []
         self.model_outputs = []
+        self.timings = []
+        self.usages = []
 
-    def get_full_context(self, query, images=None):
-        self.context_requests.append((query, images))
+    def record_usage(self, messages, response, tools=None, step=0):
+        self.usages.append((messages, response, step))
+        return response.get("usage") if isinstance(response, dict) else None
+
+    def get_full_context(self, query, images=None, frame=None):
+        self.context_requests.append((query, frame.images() if frame is not None else images))
         return [{"role": "user", "content": "current state"}]
 
     def add_model_input_log(self, messages, step, images=None):
@@ -42,6 +57,9 @@ class FakeMemory:
     def add_model_output_log(self, content, tool=None, step=0):
         self.model_outputs.append({"content": content, "tool": tool, "step": step})
 
+    def add_step_timing_log(self, step, timing):
+        self.timings.append((step, timing))
+
     def add_step(self, role, content, tool=None, log_content=None, log_extra=None, log_callback=None, compress=True):
         step = {"role": role, "content": content, "log_content": log_content, "log_extra": log_extra}
         if tool:
@@ -66,9 +84,20 @@ class FakeMemory:
 class FakeVision:
     def __init__(self):
         self.last_capture_files = {"global": "global_step.png", "local": "local_step.png"}
+        self.last_screen_change = None
+        self.screen_changes = []
+        self.local_only_requests = []
+        self.closed = False
+
+    def capture_state(self, mouse_x, mouse_y, local_only=False):
+        self.local_only_requests.append(local_only)
+        # Like VisionPerceptor, each capture reports the change since the previous one
+        self.last_screen_change = self.screen_changes.pop(0) if self.screen_changes else None
+        global_image = None if local_only else object()
+        return CapturedFrame(global_image, object(), {"G-00-00": (0, 0)}, "L-00-00", "G-00-00")
 
-    def capture_state(self, mouse_x, mouse_y):
-        return object(), object(), {"G-00-00": (0, 0)}, "L-00-00", "G-00-00"
+    def close(self):
+        self.closed = True
 
 
 class FakeExecutor:
@@ -84,17 +113,20 @@ class FakeExecutor:
 
 
 class CapturingCompletions:
-    def __init__(self):
+    def __init__(self, responses=None):
         self.kwargs = None
+        self.responses = list(responses or [])
 
     def create(self, **kwargs):
         self.kwargs = kwargs
+        if self.responses:
+            return self.responses.pop(0)
         return {"choices": [{"finish_reason": "stop", "message": {"tool_calls": []}}]}
 
 
 class CapturingClient:
-    def __init__(self):
-        self.completions = CapturingCompletions()
+    def __init__(self, responses=None):
+        self.completions = CapturingCompletions(responses)
         self.chat = type("Chat", (), {"completions": self.completions})()
 
 
@@ -104,6 +136,9 @@ def make_agent(fake_response):
     agent.memory = FakeMemory()
     agent.vision = FakeVision()
     agent.executor = FakeExecutor()
+    agent.overlay = OverlaySession()
+    agent.trajectory_store = None
+    agent.trajectory_actions = []
     agent.llm_messages = []
     responses = list(fake_response) if isinstance(fake_response, list) else [fake_response]
 
@@ -338,14 +373,309 @@ class AgentNativeToolLoopTests(unittest.TestCase):
         self.assertEqual(agent.executor.executed, [])
         self.assertIn("Execution Result", agent.memory.steps[1]["content"])
 
+    def test_next_step_query_reports_click_without_visible_change(self):
+        response = {
+            "choices": [
+                {
+                    "finish_reason": "tool_calls",
+                    "message": {
+                        "content": "The button is under the cursor, so I will click it.",
+                        "tool_calls": [
+                            {
+                                "id": "call_click",
+                                "type": "function",
+                                "function": {"name": "click", "arguments": json.dumps({"button": "left"})},
+                            }
+                        ],
+                    },
+                }
+            ]
+        }
+        agent = make_agent(response)
+        agent.vision.screen_changes = [None, ScreenChange(regions=(), changed_fraction=0.0)]
+        logs = []
+
+        with redirect_stdout(StringIO()):
+            agent.step()
+            agent.step(log_callback=logs.append)
+
+        first_query, _ = agent.memory.context_requests[0]
+        second_query, _ = agent.memory.context_requests[1]
+        self.assertNotIn("Screen change", first_query)
+        self.assertIn("The previous click produced no visible change", second_query)
+        self.assertIn("Screen change: none detected", "".join(logs))
+        self.assertFalse(agent.memory.steps[1]["content"].startswith("Screen change"))
+        self.assertTrue(agent.memory.steps[3]["content"].startswith("Screen change before this step: none detected. The previous click"))
+        self.assertIn("Execution Result: executed click", agent.memory.steps[3]["content"])
+
+    def test_fine_local_moves_trigger_capped_local_only_observations(self):
+        def move_response(point_id):
+            return {
+                "choices": [
+                    {
+                        "finish_reason": "tool_calls",
+                        "message": {
+                            "content": "",
+                            "tool_calls": [
+                                {
+                                    "id": "call_move",
+                                    "type": "function",
+                                    "function": {"name": "move", "arguments": json.dumps({"point_id": point_id})},
+                                }
+                            ],
+                        },
+                    }
+                ]
+            }
+
+        agent = make_agent([move_response("L-11-10")] * 4 + [move_response("G-02-02"), move_response("L-10-09")])
+
+        with redirect_stdout(StringIO()):
+            for _ in range(6):
+                agent.step()
+
+        self.assertEqual(agent.vision.local_only_requests, [False, True, True, False, True, False])
+        local_query, local_images = agent.memory.context_requests[1]
+        self.assertIn("omitted in this local-only verification step", local_query)
+        self.assertIsNone(local_images[0])
+        self.assertIn("Global View image: full screen", agent.memory.context_requests[3][0])
+
+    def test_step_hides_window_once_for_capture_and_once_for_all_actions(self):
+        def tool_call(call_id, name, arguments):
+            return {"id": call_id, "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+
+        response = {
+            "choices": [
+                {
+                    "finish_reason": "tool_calls",
+                    "message": {
+                        "content": "",
+                        "tool_calls": [
+                            tool_call("call_move", "move", {"point_id": "G-00-00"}),
+                            tool_call("call_click", "click", {}),
+                            tool_call("call_type", "type", {"text": "hello"}),
+                        ],
+                    },
+                }
+            ]
+        }
+        agent = make_agent(response)
+        events = []
+        agent.overlay = OverlaySession(lambda: events.append("hide"), lambda: events.append("show"))
+        capture_state = agent.vision.capture_state
+        execute = agent.executor.execute
+        fake_call = agent._call_llm_for_action
+
+        def hidden(func, name):
+            def wrapper(*args, **kwargs):
+                # Same callback wiring IrisAgent gives VisionPerceptor and ActionExecutor
+                agent.overlay.enter()
+                try:
+                    events.append(name)
+                    return func(*args, **kwargs)
+                finally:
+                    agent.overlay.exit()
+            return wrapper
+
+        agent.vision.capture_state = hidden(capture_state, "capture")
+        agent.executor.execute = hidden(execute, "execute")
+        agent._call_llm_for_action = lambda messages: events.append("llm") or fake_call(messages)
+
+        with mock.patch("scripts.agent.STEP_PIPELINE", True), redirect_stdout(StringIO()):
+            agent.step()
+            # The next capture reuses the hide of the actions
+            agent._pending_capture.result()
+
+        self.assertEqual(events, ["hide", "capture", "show", "llm", "hide", "execute", "execute", "execute", "capture", "show"])
+        self.assertEqual(agent.last_step_timing["overlay_hides"], 2)
+        self.assertEqual(agent.memory.timings, [(1, agent.last_step_timing)])
+
+    def test_actions_that_ran_before_a_stream_failed_are_kept_in_memory(self):
+        def stream():
+            yield {"choices": [{"index": 0, "delta": {"tool_calls": [{"index": 0, "id": "call_click", "function": {"name": "click", "arguments": "{}"}}]}, "finish_reason": None}]}
+            yield {"choices": [{"index": 0, "delta": {"tool_calls": [{"index": 1, "id": "call_type", "function": {"name": "type", "arguments": '{"text": '}}]}, "finish_reason": None}]}
+            raise ConnectionResetError("stream reset")
+
+        agent = make_agent([])
+        del agent._call_llm_for_action
+        agent.client = CapturingClient([stream()])
+        checkpoints = []
+        agent.save_checkpoint = lambda completed=False: checkpoints.append(agent.step_count)
+
+        with mock.patch("scripts.agent.LLM_STREAM_TOOL_CALLS", True), mock.patch("scripts.agent.STEP_PIPELINE", False), redirect_stdout(StringIO()):
+            feedback = agent.step()
+
+        self.assertEqual([action for action, _, _ in agent.executor.executed], [{"action_type": "click"}])
+        self.assertEqual(feedback, "executed click\nError during LLM inference: stream reset")
+        self.assertIn("Tool call: click", agent.memory.steps[0]["content"])
+        self.assertEqual(agent.memory.steps[1]["content"], f"Execution Result: {feedback}")
+        self.assertEqual(checkpoints, [1])
+
+    def test_next_capture_overlaps_bookkeeping_and_the_next_request_sees_memory(self):
+        def tool_response(name, arguments):
+            return {
+                "choices": [
+                    {
+                        "finish_reason": "tool_calls",
+                        "message": {
+                            "content": f"Calling {name}.",
+                            "tool_calls": [{"id": f"call_{name}", "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}],
+                        },
+                    }
+                ]
+            }
+
+        agent = make_agent([tool_response("click", {}), tool_response("final_answer", {"answer": "done"})])
+        agent.executor.execute = lambda action_dict, *args, **kwargs: (
+            "[Task Completed] done" if action_dict["action_type"] == "final_answer" else "executed click"
+        )
+        captured = threading.Event()
+        capture_state = agent.vision.capture_state
+
+        def capture_and_signal(*args, **kwargs):
+            frame = capture_state(*args, **kwargs)
+            if len(agent.vision.local_only_requests) == 2:
+                captured.set()
+            return frame
+
+        agent.vision.capture_state = capture_and_signal
+        overlapped = []
+        add_interaction = agent.memory.add_interaction
+
+        def slow_add_interaction(*args, **kwargs):
+            # The second capture must be able to finish while the first step is still saving
+            if agent.step_count == 1:
+                overlapped.append(captured.wait(timeout=2))
+            add_interaction(*args, **kwargs)
+
+        agent.memory.add_interaction = slow_add_interaction
+        memory_sizes = []
+        get_full_context = agent.memory.get_full_context
+        agent.memory.get_full_context = lambda *args, **kwargs: memory_sizes.append(len(agent.memory.steps)) or get_full_context(*args, **kwargs)
+
+        with mock.patch("scripts.agent.STEP_PIPELINE", True), redirect_stdout(StringIO()):
+            agent.step()
+            self.assertGreaterEqual(agent.last_step_timing["act_seconds"], 0)
+            self.assertFalse(agent.last_step_timing["capture_prefetched"])
+            feedback = agent.step()
+
+        self.assertEqual(overlapped, [True])
+        self.assertTrue(agent.last_step_timing["capture_prefetched"])
+        self.assertEqual(memory_sizes, [0, 2])
+        self.assertIn("[Task Completed]", feedback)
+        self.assertIsNone(getattr(agent, "_pending_capture", None))
+        self.assertEqual(len(agent.vision.local_only_requests), 2)
+
+        capture_thread = agent._capture_executor.submit(threading.current_thread).result()
+        agent.close()
+        self.assertTrue(agent.vision.closed)
+        self.assertFalse(capture_thread.is_alive())
+        self.assertIsNone(agent._capture_executor)
+
     def test_llm_request_messages_are_passed_without_character_rewrites(self):
         agent = IrisAgent.__new__(IrisAgent)
         agent.client = CapturingClient()
+        agent.memory = FakeMemory()
+        agent.step_count = 3
 
-        agent._call_llm_for_action([{"role": "user", "content": "bad \ud83d"}])
+        response = agent._call_llm_for_action([{"role": "user", "content": "bad \ud83d"}])
 
         sent_messages = agent.client.completions.kwargs["messages"]
         self.assertEqual(sent_messages, [{"role": "user", "content": "bad \ud83d"}])
+        self.assertEqual(agent.memory.usages, [(sent_messages, response, 3)])
+
+    def test_step_timing_reports_token_usage_and_cache_hits_across_calls(self):
+        text_only_response = {
+            "choices": [{"finish_reason": "stop", "message": {"content": "thinking", "tool_calls": []}}],
+            "usage": {"prompt_tokens": 5000, "completion_tokens": 20, "cached_tokens": 0},
+        }
+        tool_response = {
+            "choices": [
+                {
+                    "finish_reason": "tool_calls",
+                    "message": {
+                        "content": "",
+                        "tool_calls": [
+                            {
+                                "id": "call_wait",
+                                "type": "function",
+                                "function": {"name": "wait", "arguments": json.dumps({"seconds": 1})},
+                            }
+                        ],
+                    },
+                }
+            ],
+            "usage": {"prompt_tokens": 5100, "completion_tokens": 30, "cached_tokens": 4864},
+        }
+        agent = make_agent([])
+        del agent._call_llm_for_action
+        agent.client = CapturingClient([text_only_response, tool_response])
+
+        with redirect_stdout(StringIO()):
+            agent.step()
+
+        timing = agent.last_step_timing
+        self.assertEqual(timing["prompt_tokens"], 10100)
+        self.assertEqual(timing["completion_tokens"], 50)
+        self.assertEqual(timing["cached_tokens"], 4864)
+        self.assertEqual(agent.memory.timings[-1][1], timing)
+
+    def test_prompt_cache_key_is_sent_only_when_configured(self):
+        agent = IrisAgent.__new__(IrisAgent)
+        agent.client = CapturingClient()
+        agent.memory = FakeMemory()
+        agent.step_count = 1
+        agent.prompt_cache_key = prompt_cache_key("auto", "system", "open the settings")
+
+        agent._call_llm_for_action([{"role": "user", "content": "state"}])
+
+        self.assertEqual(agent.client.completions.kwargs["extra_body"], {"prompt_cache_key": agent.prompt_cache_key})
+        self.assertTrue(agent.prompt_cache_key.startswith("iris-"))
+        self.assertEqual(agent.prompt_cache_key, prompt_cache_key("auto", "system", "open the settings"))
+        self.assertNotEqual(agent.prompt_cache_key, prompt_cache_key("auto", "system", "close the settings"))
+        self.assertEqual(prompt_cache_key("team-cache", "system", "task"), "team-cache")
+        self.assertIsNone(prompt_cache_key("", "system", "task"))
+
+        agent.prompt_cache_key = None
+        agent._call_llm_for_action([{"role": "user", "content": "state"}])
+        self.assertNotIn("extra_body", agent.client.completions.kwargs)
+
+    def test_streamed_tool_calls_run_before_the_rest_of_the_response_arrives(self):
+        events = []
+
+        def stream():
+            parts = [
+                {"content": "Click, then type."},
+                {"tool_calls": [{"index": 0, "id": "call_click", "function": {"name": "click", "arguments": '{"button": "left"}'}}]},
+                {"tool_calls": [{"index": 1, "id": "call_type", "function": {"name": "type", "arguments": '{"text": '}}]},
+                {"tool_calls": [{"index": 1, "function": {"arguments": '"hi"}'}}]},
+            ]
+            for index, delta in enumerate(parts):
+                events.append(f"chunk {index}")
+                yield {"choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            yield {"choices": [{"index": 0, "delta": {}, "finish_reason": "tool_calls"}]}
+            yield {"choices": [], "usage": {"prompt_tokens": 700, "completion_tokens": 25}}
+
+        agent = make_agent([])
+        del agent._call_llm_for_action
+        agent.client = CapturingClient([stream()])
+        execute = agent.executor.execute
+        agent.executor.execute = lambda action_dict, *args, **kwargs: events.append(action_dict["action_type"]) or execute(action_dict, *args, **kwargs)
+
+        with mock.patch("scripts.agent.LLM_STREAM_TOOL_CALLS", True), redirect_stdout(StringIO()):
+            feedback = agent.step()
+
+        self.assertEqual(events, ["chunk 0", "chunk 1", "click", "chunk 2", "chunk 3", "type"])
+        self.assertEqual(feedback, "executed click\nexecuted type")
+        self.assertTrue(agent.client.completions.kwargs["stream"])
+        self.assertEqual(agent.memory.model_outputs[0]["content"], "Click, then type.")
+        self.assertEqual(
+            agent.memory.model_outputs[0]["tool"],
+            [{"name": "click", "arguments": {"button": "left"}}, {"name": "type", "arguments": {"text": "hi"}}],
+        )
+        self.assertIn("Tool call: type", agent.memory.steps[0]["content"])
+        self.assertEqual(agent.last_step_timing["prompt_tokens"], 700)
+        self.assertIn("first_action_seconds", agent.last_step_timing)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,117 @@
+import threading
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest.mock import patch
+
+from PIL import Image
+
+import scripts.capture as capture
+
+
+class FakeBackend(capture.CaptureBackend):
+    def __init__(self, fail_on_init=False, fail_on_grab=False):
+        if fail_on_init:
+            raise ImportError("backend not installed")
+        self.fail_on_grab = fail_on_grab
+        self.regions = []
+        self.closed = False
+
+    def grab(self, region=None):
+        if self.fail_on_grab:
+            raise OSError("grab failed")
+        self.regions.append(region)
+        size = region[2:] if region else (64, 32)
+        return Image.new("RGB", size)
+
+    def close(self):
+        self.closed = True
+
+
+class ScreenCaptureTests(unittest.TestCase):
+    def test_backend_chain_falls_back_only_to_more_portable_backends(self):
+        self.assertEqual(capture.capture_backend_chain("auto"), ["mss", "x11", "pyautogui"])
+        self.assertEqual(capture.capture_backend_chain("X11"), ["x11", "pyautogui"])
+        self.assertEqual(capture.capture_backend_chain("pyautogui"), ["pyautogui"])
+        with self.assertRaisesRegex(ValueError, "Unknown capture backend"):
+            capture.capture_backend_chain("gdi")
+
+    def test_grab_falls_back_when_backend_is_unavailable_and_keeps_region(self):
+        backends = {
+            "mss": lambda: FakeBackend(fail_on_init=True),
+            "x11": lambda: FakeBackend(fail_on_grab=True),
+            "pyautogui": FakeBackend,
+        }
+        logs = []
+        with patch.dict(capture.CAPTURE_BACKENDS, backends):
+            screen_capture = capture.ScreenCapture("auto", log=logs.append)
+            region_image = screen_capture.grab((10, 20, 40, 30))
+            full_image = screen_capture.grab()
+
+        self.assertEqual(region_image.size, (40, 30))
+        self.assertEqual(full_image.size, (64, 32))
+        self.assertEqual(screen_capture.active_backend, "pyautogui")
+        self.assertEqual(len(logs), 2)
+        self.assertIn("Falling back to x11", logs[0])
+        self.assertIn("Falling back to pyautogui", logs[1])
+
+    def test_last_backend_error_is_raised(self):
+        with patch.dict(capture.CAPTURE_BACKENDS, {"pyautogui": lambda: FakeBackend(fail_on_grab=True)}):
+            screen_capture = capture.ScreenCapture("pyautogui")
+
+            with redirect_stdout(StringIO()):
+                with self.assertRaisesRegex(OSError, "grab failed"):
+                    screen_capture.grab()
+
+        self.assertEqual(screen_capture.chain, ["pyautogui"])
+
+    def test_backend_is_created_used_and_closed_on_one_thread(self):
+        threads = []
+
+        class ThreadBoundBackend(FakeBackend):
+            def __init__(self):
+                super().__init__()
+                threads.append(threading.get_ident())
+
+            def grab(self, region=None):
+                threads.append(threading.get_ident())
+                return super().grab(region)
+
+            def close(self):
+                threads.append(threading.get_ident())
+                super().close()
+
+        with patch.dict(capture.CAPTURE_BACKENDS, {"pyautogui": ThreadBoundBackend}):
+            screen_capture = capture.ScreenCapture("pyautogui")
+            worker = threading.Thread(target=screen_capture.grab, args=((0, 0, 4, 4),))
+            worker.start()
+            worker.join()
+            screen_capture.grab()
+            screen_capture.close()
+
+        self.assertEqual(len(threads), 4)
+        self.assertEqual(len(set(threads)), 1)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def test_close_stops_the_grab_thread_once(self):
+        grab_threads = []
+
+        class RecordingBackend(FakeBackend):
+            def grab(self, region=None):
+                grab_threads.append(threading.current_thread())
+                return super().grab(region)
+
+        with patch.dict(capture.CAPTURE_BACKENDS, {"pyautogui": RecordingBackend}):
+            screen_capture = capture.ScreenCapture("pyautogui")
+            screen_capture.grab()
+            backend = screen_capture._backends["pyautogui"]
+            screen_capture.close()
+            screen_capture.close()
+
+        self.assertTrue(backend.closed)
+        self.assertFalse(grab_threads[0].is_alive())
+        with self.assertRaises(RuntimeError):
+            screen_capture.grab()
+
+if __name__ == "__main__":
+    unittest.main()
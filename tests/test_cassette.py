@@ -0,0 +1,249 @@
+import asyncio
+import base64
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from types import SimpleNamespace
+from unittest.mock import patch
+
+os.environ.setdefault("LLM_API_ENDPOINT", "http://example.invalid/v1")
+os.environ.setdefault("LLM_API_KEY", "sk-test")
+os.environ.setdefault("LLM_MODEL_NAME", "fake-model")
+os.environ.setdefault("DEBUG_MODE", "False")
+os.environ.setdefault("MEMORY_TOKEN_CALIBRATION_FILE", "off")
+os.environ.setdefault("CHECKPOINT_DIR", "off")
+os.environ.setdefault("MACRO_DIR", "off")
+os.environ.setdefault("TRAJECTORY_STORE_FILE", "off")
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from PIL import Image
+
+import scripts.agent as agent_module
+import scripts.cassette as cassette_module
+from scripts.cassette import Cassette, CassetteClient, CassetteMiss
+from scripts.frame import CapturedFrame
+from scripts.trajectories import TrajectoryStore
+
+
+def completion(content):
+    return ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-1",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "fake-model",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+        }
+    )
+
+
+def chunk(content):
+    return ChatCompletionChunk.model_validate(
+        {
+            "id": "chatcmpl-1",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "fake-model",
+            "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+        }
+    )
+
+
+def request(text, image=b"screen-1"):
+    url = "data:image/png;base64," + base64.b64encode(image).decode("ascii")
+    content = [{"type": "text", "text": text}, {"type": "image_url", "image_url": {"url": url, "detail": "high"}}]
+    return {"model": "fake-model", "messages": [{"role": "user", "content": content}]}
+
+
+class RecordingClient:
+    def __init__(self):
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if kwargs.get("stream"):
+            return iter([chunk("Hel"), chunk("lo")])
+        return completion(f"answer {len(self.calls)}")
+
+
+class AsyncRecordingClient(RecordingClient):
+    async def create(self, **kwargs):
+        return super().create(**kwargs)
+
+
+def tool_completion(name, arguments):
+    return ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-1",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "fake-model",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "tool_calls",
+                    "message": {
+                        "role": "assistant",
+                        "content": f"Calling {name}.",
+                        "tool_calls": [
+                            {"id": f"call_{name}", "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+                        ],
+                    },
+                }
+            ],
+        }
+    )
+
+
+class ScriptedClient:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        if not self.responses:
+            raise AssertionError("unexpected model request")
+        return self.responses.pop(0)
+
+
+class FakeVision:
+    def __init__(self, *args, **kwargs):
+        self.last_capture_files = None
+
+    def capture_state(self, mouse_x, mouse_y, local_only=False):
+        return CapturedFrame(None, Image.new("RGB", (8, 8)), {"G-00-00": (5, 6)}, "L-00-00", "G-00-00")
+
+
+class FakeExecutor:
+    def __init__(self, *args, **kwargs):
+        self.mouse_x, self.mouse_y = 0, 0
+
+    def get_mouse_position(self):
+        return self.mouse_x, self.mouse_y
+
+    def execute(self, action_dict, coordinate_map=None, log_callback=None):
+        if action_dict["action_type"] == "final_answer":
+            return f"[Task Completed]: {action_dict['text']}"
+        return f"executed {action_dict['action_type']}"
+
+
+class CassetteTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cassettes", "run.jsonl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_records_image_hashes_and_replays_in_order_without_the_client(self):
+        recorder = CassetteClient(RecordingClient(), Cassette(self.path, "record"))
+        recorder.chat.completions.create(**request("step"))
+        recorder.chat.completions.create(**request("step"))
+        recorder.chat.completions.create(**request("summary", image=b"screen-2"))
+        with open(self.path, encoding="utf-8") as f:
+            text = f.read()
+        self.assertNotIn(base64.b64encode(b"screen-1").decode("ascii"), text)
+        self.assertIn("data:image/png;sha256,", text)
+
+        underlying = RecordingClient()
+        player = CassetteClient(underlying, Cassette(self.path, "replay"))
+        summary = player.chat.completions.create(**request("summary", image=b"screen-2"))
+        first = player.chat.completions.create(**request("step"))
+        second = player.chat.completions.create(**request("step"))
+
+        self.assertEqual(underlying.calls, [])
+        self.assertIsInstance(first, ChatCompletion)
+        self.assertEqual(
+            [response.choices[0].message.content for response in (first, second, summary)],
+            ["answer 1", "answer 2", "answer 3"],
+        )
+        with self.assertRaises(CassetteMiss):
+            player.chat.completions.create(**request("step"))
+
+    def test_text_with_lone_surrogates_records_and_replays(self):
+        recorder = CassetteClient(RecordingClient(), Cassette(self.path, "record"))
+        recorder.chat.completions.create(**request("bad \ud83d text 打开"))
+
+        player = CassetteClient(RecordingClient(), Cassette(self.path, "replay"))
+        response = player.chat.completions.create(**request("bad \ud83d text 打开"))
+        self.assertEqual(response.choices[0].message.content, "answer 1")
+
+    def test_non_strict_replay_serves_the_next_exchange_for_a_changed_screen(self):
+        recorder = CassetteClient(RecordingClient(), Cassette(self.path, "record"))
+        recorder.chat.completions.create(**request("step"))
+
+        with self.assertRaises(CassetteMiss):
+            CassetteClient(RecordingClient(), Cassette(self.path, "replay")).chat.completions.create(**request("step", image=b"new"))
+        player = CassetteClient(RecordingClient(), Cassette(self.path, "replay", strict=False))
+        response = player.chat.completions.create(**request("step", image=b"new"))
+        self.assertEqual(response.choices[0].message.content, "answer 1")
+
+    def test_streamed_responses_round_trip_for_sync_and_async_clients(self):
+        recorder = CassetteClient(RecordingClient(), Cassette(self.path, "record"))
+        recorded = [part.choices[0].delta.content for part in recorder.chat.completions.create(stream=True, **request("step"))]
+
+        player = CassetteClient(AsyncRecordingClient(), Cassette(self.path, "replay"))
+
+        async def replay():
+            stream = await player.chat.completions.create(stream=True, **request("step"))
+            return [part async for part in stream]
+
+        replayed = asyncio.run(replay())
+        self.assertEqual(recorded, ["Hel", "lo"])
+        self.assertEqual([part.choices[0].delta.content for part in replayed], ["Hel", "lo"])
+        self.assertIsInstance(replayed[0], ChatCompletionChunk)
+
+
+
+class AgentCassetteTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.store_path = os.path.join(self.directory.name, "trajectories.jsonl")
+        self.cassette_path = os.path.join(self.directory.name, "cassette.jsonl")
+        self.client = None
+        for target, name, value in (
+            (agent_module, "VisionPerceptor", FakeVision),
+            (agent_module, "ActionExecutor", FakeExecutor),
+            (agent_module, "OpenAI", lambda **kwargs: self.client),
+            (agent_module, "TRAJECTORY_STORE_FILE", self.store_path),
+            (agent_module, "TRAJECTORY_HINTS", 2),
+            (cassette_module, "LLM_CASSETTE_FILE", self.cassette_path),
+            (cassette_module, "_cassette", None),
+        ):
+            patcher = patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        TrajectoryStore(self.store_path).record("Open the settings", ["hotkey {\"keys\": [\"win\", \"i\"]}"], "opened", 1)
+
+    def run_task(self, mode, client):
+        self.client = client
+        cassette_module._cassette = None
+        with patch.object(cassette_module, "LLM_CASSETTE_MODE", mode):
+            agent = agent_module.IrisAgent("Open the settings and enable dark mode")
+            with redirect_stdout(StringIO()):
+                feedbacks = [agent.step() for _ in range(2)]
+        self.assertIn("[Task Completed]", feedbacks[-1])
+        return agent
+
+    def test_replay_starts_from_the_recorded_hints_after_the_store_changed(self):
+        responses = [tool_completion("move", {"point_id": "G-00-00"}), tool_completion("final_answer", {"text": "Dark mode is on."})]
+        recorded = self.run_task("record", ScriptedClient(responses))
+        # The recorded run is now in the store, so a fresh agent would get different hints
+        self.assertEqual(len(TrajectoryStore(self.store_path).trajectories), 2)
+
+        replayed = self.run_task("replay", ScriptedClient([]))
+
+        self.assertEqual(cassette_module._cassette.misses, 0)
+        self.assertEqual(replayed.memory.hints, recorded.memory.hints)
+        self.assertEqual(replayed.hinted_runs, 1)
+        self.assertEqual(len(TrajectoryStore(self.store_path).trajectories), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
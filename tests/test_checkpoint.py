@@ -0,0 +1,124 @@
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest.mock import patch
+
+os.environ.setdefault("LLM_API_ENDPOINT", "http://example.invalid/v1")
+os.environ.setdefault("LLM_API_KEY", "sk-test")
+os.environ.setdefault("LLM_MODEL_NAME", "fake-model")
+os.environ.setdefault("DEBUG_MODE", "False")
+os.environ.setdefault("MEMORY_TOKEN_CALIBRATION_FILE", "off")
+os.environ.setdefault("CHECKPOINT_DIR", "off")
+os.environ.setdefault("MACRO_DIR", "off")
+os.environ.setdefault("TRAJECTORY_STORE_FILE", "off")
+
+from PIL import Image
+
+import scripts.agent as agent_module
+from scripts.checkpoint import load_checkpoint, save_checkpoint
+from scripts.frame import CapturedFrame
+
+
+class FakeVision:
+    def __init__(self, *args, **kwargs):
+        self.last_capture_files = None
+
+    def capture_state(self, mouse_x, mouse_y, local_only=False):
+        return CapturedFrame(None, Image.new("RGB", (8, 8)), {"G-00-00": (5, 6)}, "L-00-00", "G-00-00")
+
+
+class FakeExecutor:
+    def __init__(self, *args, **kwargs):
+        self.mouse_x, self.mouse_y = 0, 0
+
+    def get_mouse_position(self):
+        return self.mouse_x, self.mouse_y
+
+    def execute(self, action_dict, coordinate_map=None, log_callback=None):
+        self.mouse_x, self.mouse_y = coordinate_map[action_dict["point_id"]]
+        return f"moved to {action_dict['point_id']}"
+
+
+def move_response():
+    return {
+        "choices": [
+            {
+                "finish_reason": "tool_calls",
+                "message": {
+                    "content": "Moving to the target.",
+                    "tool_calls": [
+                        {
+                            "id": "call_move",
+                            "type": "function",
+                            "function": {"name": "move", "arguments": json.dumps({"point_id": "G-00-00"})},
+                        }
+                    ],
+                },
+            }
+        ]
+    }
+
+
+class CheckpointTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "run", "checkpoint.json")
+        for name, fake in (("VisionPerceptor", FakeVision), ("ActionExecutor", FakeExecutor)):
+            patcher = patch.object(agent_module, name, fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_agent(self, task="open the settings"):
+        agent = agent_module.IrisAgent(task)
+        agent._call_llm_for_action = lambda messages: move_response()
+        return agent
+
+    def test_step_checkpoint_restores_memory_step_count_and_mouse(self):
+        agent = self.make_agent()
+        agent.checkpoint_path = self.path
+        with redirect_stdout(StringIO()):
+            agent.step()
+            agent.step()
+
+        resumed = agent_module.IrisAgent.resume(self.path)
+
+        self.assertEqual(resumed.task_description, "open the settings")
+        self.assertEqual(resumed.step_count, 2)
+        self.assertEqual((resumed.executor.mouse_x, resumed.executor.mouse_y), (5, 6))
+        self.assertEqual(resumed.memory.short_memory_layer, agent.memory.short_memory_layer)
+        self.assertEqual(resumed.memory.long_memory_layer, agent.memory.long_memory_layer)
+        self.assertEqual(resumed.memory.short_memory_layer.total_tokens, agent.memory.short_memory_layer.total_tokens)
+        self.assertEqual(resumed.last_actions, [{"action_type": "move", "point_id": "G-00-00"}])
+        self.assertEqual(resumed.checkpoint_path, self.path)
+
+        # The resumed run continues numbering and keeps writing the same file
+        resumed._call_llm_for_action = lambda messages: move_response()
+        with redirect_stdout(StringIO()):
+            resumed.step()
+        self.assertEqual(load_checkpoint(self.path)["step_count"], 3)
+        self.assertEqual(len(load_checkpoint(self.path)["memory"]["short_memory_layer"]), 6)
+
+    def test_failed_write_keeps_previous_checkpoint(self):
+        save_checkpoint(self.path, {"task": "task", "step_count": 1})
+
+        with patch("scripts.checkpoint.json.dump", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                save_checkpoint(self.path, {"task": "task", "step_count": 2})
+
+        self.assertEqual(load_checkpoint(self.path)["step_count"], 1)
+
+    def test_unknown_version_is_rejected(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"version": 99, "task": "task"}, f)
+
+        with self.assertRaises(ValueError):
+            load_checkpoint(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
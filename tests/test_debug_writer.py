@@ -0,0 +1,75 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from scripts.debug_writer import DebugWriter
+
+
+class DebugWriterTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.log_path = os.path.join(self.directory.name, "run.jsonl")
+
+    def read_lines(self, path=None):
+        with open(path or self.log_path, "r", encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    def test_log_lines_share_one_open_handle(self):
+        writer = DebugWriter(flush_interval=60, log=None)
+        self.addCleanup(writer.close)
+
+        with patch("builtins.open", wraps=open) as opened:
+            for index in range(50):
+                writer.append_line(self.log_path, f'{{"step": {index}}}')
+            writer.flush()
+
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual(len(self.read_lines()), 50)
+
+    def test_close_drains_pending_writes_from_a_full_queue(self):
+        release = threading.Event()
+        writer = DebugWriter(max_queue=2, flush_interval=60, log=None)
+        writer.write_file(os.path.join(self.directory.name, "slow.png"), lambda: release.wait(5) and b"image")
+        producer = threading.Thread(
+            target=lambda: [writer.append_line(self.log_path, str(index)) for index in range(10)]
+        )
+        producer.start()
+        producer.join(0.2)
+
+        # The producer waits for queue space instead of dropping lines
+        self.assertTrue(producer.is_alive())
+        release.set()
+        producer.join(5)
+        writer.close(timeout=5)
+
+        self.assertEqual(self.read_lines(), [str(index) for index in range(10)])
+        with open(os.path.join(self.directory.name, "slow.png"), "rb") as f:
+            self.assertEqual(f.read(), b"image")
+
+    def test_writes_after_close_happen_synchronously(self):
+        writer = DebugWriter(log=None)
+        writer.close(timeout=5)
+
+        writer.append_line(self.log_path, "late")
+
+        self.assertEqual(self.read_lines(), ["late"])
+
+    def test_write_errors_are_reported_without_stopping_the_writer(self):
+        messages = []
+        writer = DebugWriter(log=messages.append)
+        self.addCleanup(writer.close)
+
+        writer.write_file(os.path.join(self.directory.name, "missing", "global.png"), lambda: b"image")
+        writer.append_line(self.log_path, "still written")
+        writer.flush()
+
+        self.assertEqual(len(messages), 1)
+        self.assertIn("global.png", messages[0])
+        self.assertEqual(self.read_lines(), ["still written"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+from scripts.extractive import extractive_summary
+from scripts.tokens import count_text, tokens_for_counts
+
+
+def estimate(text):
+    return max(1, tokens_for_counts(*count_text(text), 4.0))
+
+
+class ExtractiveSummaryTests(unittest.TestCase):
+    def test_keeps_actions_errors_answers_and_final_state(self):
+        steps = [
+            {"role": "assistant", "content": "Opening the menu.\nTool call: move\nArguments: {\"point_id\": \"G-01-02\"}"},
+            {"role": "user", "content": "Execution Result: Action move to G-01-02 executed."},
+            {"role": "assistant", "content": "Tool call: scroll\nArguments: {\"direction\": \"down\"}"},
+            {"role": "user", "content": "Execution Result: Action scroll down line executed."},
+            {"role": "assistant", "content": "Tool call: scroll\nArguments: {\"direction\": \"down\"}"},
+            {"role": "user", "content": "Execution Result: Error executing action scroll: display lost"},
+            {"role": "assistant", "content": "Asking which file.\nTool call: ask_input\nArguments: {\"question\": \"Which file?\"}"},
+            {"role": "user", "content": "Execution Result: Action ask_input executed. User response: report.docx"},
+        ]
+
+        summary = extractive_summary(steps, 500, estimate)
+
+        self.assertEqual(
+            summary.splitlines(),
+            [
+                "History Summary (extracted locally, no model summary):",
+                'move {"point_id": "G-01-02"}',
+                'scroll {"direction": "down"} x2',
+                "Error executing action scroll: display lost",
+                'ask_input {"question": "Which file?"}',
+                "Action ask_input executed. User response: report.docx",
+                "Last state: Asking which file. -> Action ask_input executed. User response: report.docx",
+            ],
+        )
+
+    def test_drops_oldest_lines_to_fit_the_budget(self):
+        steps = [{"role": "assistant", "content": f"Tool call: type\nArguments: {{\"text\": \"line {index:03d}\"}}"} for index in range(200)]
+
+        summary = extractive_summary(steps, 120, estimate, header="Long Term Memory")
+
+        self.assertLessEqual(estimate(summary), 120)
+        lines = summary.splitlines()
+        self.assertTrue(lines[0].startswith("Long Term Memory"))
+        self.assertRegex(lines[1], r"^\.\.\. \d+ earlier entries omitted$")
+        self.assertEqual(lines[-1], 'type {"text": "line 199"}')
+
+    def test_earlier_extracts_carry_over_without_stale_markers(self):
+        earlier = extractive_summary(
+            [{"role": "assistant", "content": "Tool call: click\nArguments: {}"}, {"role": "user", "content": "done"}], 200, estimate
+        )
+
+        summary = extractive_summary([{"role": "assistant", "content": earlier}], 200, estimate, header="Long Term Memory")
+
+        self.assertEqual(summary.splitlines()[1:], ["click {}"])
+
+
+if __name__ == "__main__":
+    unittest.main()
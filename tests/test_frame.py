@@ -0,0 +1,84 @@
+import base64
+import threading
+import unittest
+from unittest.mock import patch
+
+from PIL import Image
+
+from scripts.frame import CapturedFrame
+from scripts.image_encoding import ImageEncoding, parse_image_encoding
+
+
+def make_frame(global_image=None):
+    return CapturedFrame(
+        global_image,
+        Image.new("RGB", (20, 20), color="white"),
+        {"L-00-00": (0, 0)},
+        "L-00-00",
+        "G-00-00",
+    )
+
+
+class CapturedFrameTests(unittest.TestCase):
+    def test_debug_archive_and_request_share_one_encode_per_view(self):
+        frame = make_frame(Image.new("RGB", (40, 30), color="blue"))
+        encoding = parse_image_encoding("png:1")
+
+        with patch.object(ImageEncoding, "encode", autospec=True, side_effect=lambda self, image: b"encoded") as encode:
+            # The debug writer stores frame.encoded(); the request sends the base64 of the same bytes
+            saved = frame.encoded("global", encoding)
+            frame.encoded("local", encoding)
+            data = frame.encoded_base64("global", encoding)
+            frame.encoded_base64("local", encoding)
+
+        self.assertEqual(frame.filename("global", encoding, "20240101_000000_000000"), "global_20240101_000000_000000.png")
+        self.assertEqual(encode.call_count, 2)
+        self.assertEqual(saved, b"encoded")
+        self.assertEqual(base64.b64decode(data), b"encoded")
+
+    def test_each_encoding_is_cached_separately(self):
+        frame = make_frame()
+
+        png = frame.encoded("local", parse_image_encoding("png"))
+        webp = frame.encoded("local", parse_image_encoding("webp:lossless"))
+
+        self.assertTrue(png.startswith(b"\x89PNG"))
+        self.assertTrue(webp.startswith(b"RIFF"))
+
+    def test_concurrent_callers_wait_for_a_single_encode(self):
+        frame = make_frame()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow_encode(self, image):
+            calls.append(image)
+            started.set()
+            release.wait(5)
+            return b"encoded"
+
+        with patch.object(ImageEncoding, "encode", autospec=True, side_effect=slow_encode):
+            worker = threading.Thread(target=frame.encoded, args=("local", ImageEncoding()))
+            worker.start()
+            started.wait(5)
+            waiter = threading.Thread(target=frame.encoded, args=("local", ImageEncoding()))
+            waiter.start()
+            release.set()
+            worker.join(5)
+            waiter.join(5)
+
+        self.assertEqual(len(calls), 1)
+
+    def test_local_only_frame_has_no_global_view_to_encode(self):
+        frame = make_frame()
+
+        self.assertTrue(frame.local_only)
+        self.assertEqual(frame.images()[0], None)
+        with self.assertRaises(ValueError):
+            frame.encoded("global", ImageEncoding())
+        with self.assertRaises(KeyError):
+            frame.image("side")
+
+
+if __name__ == "__main__":
+    unittest.main()
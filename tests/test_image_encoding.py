@@ -0,0 +1,34 @@
+import unittest
+from io import BytesIO
+
+from PIL import Image
+
+from scripts.image_encoding import ImageEncoding, parse_image_encoding
+
+
+class ImageEncodingTests(unittest.TestCase):
+    def test_parse_accepts_format_options_and_aliases(self):
+        self.assertEqual(parse_image_encoding("png"), ImageEncoding("png"))
+        self.assertEqual(parse_image_encoding("PNG:1"), ImageEncoding("png", 1))
+        self.assertEqual(parse_image_encoding("jpg:85"), ImageEncoding("jpeg", 85))
+        self.assertEqual(parse_image_encoding("webp:lossless"), ImageEncoding("webp", lossless=True))
+        self.assertEqual(str(parse_image_encoding("webp:80")), "webp:80")
+
+    def test_parse_rejects_unknown_formats_and_out_of_range_options(self):
+        for spec in ("gif", "png:10", "jpeg:0", "webp:high", "png:lossless"):
+            with self.assertRaises(ValueError, msg=spec):
+                parse_image_encoding(spec)
+
+    def test_encode_writes_the_selected_format(self):
+        image = Image.new("RGB", (32, 24), color="red")
+
+        for spec, expected in (("png:1", "PNG"), ("jpeg:70", "JPEG"), ("webp:lossless", "WEBP")):
+            encoded = Image.open(BytesIO(parse_image_encoding(spec).encode(image)))
+            self.assertEqual((encoded.format, encoded.size), (expected, (32, 24)))
+
+        lossless = Image.open(BytesIO(parse_image_encoding("webp:lossless").encode(image))).convert("RGB")
+        self.assertEqual(lossless.getpixel((5, 5)), (255, 0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
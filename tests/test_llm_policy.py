@@ -0,0 +1,188 @@
+import asyncio
+import os
+import time
+import unittest
+from types import SimpleNamespace
+
+os.environ.setdefault("LLM_API_ENDPOINT", "http://example.invalid/v1")
+os.environ.setdefault("LLM_API_KEY", "sk-test")
+os.environ.setdefault("LLM_MODEL_NAME", "fake-model")
+
+from openai import AsyncOpenAI
+
+from scripts.fake_llm_server import FakeLLMServer
+from scripts.llm_policy import RequestPolicy
+
+
+MESSAGES = [{"role": "user", "content": "ping"}]
+
+
+def fake_server(latency=0.01, fault=None):
+    return FakeLLMServer(latency=latency, prefill_ms_per_1k=0, decode_ms_per_token=0, fault=fault)
+
+
+def client_for(server):
+    return AsyncOpenAI(base_url=server.url, api_key="fake", max_retries=0)
+
+
+class RejectedRequest(Exception):
+    # Like openai.BadRequestError
+    status_code = 400
+
+
+class FakeStream:
+    def __init__(self, chunks, first_delay=0.0, chunk_delay=0.0):
+        self.chunks = chunks
+        self.first_delay = first_delay
+        self.chunk_delay = chunk_delay
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for index, chunk in enumerate(self.chunks):
+            await asyncio.sleep(self.first_delay if index == 0 else self.chunk_delay)
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeStreamingClient:
+    def __init__(self, make_stream):
+        self.make_stream = make_stream
+        self.streams = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        stream = self.make_stream(len(self.streams))
+        self.streams.append(stream)
+        return stream
+
+
+class RequestPolicyTests(unittest.TestCase):
+    def test_slow_request_is_hedged_after_the_observed_percentile(self):
+        # Request 10 stalls; its hedge (request 11) answers normally
+        with fake_server(latency=lambda index: 5.0 if index == 10 else 0.02) as server:
+
+            async def run():
+                policy = RequestPolicy(client_for(server), deadline=0, hedge_percentile=90, hedge_min_samples=10)
+                for _ in range(10):
+                    await policy.create(model="fake-model", messages=MESSAGES)
+                started = time.perf_counter()
+                response = await policy.create(model="fake-model", messages=MESSAGES)
+                seconds = time.perf_counter() - started
+                await policy.close()
+                return policy, response, seconds
+
+            policy, response, seconds = asyncio.run(run())
+
+        self.assertEqual(response.choices[0].message.content, "OK")
+        self.assertLess(seconds, 1.0)
+        self.assertEqual(policy.hedges, 1)
+        self.assertEqual(server.received, 12)
+
+    def test_retry_after_is_honoured_before_retrying(self):
+        fault = lambda index, body: (429, {"retry-after-ms": "300"}) if index == 0 else None
+        with fake_server(fault=fault) as server:
+
+            async def run():
+                policy = RequestPolicy(client_for(server), deadline=5, max_retries=2, retry_base_seconds=0.01, hedge_percentile=0)
+                started = time.perf_counter()
+                await policy.create(model="fake-model", messages=MESSAGES)
+                return policy, time.perf_counter() - started
+
+            policy, seconds = asyncio.run(run())
+
+        self.assertEqual(policy.retries, 1)
+        self.assertGreaterEqual(seconds, 0.3)
+        self.assertEqual([request["status"] for request in sorted(server.requests, key=lambda r: r["index"])], [429, 200])
+
+    def test_repeated_timeouts_switch_to_the_fallback_model(self):
+        with fake_server(latency=2.0) as primary, fake_server() as fallback:
+
+            async def run():
+                policy = RequestPolicy(
+                    client_for(primary),
+                    fallback_client=client_for(fallback),
+                    fallback_model="small-model",
+                    deadline=0,
+                    attempt_timeout=0.2,
+                    max_retries=2,
+                    retry_base_seconds=0.01,
+                    hedge_percentile=0,
+                    fallback_after=2,
+                )
+                started = time.perf_counter()
+                await policy.create(model="fake-model", messages=MESSAGES)
+                return time.perf_counter() - started
+
+            seconds = asyncio.run(run())
+
+        self.assertLess(seconds, 1.5)
+        self.assertEqual(primary.received, 2)
+        self.assertEqual([request["model"] for request in fallback.requests], ["small-model"])
+
+    def test_deadline_bounds_the_whole_call(self):
+        with fake_server(latency=3.0) as server:
+
+            async def run():
+                policy = RequestPolicy(client_for(server), deadline=0.4, max_retries=5, retry_base_seconds=0.01, hedge_percentile=0)
+                started = time.perf_counter()
+                with self.assertRaises(asyncio.TimeoutError):
+                    await policy.create(model="fake-model", messages=MESSAGES)
+                return time.perf_counter() - started
+
+            self.assertLess(asyncio.run(run()), 1.0)
+
+    def test_client_errors_past_the_deadline_are_not_reported_as_timeouts(self):
+        async def create(**kwargs):
+            # Blocks the loop past the deadline, then fails like a rejected request
+            time.sleep(0.3)
+            raise RejectedRequest("bad request")
+
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        policy = RequestPolicy(client, deadline=0.1, max_retries=3, hedge_percentile=0)
+
+        with self.assertRaises(RejectedRequest):
+            asyncio.run(policy.create(model="fake-model", messages=MESSAGES, stream=False))
+
+    def test_deadline_covers_reading_the_stream(self):
+        client = FakeStreamingClient(lambda index: FakeStream(["a", "b", "c"], chunk_delay=1.0))
+        policy = RequestPolicy(client, deadline=0.3, hedge_percentile=0)
+
+        async def run():
+            stream = await policy.create(model="fake-model", messages=MESSAGES, stream=True)
+            chunks = []
+            with self.assertRaises(asyncio.TimeoutError):
+                async for chunk in stream:
+                    chunks.append(chunk)
+            return chunks
+
+        started = time.perf_counter()
+        self.assertEqual(asyncio.run(run()), ["a"])
+        self.assertLess(time.perf_counter() - started, 0.8)
+        self.assertTrue(client.streams[0].closed)
+
+    def test_stream_stalled_before_its_first_chunk_is_hedged(self):
+        client = FakeStreamingClient(lambda index: FakeStream(["a", "b"], first_delay=5.0 if index == 10 else 0.01))
+        policy = RequestPolicy(client, deadline=0, hedge_percentile=90, hedge_min_samples=10)
+
+        async def run():
+            for _ in range(10):
+                [chunk async for chunk in await policy.create(model="fake-model", messages=MESSAGES, stream=True)]
+            started = time.perf_counter()
+            chunks = [chunk async for chunk in await policy.create(model="fake-model", messages=MESSAGES, stream=True)]
+            return chunks, time.perf_counter() - started
+
+        chunks, seconds = asyncio.run(run())
+
+        self.assertEqual(chunks, ["a", "b"])
+        self.assertLess(seconds, 1.0)
+        self.assertEqual(policy.hedges, 1)
+        self.assertTrue(client.streams[10].closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
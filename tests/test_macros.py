@@ -0,0 +1,176 @@
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest.mock import patch
+
+os.environ.setdefault("LLM_API_ENDPOINT", "http://example.invalid/v1")
+os.environ.setdefault("LLM_API_KEY", "sk-test")
+os.environ.setdefault("LLM_MODEL_NAME", "fake-model")
+os.environ.setdefault("DEBUG_MODE", "False")
+os.environ.setdefault("MEMORY_TOKEN_CALIBRATION_FILE", "off")
+os.environ.setdefault("CHECKPOINT_DIR", "off")
+os.environ.setdefault("MACRO_DIR", "off")
+os.environ.setdefault("TRAJECTORY_STORE_FILE", "off")
+
+import numpy as np
+from PIL import Image
+
+import scripts.agent as agent_module
+from scripts.frame import CapturedFrame
+from scripts.macros import MacroRecorder, fingerprints_match, load_macro
+
+
+BUTTON = np.full((8, 8), 200, dtype=np.int16)
+
+
+class FakeVision:
+    # Region fingerprint per screen point; the tests repaint it to simulate a changed screen
+    regions = {}
+
+    def __init__(self, *args, **kwargs):
+        self.last_capture_files = None
+        self.captures = 0
+        self.fingerprints = 0
+
+    def capture_state(self, mouse_x, mouse_y, local_only=False):
+        self.captures += 1
+        return CapturedFrame(None, Image.new("RGB", (8, 8)), {"G-00-00": (5, 6)}, "L-00-00", "G-00-00")
+
+    def region_fingerprint(self, x, y):
+        self.fingerprints += 1
+        return self.regions.get((x, y), np.zeros((8, 8), dtype=np.int16))
+
+
+class FakeExecutor:
+    def __init__(self, *args, **kwargs):
+        self.mouse_x, self.mouse_y = 0, 0
+        self.executed = []
+
+    def get_mouse_position(self):
+        return self.mouse_x, self.mouse_y
+
+    def execute(self, action_dict, coordinate_map=None, log_callback=None):
+        self.executed.append(action_dict["action_type"])
+        if action_dict["action_type"] == "move":
+            self.mouse_x, self.mouse_y = coordinate_map[action_dict["point_id"]]
+        return f"executed {action_dict['action_type']}"
+
+
+def tool_response(name, arguments):
+    return {
+        "choices": [
+            {
+                "finish_reason": "tool_calls",
+                "message": {
+                    "content": f"Calling {name}.",
+                    "tool_calls": [
+                        {"id": f"call_{name}", "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+                    ],
+                },
+            }
+        ]
+    }
+
+
+class MacroTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "macro.json")
+        for name, fake in (("VisionPerceptor", FakeVision), ("ActionExecutor", FakeExecutor)):
+            patcher = patch.object(agent_module, name, fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        FakeVision.regions = {(5, 6): BUTTON}
+
+    def make_agent(self, responses):
+        agent = agent_module.IrisAgent("open the settings")
+        agent.macro_recorder = MacroRecorder(os.path.join(self.directory.name, "new.json"), agent.task_description)
+        agent.llm_prompts = []
+
+        def fake_call(messages):
+            agent.llm_prompts.append(messages)
+            return responses.pop(0)
+
+        agent._call_llm_for_action = fake_call
+        return agent
+
+    def record(self):
+        agent = self.make_agent([tool_response("move", {"point_id": "G-00-00"}), tool_response("click", {})])
+        agent.macro_recorder.path = self.path
+        with redirect_stdout(StringIO()):
+            agent.step()
+            agent.step()
+        return agent
+
+    def test_run_records_targets_and_click_fingerprints(self):
+        self.record()
+
+        steps = load_macro(self.path)["steps"]
+        self.assertEqual([step["step"] for step in steps], [1, 2])
+        move, click = steps[0]["actions"][0], steps[1]["actions"][0]
+        self.assertEqual(move["tool"], {"name": "move", "arguments": {"point_id": "G-00-00"}})
+        self.assertEqual(move["position"], [5, 6])
+        self.assertIsNone(move["fingerprint"])
+        self.assertEqual(click["position"], [5, 6])
+        self.assertEqual(click["fingerprint"], BUTTON.tolist())
+
+    def test_clicks_skip_the_region_grab_when_recording_is_off(self):
+        agent = self.make_agent([tool_response("move", {"point_id": "G-00-00"}), tool_response("click", {})])
+        with patch("scripts.macros.MACRO_DIR", "off"):
+            agent.macro_recorder = agent_module.IrisAgent("open the settings").macro_recorder
+
+        with redirect_stdout(StringIO()):
+            agent.step()
+            agent.step()
+
+        self.assertIsNone(agent.macro_recorder)
+        self.assertEqual(agent.executor.executed, ["move", "click"])
+        self.assertEqual(agent.vision.fingerprints, 0)
+
+    def test_matching_screen_replays_without_the_model(self):
+        self.record()
+        agent = self.make_agent([])
+        agent.replay_macro(self.path)
+
+        with redirect_stdout(StringIO()):
+            first = agent.step()
+            second = agent.step()
+
+        self.assertEqual(agent.executor.executed, ["move", "click"])
+        self.assertEqual((first, second), ("executed move", "executed click"))
+        self.assertEqual(agent.llm_prompts, [])
+        self.assertEqual(agent.vision.captures, 0)
+        self.assertFalse(agent.macro_player.active)
+        self.assertEqual(agent.step_count, 2)
+        self.assertIn("Replayed recorded actions", agent.memory.short_memory_layer[0]["content"])
+
+    def test_changed_screen_falls_back_to_the_model_before_clicking(self):
+        self.record()
+        agent = self.make_agent([tool_response("move", {"point_id": "G-00-00"})])
+        agent.replay_macro(self.path)
+        FakeVision.regions = {(5, 6): BUTTON + 60}
+
+        with redirect_stdout(StringIO()):
+            agent.step()
+            feedback = agent.step()
+
+        # The recorded click never ran; the model was asked instead
+        self.assertEqual(agent.executor.executed, ["move", "move"])
+        self.assertEqual(feedback, "executed move")
+        self.assertEqual(len(agent.llm_prompts), 1)
+        self.assertEqual(agent.step_count, 2)
+        self.assertFalse(agent.macro_player.active)
+
+    def test_fingerprints_match_within_threshold_and_same_shape(self):
+        self.assertTrue(fingerprints_match(BUTTON.tolist(), BUTTON + 10, 12))
+        self.assertFalse(fingerprints_match(BUTTON.tolist(), BUTTON + 20, 12))
+        self.assertFalse(fingerprints_match(BUTTON.tolist(), BUTTON[:4], 12))
+        self.assertFalse(fingerprints_match(None, BUTTON, 12))
+
+
+if __name__ == "__main__":
+    unittest.main()
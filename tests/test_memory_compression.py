@@ -1,5 +1,11 @@
+import json
 import os
+import threading
+import time
 import unittest
+from unittest.mock import patch
+
+from PIL import Image
 
 os.environ.setdefault("LLM_API_ENDPOINT", "http://example.invalid/v1")
 os.environ.setdefault("LLM_API_KEY", "sk-test")
@@ -13,6 +19,10 @@ os.environ.setdefault("MOUSE_COLOR", "white")
 os.environ.setdefault("MOUSE_WIDTH", "4")
 os.environ.setdefault("MAX_STEPS", "100")
 os.environ.setdefault("DEBUG_MODE", "False")
+os.environ.setdefault("MEMORY_TOKEN_CALIBRATION_FILE", "off")
+os.environ.setdefault("CHECKPOINT_DIR", "off")
+os.environ.setdefault("MACRO_DIR", "off")
+os.environ.setdefault("TRAJECTORY_STORE_FILE", "off")
 os.environ.setdefault("MEMORY_SHORT_TOKEN_BUDGET", "6000")
 os.environ.setdefault("MEMORY_LONG_TOKEN_BUDGET", "12000")
 os.environ.setdefault("MEMORY_RECENT_INTERACTIONS_TO_KEEP", "3")
@@ -28,12 +38,18 @@ class MemoryCompressionTests(unittest.TestCase):
         self.old_long_budget = memory_module.MEMORY_LONG_TOKEN_BUDGET
         self.old_recent_keep = memory_module.MEMORY_RECENT_INTERACTIONS_TO_KEEP
         self.old_chars_per_token = memory_module.MEMORY_CHARS_PER_TOKEN
+        self.old_background = memory_module.MEMORY_BACKGROUND_COMPRESSION
+        self.old_soft_ratio = memory_module.MEMORY_COMPRESSION_SOFT_RATIO
+        memory_module.MEMORY_BACKGROUND_COMPRESSION = True
+        memory_module.MEMORY_COMPRESSION_SOFT_RATIO = 0.75
 
     def tearDown(self):
         memory_module.MEMORY_SHORT_TOKEN_BUDGET = self.old_short_budget
         memory_module.MEMORY_LONG_TOKEN_BUDGET = self.old_long_budget
         memory_module.MEMORY_RECENT_INTERACTIONS_TO_KEEP = self.old_recent_keep
         memory_module.MEMORY_CHARS_PER_TOKEN = self.old_chars_per_token
+        memory_module.MEMORY_BACKGROUND_COMPRESSION = self.old_background
+        memory_module.MEMORY_COMPRESSION_SOFT_RATIO = self.old_soft_ratio
 
     def test_short_memory_under_token_budget_does_not_compress(self):
         memory_module.MEMORY_SHORT_TOKEN_BUDGET = 1000
@@ -53,6 +69,161 @@ class MemoryCompressionTests(unittest.TestCase):
         self.assertEqual(memory.estimate_tokens_for_text("中文测试"), 4)
         self.assertEqual(memory.estimate_tokens_for_text("abcd中文"), 3)
 
+    def test_fast_estimate_matches_per_character_count(self):
+        memory_module.MEMORY_CHARS_PER_TOKEN = 4
+        memory = StubMemory()
+
+        def per_character(text):
+            ascii_chars = sum(1 for char in text if ord(char) < 128 or char.isspace())
+            return max(1, int(ascii_chars / 4) + len(text) - ascii_chars)
+
+        for text in ["", "plain ascii text", "tab\tand\nnewline", "中文 mixed\u00a0text\u3000here", "émoji 🙂 ok", "\u2028\u2029"]:
+            self.assertEqual(memory.estimate_tokens_for_text(text), per_character(text), text)
+
+    def test_layer_totals_follow_appends_and_compression_without_re_estimating(self):
+        memory_module.MEMORY_SHORT_TOKEN_BUDGET = 10**6
+        memory = StubMemory()
+        for index in range(20):
+            memory.add_interaction(f"assistant {index} " * 10, f"user {index} " * 10)
+
+        with patch.object(memory_module, "count_text", wraps=memory_module.count_text) as count_text:
+            memory.add_interaction("assistant last", "user last")
+
+        # Only the two new steps (role + content each) were measured
+        self.assertEqual(count_text.call_count, 4)
+        self.assertEqual(memory.short_memory_layer.total_tokens, recounted_tokens(memory, memory.short_memory_layer))
+
+        memory_module.MEMORY_SHORT_TOKEN_BUDGET = 8
+        memory_module.MEMORY_RECENT_INTERACTIONS_TO_KEEP = 1
+        memory.add_interaction("assistant newest", "user newest", log_callback=lambda _: None)
+
+        self.assertEqual(len(memory.short_memory_layer), 2)
+        for layer in (memory.short_memory_layer, memory.long_memory_layer):
+            self.assertEqual(layer.total_tokens, recounted_tokens(memory, layer))
+
+    def test_assigned_layers_are_counted(self):
+        memory = StubMemory()
+        memory.long_memory_layer = [{"role": "assistant", "content": "old long summary " * 8}]
+
+        self.assertEqual(memory.estimate_tokens_for_steps(memory.long_memory_layer), 36)
+        memory.long_memory_layer.pop()
+        self.assertEqual(memory.long_memory_layer.total_tokens, 0)
+
+    def test_budget_uses_calibrated_chars_per_token(self):
+        memory_module.MEMORY_SHORT_TOKEN_BUDGET = 100
+        memory_module.MEMORY_RECENT_INTERACTIONS_TO_KEEP = 0
+        memory = StubMemory()
+        memory.add_interaction("a" * 100, "b" * 100)
+        self.assertEqual(memory.compress_calls, [])
+
+        # The endpoint reports twice the tokens the 4 chars/token default predicts
+        for _ in range(20):
+            request = [{"role": "user", "content": "x" * 4000}]
+            memory.record_usage(request, {"usage": {"prompt_tokens": 2000, "completion_tokens": 0}, "choices": []})
+        memory.add_interaction("c", "d", log_callback=lambda _: None)
+
+        self.assertAlmostEqual(memory.token_rates()[0], 2.0, delta=0.1)
+        self.assertEqual(len(memory.compress_calls), 1)
+
+    def test_query_screenshots_count_against_the_short_budget(self):
+        memory_module.MEMORY_SHORT_TOKEN_BUDGET = 200
+        memory_module.MEMORY_RECENT_INTERACTIONS_TO_KEEP = 0
+        memory = StubMemory()
+        with patch.object(memory_module, "MEMORY_IMAGE_TOKENS", 50):
+            memory.get_full_context("query", images=[None, Image.new("RGB", (8, 8))])
+            memory.add_interaction("a" * 150, "b" * 150)
+            self.assertEqual(memory.short_token_budget(), 150)
+            self.assertEqual(memory.compress_calls, [])
+
+            # The same history no longer fits next to two screenshots per query
+            memory.get_full_context("query", images=[Image.new("RGB", (8, 8)), Image.new("RGB", (8, 8))])
+            memory.add_interaction("c", "d", log_callback=lambda _: None)
+
+            self.assertEqual(memory.short_token_budget(), 100)
+            self.assertEqual(len(memory.compress_calls), 1)
+
+    def test_token_calibration_is_saved_periodically_and_on_request(self):
+        memory = StubMemory()
+        memory.token_calibration.save_interval = 60.0
+        request = [{"role": "user", "content": "x" * 4000}]
+        usage = {"usage": {"prompt_tokens": 1000, "completion_tokens": 0}, "choices": []}
+        saves = []
+        with patch.object(memory.token_calibration, "save", side_effect=lambda: saves.append(1)):
+            for _ in range(5):
+                memory.record_usage(request, usage)
+            self.assertEqual(saves, [])
+
+            memory.token_calibration._saved_at -= 60.0
+            memory.record_usage(request, usage)
+            self.assertEqual(len(saves), 1)
+
+            memory.save_token_calibration()
+            self.assertEqual(len(saves), 2)
+
+    def test_context_prefix_is_stable_between_compressions(self):
+        # Each query's screenshot comes out of the short budget
+        memory_module.MEMORY_SHORT_TOKEN_BUDGET = 1000 + memory_module.MEMORY_IMAGE_TOKENS
+        memory_module.MEMORY_RECENT_INTERACTIONS_TO_KEEP = 1
+        memory = StubMemory()
+        memory.long_memory_layer = [{"role": "assistant", "content": "Long Term Memory: earlier work"}]
+
+        previous = None
+        for index in range(4):
+            messages = memory.get_full_context(f"query {index}", images=[None, Image.new("RGB", (8, 8))])
+            if previous is not None:
+                # Only the previous query is dropped; everything before it is byte-identical
+                self.assertEqual(json.dumps(messages[:len(previous) - 1]), json.dumps(previous[:-1]))
+            previous = messages
+            memory.add_interaction(f"assistant {index} " * 10, f"user {index} " * 10, log_callback=lambda _: None)
+
+        memory_module.MEMORY_SHORT_TOKEN_BUDGET = 100
+        memory.add_interaction("assistant last", "user last", log_callback=lambda _: None)
+        self.assertEqual(len(memory.compress_calls), 1)
+        messages = memory.get_full_context("after compression")
+        # A compression keeps the fixed layer and the older long memory as the shared prefix
+        self.assertEqual(json.dumps(messages[:3]), json.dumps(previous[:3]))
+
+    def test_context_layout_orders_task_message(self):
+        memory = StubMemory()
+        memory.long_memory_layer = [{"role": "assistant", "content": "Long Term Memory: earlier work"}]
+        memory.add_interaction("assistant 0", "user 0", log_callback=lambda _: None)
+        system, task = memory.fixed_layer
+
+        def contents(messages):
+            return [message["content"] if isinstance(message["content"], str) else "query" for message in messages]
+
+        with patch.object(memory_module, "MEMORY_CONTEXT_LAYOUT", "cache"):
+            messages = memory.get_full_context("query")
+        self.assertEqual(
+            contents(messages),
+            [system["content"], task["content"], "Long Term Memory: earlier work", "assistant 0", "user 0", "query"],
+        )
+
+        with patch.object(memory_module, "MEMORY_CONTEXT_LAYOUT", "task_last"):
+            messages = memory.get_full_context("query")
+            memory.add_interaction("assistant 1", "user 1", log_callback=lambda _: None)
+            next_messages = memory.get_full_context("query")
+        self.assertEqual(
+            contents(messages),
+            [system["content"], "Long Term Memory: earlier work", "assistant 0", "user 0", task["content"], "query"],
+        )
+        # The history before the restated task is still a shared prefix
+        self.assertEqual(json.dumps(next_messages[:4]), json.dumps(messages[:4]))
+        self.assertEqual(contents(next_messages)[-2:], [task["content"], "query"])
+
+    def test_record_usage_reports_cached_prompt_tokens(self):
+        memory = StubMemory()
+        request = [{"role": "user", "content": "x" * 400}]
+        openai_usage = {"prompt_tokens": 120, "completion_tokens": 5, "prompt_tokens_details": {"cached_tokens": 64}}
+        deepseek_usage = {"prompt_tokens": 120, "completion_tokens": 5, "prompt_cache_hit_tokens": 96}
+
+        self.assertEqual(
+            memory.record_usage(request, {"usage": openai_usage, "choices": []}),
+            {"prompt_tokens": 120, "completion_tokens": 5, "cached_tokens": 64},
+        )
+        self.assertEqual(memory.record_usage(request, {"usage": deepseek_usage, "choices": []})["cached_tokens"], 96)
+        self.assertIsNone(memory.record_usage(request, {"choices": []}))
+
     def test_short_memory_over_budget_compresses_old_interactions_and_keeps_recent_pairs(self):
         memory_module.MEMORY_SHORT_TOKEN_BUDGET = 8
         memory_module.MEMORY_RECENT_INTERACTIONS_TO_KEEP = 1
@@ -80,6 +251,135 @@ class MemoryCompressionTests(unittest.TestCase):
         self.assertEqual(len(memory.compress_calls), 2)
         self.assertEqual(memory.long_memory_layer, [{"role": "assistant", "content": "Long Term Memory: compressed 2"}])
 
+    def test_soft_budget_compresses_in_background_without_losing_steps(self):
+        memory_module.MEMORY_SHORT_TOKEN_BUDGET = 100
+        memory_module.MEMORY_RECENT_INTERACTIONS_TO_KEEP = 1
+        memory = BlockingStubMemory()
+        self.addCleanup(memory.release.set)
+
+        memory.add_interaction("a1 " * 30, "u1 " * 30, log_callback=lambda _: None)
+        memory.add_interaction("a2 " * 30, "u2 " * 30, log_callback=lambda _: None)
+        self.assertTrue(memory.started.wait(5))
+
+        # The step returned while the summary is pending; the next context still has every step
+        context = memory.get_full_context("next")
+        self.assertEqual([message["content"][:2] for message in context[2:-1]], ["a1", "u1", "a2", "u2"])
+        memory.add_interaction("a3", "u3", log_callback=lambda _: None)
+
+        memory.release.set()
+        self.assertTrue(memory.wait_for_compression(timeout=5))
+
+        self.assertEqual([step["content"][:2] for step in memory.short_memory_layer], ["a2", "u2", "a3", "u3"])
+        self.assertEqual(memory.long_memory_layer, [{"role": "assistant", "content": "History Summary: compressed 1"}])
+        self.assertEqual([step["content"][:2] for step in memory.compress_calls[0]], ["a1", "u1"])
+
+    def test_hard_budget_waits_for_running_compression(self):
+        memory_module.MEMORY_SHORT_TOKEN_BUDGET = 100
+        memory_module.MEMORY_RECENT_INTERACTIONS_TO_KEEP = 1
+        memory = BlockingStubMemory()
+        memory.add_interaction("a1 " * 30, "u1 " * 30, log_callback=lambda _: None)
+        memory.add_interaction("a2 " * 30, "u2 " * 30, log_callback=lambda _: None)
+        self.assertTrue(memory.started.wait(5))
+        threading.Timer(0.1, memory.release.set).start()
+
+        memory.add_interaction("a3 " * 60, "u3 " * 60, log_callback=lambda _: None)
+
+        # Waited for the first summary, then compressed again synchronously to get under budget
+        self.assertEqual(len(memory.compress_calls), 2)
+        self.assertEqual([step["content"][:2] for step in memory.compress_calls[1]], ["a2", "u2"])
+        self.assertEqual([step["content"][:2] for step in memory.short_memory_layer], ["a3", "u3"])
+        self.assertEqual(len(memory.long_memory_layer), 2)
+
+    def test_swapped_in_background_result_is_held_to_the_budgets(self):
+        memory_module.MEMORY_SHORT_TOKEN_BUDGET = 100
+        memory_module.MEMORY_LONG_TOKEN_BUDGET = 100
+        memory_module.MEMORY_RECENT_INTERACTIONS_TO_KEEP = 1
+        memory = LongFailingStubMemory()
+        self.addCleanup(memory.release.set)
+        messages = []
+
+        memory.add_interaction("a1 " * 30, "u1 " * 30, log_callback=messages.append)
+        memory.long_memory_layer = [{"role": "assistant", "content": f"History Summary: part {index} " * 12} for index in range(2)]
+        memory.add_interaction("a2 " * 30, "u2 " * 30, log_callback=messages.append)
+        self.assertTrue(memory.started.wait(5))
+        memory.release.set()
+        memory._pending_compression.result(timeout=5)
+
+        # The long summary failed, so the swapped-in layer is over budget until it is extracted locally
+        memory.get_full_context("next")
+
+        self.assertLessEqual(memory.long_memory_layer.total_tokens, 100)
+        self.assertEqual(len(memory.long_memory_layer), 1)
+        self.assertTrue(any("Long memory consolidated locally" in message for message in messages))
+
+    def test_failed_background_compression_keeps_steps(self):
+        memory_module.MEMORY_SHORT_TOKEN_BUDGET = 100
+        memory_module.MEMORY_RECENT_INTERACTIONS_TO_KEEP = 0
+        memory = FailingStubMemory()
+        messages = []
+
+        memory.add_interaction("a1 " * 50, "u1 " * 50, log_callback=messages.append)
+        memory.wait_for_compression(timeout=5)
+
+        self.assertEqual(len(memory.short_memory_layer), 2)
+        self.assertEqual(memory.long_memory_layer, [])
+        self.assertTrue(any("Error compressing short memory" in message for message in messages))
+
+    def test_failed_compression_backs_off_exponentially(self):
+        memory_module.MEMORY_SHORT_TOKEN_BUDGET = 100
+        memory_module.MEMORY_RECENT_INTERACTIONS_TO_KEEP = 0
+        memory_module.MEMORY_BACKGROUND_COMPRESSION = False
+        memory = FailingStubMemory()
+        clock = [1000.0]
+        log = lambda _: None
+
+        with patch.object(memory_module, "time") as fake_time, patch.object(
+            memory_module, "MEMORY_COMPRESSION_RETRY_SECONDS", 10.0
+        ), patch.object(memory_module, "MEMORY_COMPRESSION_RETRY_MAX_SECONDS", 30.0):
+            fake_time.monotonic = lambda: clock[0]
+            memory.add_interaction("a1 " * 50, "u1 " * 50, log_callback=log)
+            self.assertEqual(len(memory.compress_calls), 1)
+            self.assertEqual(memory._compression_retry_at, 1010.0)
+
+            # Within the backoff the growing history is not sent again
+            memory.add_interaction("a2", "u2", log_callback=log)
+            self.assertEqual(len(memory.compress_calls), 1)
+
+            delays = []
+            for _ in range(3):
+                clock[0] = memory._compression_retry_at
+                memory.add_interaction("a3", "u3", log_callback=log)
+                delays.append(memory._compression_retry_at - clock[0])
+            self.assertEqual(len(memory.compress_calls), 4)
+            self.assertEqual(delays, [20.0, 30.0, 30.0])
+
+    def test_failing_summarizer_never_leaves_memory_over_budget(self):
+        memory_module.MEMORY_SHORT_TOKEN_BUDGET = 400
+        memory_module.MEMORY_LONG_TOKEN_BUDGET = 400
+        memory_module.MEMORY_RECENT_INTERACTIONS_TO_KEEP = 1
+        memory_module.MEMORY_BACKGROUND_COMPRESSION = False
+        memory = FailingStubMemory()
+        messages = []
+
+        for index in range(20):
+            memory.add_interaction(
+                f"Clicking the save button.\nTool call: click\nArguments: {{\"index\": {index}}}",
+                "Execution Result: Action click executed. " + "details " * 40
+                + ("\nError: Point ID 'G-99-99' not found in coordinate map." if index == 3 else ""),
+                log_callback=messages.append,
+            )
+            self.assertLessEqual(memory.short_memory_layer.total_tokens, 400)
+            self.assertLessEqual(memory.long_memory_layer.total_tokens, 400)
+
+        # The model was only asked once; everything else was extracted locally
+        self.assertEqual(len(memory.compress_calls), 1)
+        self.assertTrue(any("compressed locally" in message for message in messages))
+        long_text = "\n".join(step["content"] for step in memory.long_memory_layer)
+        self.assertIn('click {"index": 17}', long_text)
+        self.assertIn("Error: Point ID 'G-99-99'", long_text)
+        # Long execution results only survive in the shortened last-state line
+        self.assertNotIn("details " * 20, long_text)
+
     def test_add_interaction_writes_complete_pair_before_compression(self):
         memory_module.MEMORY_SHORT_TOKEN_BUDGET = 8
         memory_module.MEMORY_RECENT_INTERACTIONS_TO_KEEP = 0
@@ -91,6 +391,48 @@ class MemoryCompressionTests(unittest.TestCase):
         self.assertEqual([step["role"] for step in memory.compress_calls[0]], ["assistant", "user"])
 
 
+    def test_long_history_is_summarized_in_bounded_parallel_chunks(self):
+        memory = ConcurrencyStubMemory()
+        steps = [{"role": "user", "content": f"s{index:02d} " + "x" * 392} for index in range(16)]
+
+        with patch.object(memory_module, "MEMORY_COMPRESSION_CHUNK_TOKENS", 250), patch.object(
+            memory_module, "MEMORY_COMPRESSION_WORKERS", 4
+        ):
+            summary = memory.compress_memory_tree(
+                steps, memory_module.SHORT_MEMORY_COMPRESSION_INSTRUCTIONS, memory_module.SHORT_MEMORY_MERGE_INSTRUCTIONS
+            )
+
+        # 8 chunks of two steps, then one request merging the 8 chunk summaries
+        self.assertEqual(len(memory.requests), 9)
+        self.assertTrue(all(tokens <= 250 for tokens, _ in memory.requests))
+        self.assertEqual([len(chunk) for chunk in memory.compress_calls[:8]], [2] * 8)
+        self.assertEqual(
+            [instructions for _, instructions in memory.requests],
+            [memory_module.SHORT_MEMORY_COMPRESSION_INSTRUCTIONS] * 8 + [memory_module.SHORT_MEMORY_MERGE_INSTRUCTIONS],
+        )
+        self.assertGreater(memory.peak, 1)
+        # The merge sees the chunk summaries in history order
+        self.assertEqual(
+            sorted(step["content"] for step in memory.compress_calls[-1]),
+            sorted(f"History Summary: compressed {index}" for index in range(1, 9)),
+        )
+        self.assertEqual(summary, "History Summary: compressed 9")
+
+    def test_oversized_entries_still_merge_down_to_one_summary(self):
+        memory = StubMemory()
+        steps = [{"role": "assistant", "content": "y" * 400} for _ in range(5)]
+
+        with patch.object(memory_module, "MEMORY_COMPRESSION_CHUNK_TOKENS", 10):
+            summary = memory.compress_memory_tree(steps, memory_module.LONG_MEMORY_COMPRESSION_INSTRUCTIONS)
+
+        self.assertEqual([len(chunk) for chunk in memory.compress_calls], [2, 2, 1, 2, 1, 2])
+        self.assertEqual(summary, "Long Term Memory: compressed 6")
+
+
+def recounted_tokens(memory, layer):
+    return memory.tokens_for_counts(*[sum(counts) for counts in zip(*map(memory.measure_step, layer))])
+
+
 class StubMemory(HierarchicalMemory):
     def __init__(self):
         super().__init__("system prompt", "initial task")
@@ -103,5 +445,50 @@ class StubMemory(HierarchicalMemory):
         return f"History Summary: compressed {len(self.compress_calls)}"
 
 
+class BlockingStubMemory(StubMemory):
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def compress_memory(self, memory_list, instructions, max_tokens=None):
+        self.started.set()
+        self.release.wait(5)
+        return super().compress_memory(memory_list, instructions, max_tokens)
+
+
+class LongFailingStubMemory(BlockingStubMemory):
+    def compress_memory(self, memory_list, instructions, max_tokens=None):
+        if "Consolidate" in instructions:
+            self.compress_calls.append(list(memory_list))
+            raise RuntimeError("endpoint unavailable")
+        return super().compress_memory(memory_list, instructions, max_tokens)
+
+
+class ConcurrencyStubMemory(StubMemory):
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.requests = []
+
+    def compress_memory(self, memory_list, instructions, max_tokens=None):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.requests.append((self.estimate_tokens_for_steps(memory_list), instructions))
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+            return super().compress_memory(memory_list, instructions, max_tokens)
+
+
+class FailingStubMemory(StubMemory):
+    def compress_memory(self, memory_list, instructions, max_tokens=None):
+        self.compress_calls.append(list(memory_list))
+        raise RuntimeError("endpoint unavailable")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,9 +1,13 @@
+import base64
 import json
 import os
 import tempfile
 import unittest
+from io import BytesIO
 from unittest.mock import patch
 
+from PIL import Image
+
 os.environ.setdefault("LLM_API_ENDPOINT", "http://example.invalid/v1")
 os.environ.setdefault("LLM_API_KEY", "sk-test")
 os.environ.setdefault("LLM_MODEL_NAME", "fake-model")
@@ -16,12 +20,18 @@ os.environ.setdefault("MOUSE_COLOR", "white")
 os.environ.setdefault("MOUSE_WIDTH", "4")
 os.environ.setdefault("MAX_STEPS", "100")
 os.environ.setdefault("DEBUG_MODE", "False")
+os.environ.setdefault("MEMORY_TOKEN_CALIBRATION_FILE", "off")
+os.environ.setdefault("CHECKPOINT_DIR", "off")
+os.environ.setdefault("MACRO_DIR", "off")
+os.environ.setdefault("TRAJECTORY_STORE_FILE", "off")
 os.environ.setdefault("MEMORY_SHORT_TOKEN_BUDGET", "128000")
 os.environ.setdefault("MEMORY_LONG_TOKEN_BUDGET", "128000")
 os.environ.setdefault("MEMORY_RECENT_INTERACTIONS_TO_KEEP", "3")
 os.environ.setdefault("MEMORY_CHARS_PER_TOKEN", "4")
 
 import scripts.memory as memory_module
+from scripts.frame import CapturedFrame
+from scripts.image_encoding import parse_image_encoding
 from scripts.memory import HierarchicalMemory
 
 
@@ -50,6 +60,40 @@ class MemoryToolLogTests(unittest.TestCase):
         self.assertIn("Tool call: move", assistant_message["content"])
         self.assertIn('"point_id": "G-01-02"', assistant_message["content"])
 
+    def test_context_skips_missing_global_image_for_local_only_steps(self):
+        memory = HierarchicalMemory("system prompt", "initial task")
+        memory._encode_image = lambda image, encoding: f"encoded-{image}"
+
+        context = memory.get_full_context("next", images=(None, "local"))
+
+        image_parts = [part for part in context[-1]["content"] if part["type"] == "image_url"]
+        self.assertEqual([part["image_url"]["url"] for part in image_parts], ["data:image/png;base64,encoded-local"])
+
+    def test_context_encodes_each_view_with_its_profile(self):
+        memory = HierarchicalMemory("system prompt", "initial task")
+        memory.image_encodings = (parse_image_encoding("jpeg:80"), parse_image_encoding("png:1"))
+        global_image = Image.new("RGB", (40, 30), color="white")
+        local_image = Image.new("RGB", (20, 20), color="black")
+
+        context = memory.get_full_context("next", images=(global_image, local_image))
+
+        urls = [part["image_url"]["url"] for part in context[-1]["content"] if part["type"] == "image_url"]
+        self.assertTrue(urls[0].startswith("data:image/jpeg;base64,"))
+        self.assertTrue(urls[1].startswith("data:image/png;base64,"))
+        decoded = Image.open(BytesIO(base64.b64decode(urls[1].split(",", 1)[1])))
+        self.assertEqual((decoded.format, decoded.size), ("PNG", (20, 20)))
+
+    def test_context_reuses_encodings_cached_on_the_captured_frame(self):
+        memory = HierarchicalMemory("system prompt", "initial task")
+        memory._encode_image = lambda image, encoding: self.fail("frame views must not be re-encoded")
+        frame = CapturedFrame(None, Image.new("RGB", (20, 20)), {}, "L-00-00", "G-00-00")
+        cached = frame.encoded_base64("local", memory.image_encodings[1])
+
+        context = memory.get_full_context("next", frame=frame)
+
+        urls = [part["image_url"]["url"] for part in context[-1]["content"] if part["type"] == "image_url"]
+        self.assertEqual(urls, [f"data:image/png;base64,{cached}"])
+
     def test_debug_log_writes_tool_field_without_mixing_it_into_content(self):
         old_debug_mode = memory_module.DEBUG_MODE
         memory = HierarchicalMemory("system prompt", "initial task")
@@ -67,6 +111,8 @@ class MemoryToolLogTests(unittest.TestCase):
                 log_content="The button is aligned.",
             )
 
+            memory.flush_debug_log()
+
             with open(handle.name, "r", encoding="utf-8") as log_file:
                 entry = json.loads(log_file.readline())
 
@@ -93,6 +139,8 @@ class MemoryToolLogTests(unittest.TestCase):
             memory_module.DEBUG_MODE = True
             memory.add_step("user", "Execution Result: clicked", log_extra={"images": images})
 
+            memory.flush_debug_log()
+
             with open(handle.name, "r", encoding="utf-8") as log_file:
                 entry = json.loads(log_file.readline())
 
@@ -129,6 +177,8 @@ class MemoryToolLogTests(unittest.TestCase):
                 images=images,
             )
 
+            memory.flush_debug_log()
+
             with open(handle.name, "r", encoding="utf-8") as log_file:
                 entries = [json.loads(line) for line in log_file]
 
@@ -162,6 +212,8 @@ class MemoryToolLogTests(unittest.TestCase):
             memory.add_model_input_log(first_messages, step=1)
             memory.add_model_input_log(second_messages, step=2)
 
+            memory.flush_debug_log()
+
             with open(handle.name, "r", encoding="utf-8") as log_file:
                 entries = [json.loads(line) for line in log_file]
 
@@ -195,6 +247,8 @@ class MemoryToolLogTests(unittest.TestCase):
             memory_module.DEBUG_MODE = True
             memory.add_model_input_log(messages, step=3)
 
+            memory.flush_debug_log()
+
             with open(handle.name, "r", encoding="utf-8") as log_file:
                 entries = [json.loads(line) for line in log_file]
 
@@ -225,6 +279,8 @@ class MemoryToolLogTests(unittest.TestCase):
             memory_module.DEBUG_MODE = True
             memory.add_model_output_log("I will focus the browser.", tool=tool, step=5)
 
+            memory.flush_debug_log()
+
             with open(handle.name, "r", encoding="utf-8") as log_file:
                 entry = json.loads(log_file.readline())
 
@@ -247,6 +303,8 @@ class MemoryToolLogTests(unittest.TestCase):
             memory_module.DEBUG_MODE = True
             memory.add_interaction("assistant memory", "Execution Result: clicked", debug_log=False)
 
+            memory.flush_debug_log()
+
             with open(handle.name, "r", encoding="utf-8") as log_file:
                 entries = [json.loads(line) for line in log_file]
 
@@ -284,6 +342,8 @@ class MemoryToolLogTests(unittest.TestCase):
                 user_log_extra={"step": 3, "images": {"global": "global.png", "local": "local.png"}},
             )
 
+            memory.flush_debug_log()
+
             with open(handle.name, "r", encoding="utf-8") as log_file:
                 entries = [json.loads(line) for line in log_file]
 
@@ -0,0 +1,69 @@
+import unittest
+
+from scripts.overlay import OverlaySession
+
+
+class OverlaySessionTests(unittest.TestCase):
+    def make_session(self):
+        events = []
+        session = OverlaySession(lambda: events.append("hide"), lambda: events.append("show"))
+        return session, events
+
+    def test_standalone_scopes_hide_and_show_every_time(self):
+        session, events = self.make_session()
+
+        with session:
+            pass
+        with session:
+            pass
+
+        self.assertEqual(events, ["hide", "show", "hide", "show"])
+
+    def test_nested_scopes_share_one_hide(self):
+        session, events = self.make_session()
+
+        with session.scope():
+            for _ in range(3):
+                with session:
+                    events.append("action")
+
+        self.assertEqual(events, ["hide", "action", "action", "action", "show"])
+        self.assertEqual(session.counters()[0], 1)
+
+    def test_reveal_shows_until_the_next_enter(self):
+        session, events = self.make_session()
+
+        with session.scope():
+            with session:
+                events.append("capture")
+            session.reveal()
+            events.append("model")
+            with session:
+                events.append("action")
+
+        self.assertEqual(events, ["hide", "capture", "show", "model", "hide", "action", "show"])
+        self.assertEqual(session.depth, 0)
+
+    def test_scope_alone_never_touches_the_window(self):
+        session, events = self.make_session()
+
+        with session.scope():
+            pass
+
+        self.assertEqual(events, [])
+
+    def test_failed_hide_does_not_leave_the_session_open(self):
+        def fail():
+            raise RuntimeError("no window")
+
+        session = OverlaySession(fail, None)
+
+        with self.assertRaises(RuntimeError):
+            session.enter()
+
+        self.assertEqual(session.depth, 0)
+        self.assertFalse(session.hidden)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,13 +14,18 @@ os.environ.setdefault("MOUSE_COLOR", "white")
 os.environ.setdefault("MOUSE_WIDTH", "4")
 os.environ.setdefault("MAX_STEPS", "100")
 os.environ.setdefault("DEBUG_MODE", "False")
+os.environ.setdefault("MEMORY_TOKEN_CALIBRATION_FILE", "off")
+os.environ.setdefault("CHECKPOINT_DIR", "off")
+os.environ.setdefault("MACRO_DIR", "off")
+os.environ.setdefault("TRAJECTORY_STORE_FILE", "off")
 os.environ.setdefault("MEMORY_SHORT_TOKEN_BUDGET", "128000")
 os.environ.setdefault("MEMORY_LONG_TOKEN_BUDGET", "128000")
 os.environ.setdefault("MEMORY_RECENT_INTERACTIONS_TO_KEEP", "3")
 os.environ.setdefault("MEMORY_CHARS_PER_TOKEN", "4")
 
-from scripts.agent import IRIS_SYSTEM_PROMPT, TOOL_CALL_REQUIRED_RETRY_PROMPT, build_step_query
+from scripts.agent import IRIS_SYSTEM_PROMPT, TOOL_CALL_REQUIRED_RETRY_PROMPT, build_step_query, describe_screen_change
 from scripts.memory import MEMORY_MANAGER_SYSTEM_PROMPT_TEMPLATE, HierarchicalMemory, build_memory_summary_user_prompt
+from scripts.screen_change import ScreenChange
 
 
 class PromptTests(unittest.TestCase):
@@ -65,6 +70,35 @@ class PromptTests(unittest.TestCase):
         self.assertIn("If using `click`, `double_click`, `mouse_down`, `mouse_up`, `scroll`, `type`, `hotkey`, `wait`, `ask_input`, or `final_answer`", query)
         self.assertIn("For `move`, include assistant content when moving toward a target", query)
         self.assertIn("call `ask_input` alone", query)
+        self.assertNotIn("Screen change", query)
+
+    def test_step_query_reports_screen_change_note(self):
+        query = build_step_query("L-10-10", "G-08-06", "none detected since the previous screenshot.")
+
+        self.assertIn("5. Screen change: none detected since the previous screenshot.", query)
+        self.assertLess(query.index("Current local mouse grid"), query.index("Screen change"))
+
+    def test_screen_change_note_flags_actions_without_visible_effect(self):
+        unchanged = ScreenChange(regions=(), changed_fraction=0.0)
+        changed = ScreenChange(
+            regions=((0, 0, 320, 160), (400, 0, 416, 16)),
+            changed_fraction=0.004,
+            grid_regions=(("G-00-00", "G-03-02"), ("G-04-00", "G-04-00")),
+        )
+
+        self.assertIsNone(describe_screen_change(None, ["click"]))
+        self.assertIn("previous click produced no visible change", describe_screen_change(unchanged, ["move", "click", "click"]))
+        self.assertEqual(describe_screen_change(unchanged, ["move"]), "none detected since the previous screenshot.")
+        self.assertEqual(
+            describe_screen_change(changed, ["click"]),
+            "less than 1% of the screen changed since the previous screenshot, mainly around G-00-00 to G-03-02; G-04-00.",
+        )
+        local_unchanged = ScreenChange(regions=(), changed_fraction=0.0, local_only=True)
+        self.assertEqual(
+            describe_screen_change(local_unchanged, ["move"]), "none detected in the Local View since the previous screenshot."
+        )
+        self.assertIn("in the Local View. The previous click", describe_screen_change(local_unchanged, ["click"]))
+
 
     def test_repair_prompt_keeps_key_action_content_requirement(self):
         self.assertIn("must now emit one or more native tool calls", TOOL_CALL_REQUIRED_RETRY_PROMPT)
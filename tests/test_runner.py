@@ -0,0 +1,189 @@
+import asyncio
+import concurrent.futures
+import os
+import time
+import unittest
+from types import SimpleNamespace
+
+os.environ.setdefault("LLM_API_ENDPOINT", "http://example.invalid/v1")
+os.environ.setdefault("LLM_API_KEY", "sk-test")
+os.environ.setdefault("LLM_MODEL_NAME", "fake-model")
+os.environ.setdefault("MEMORY_TOKEN_CALIBRATION_FILE", "off")
+os.environ.setdefault("CHECKPOINT_DIR", "off")
+os.environ.setdefault("MACRO_DIR", "off")
+os.environ.setdefault("TRAJECTORY_STORE_FILE", "off")
+
+from scripts.runner import AgentRunner, RequestCancelled
+
+
+class FakeAsyncCompletions:
+    def __init__(self, delay=0.0, chunks=None):
+        self.delay = delay
+        self.chunks = chunks
+        self.cancelled = False
+
+    async def create(self, **kwargs):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if kwargs.get("stream"):
+            return self._stream()
+        return {"choices": [{"message": {"content": "ok"}}]}
+
+    async def _stream(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(0)
+            yield chunk
+
+
+def fake_async_client(completions):
+    return SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+
+class FakeAgent:
+    def __init__(self, steps=1, stream=False, action_seconds=0.0):
+        self.client = None
+        self.steps = steps
+        self.stream = stream
+        self.action_seconds = action_seconds
+        self.results = []
+        self.checkpoints = 0
+        self.macros = 0
+        self.calibration_saves = 0
+        self.closed = False
+        self.memory = SimpleNamespace(wait_for_compression=lambda timeout=None: True, save_token_calibration=self.save_token_calibration)
+
+    def step(self, log_callback=None):
+        time.sleep(self.action_seconds)
+        try:
+            response = self.client.chat.completions.create(model="fake-model", messages=[], stream=self.stream)
+            result = list(response) if self.stream else response
+        except RequestCancelled as e:
+            # Like IrisAgent._step: a failed model call ends the step with an error
+            result = f"Error: {e}"
+        self.results.append(result)
+        return "[Task Completed]" if len(self.results) >= self.steps else "next"
+
+    def save_macro(self):
+        self.macros += 1
+
+    def save_checkpoint(self, completed=False):
+        self.checkpoints += 1
+
+    def save_token_calibration(self):
+        self.calibration_saves += 1
+
+    def close(self):
+        self.closed = True
+
+
+class SummarizingMemory:
+    """Starts one background summary through its client, like HierarchicalMemory.compress_context."""
+
+    def __init__(self):
+        self.client = None
+        self.summary = None
+
+    def start_summary(self):
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.summary = executor.submit(self.client.chat.completions.create, model="fake-model", messages=[])
+        executor.shutdown(wait=False)
+
+    def wait_for_compression(self, timeout=None):
+        concurrent.futures.wait([self.summary], timeout=timeout)
+        return self.summary.done()
+
+    def save_token_calibration(self):
+        pass
+
+
+class SummarizingAgent(FakeAgent):
+    def __init__(self):
+        super().__init__(steps=5)
+        self.memory = SummarizingMemory()
+
+    def step(self, log_callback=None):
+        if self.memory.summary is None:
+            self.memory.start_summary()
+        return super().step(log_callback)
+
+
+class AgentRunnerTests(unittest.TestCase):
+    def test_stop_cancels_the_model_request_and_flushes(self):
+        completions = FakeAsyncCompletions(delay=30)
+        agent = FakeAgent(steps=5)
+        runner = AgentRunner(agent, async_client=fake_async_client(completions), stop_timeout=2)
+
+        async def run():
+            asyncio.get_running_loop().call_later(0.1, runner.stop)
+            return await runner.run()
+
+        started = time.perf_counter()
+        feedback = asyncio.run(run())
+
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertIsNone(feedback)
+        self.assertTrue(completions.cancelled)
+        self.assertEqual(agent.results, ["Error: model request cancelled"])
+        self.assertEqual((agent.checkpoints, agent.macros, agent.calibration_saves), (1, 1, 1))
+        self.assertTrue(agent.closed)
+
+    def test_stop_cancels_a_memory_summary_in_flight(self):
+        agent = SummarizingAgent()
+        runner = AgentRunner(agent, async_client=fake_async_client(FakeAsyncCompletions(delay=30)), stop_timeout=2)
+
+        async def run():
+            asyncio.get_running_loop().call_later(0.1, runner.stop)
+            return await runner.run()
+
+        started = time.perf_counter()
+        asyncio.run(run())
+
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertIs(agent.memory.client, runner.bridge)
+        with self.assertRaises(RequestCancelled):
+            agent.memory.summary.result(timeout=1)
+        self.assertEqual((agent.checkpoints, agent.macros), (1, 1))
+
+    def test_runners_share_one_loop_and_stream_through_the_bridge(self):
+        chunks = [{"index": index} for index in range(3)]
+        agents = [FakeAgent(steps=2, stream=True), FakeAgent(steps=3, stream=True)]
+        runners = [AgentRunner(agent, async_client=fake_async_client(FakeAsyncCompletions(delay=0.01, chunks=chunks))) for agent in agents]
+
+        async def run():
+            return await asyncio.gather(*(runner.run() for runner in runners))
+
+        self.assertEqual(asyncio.run(run()), ["[Task Completed]", "[Task Completed]"])
+        self.assertEqual([len(agent.results) for agent in agents], [2, 3])
+        self.assertEqual(agents[1].results[-1], chunks)
+
+    def test_step_past_the_deadline_is_abandoned_without_saving(self):
+        agent = FakeAgent(steps=5, action_seconds=1.0)
+        runner = AgentRunner(agent, async_client=fake_async_client(FakeAsyncCompletions()), stop_timeout=0.2)
+        runner.stop()
+
+        async def run():
+            # A stop before the first step still ends the run without any model call
+            return await runner.run()
+
+        self.assertIsNone(asyncio.run(run()))
+        self.assertEqual(agent.results, [])
+
+        agent = FakeAgent(steps=5, action_seconds=1.0)
+        runner = AgentRunner(agent, async_client=fake_async_client(FakeAsyncCompletions()), stop_timeout=0.2)
+
+        async def run_and_stop():
+            asyncio.get_running_loop().call_later(0.05, runner.stop)
+            return await runner.run()
+
+        started = time.perf_counter()
+        asyncio.run(run_and_stop())
+        self.assertLess(time.perf_counter() - started, 0.9)
+        self.assertEqual(agent.checkpoints, 0)
+        self.assertFalse(agent.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
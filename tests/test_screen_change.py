@@ -0,0 +1,68 @@
+import unittest
+
+from PIL import Image, ImageDraw
+
+from scripts.screen_change import ScreenChange, detect_screen_change, screen_fingerprint
+
+
+class ScreenChangeTests(unittest.TestCase):
+    def test_identical_frames_report_no_change(self):
+        image = Image.new("RGB", (320, 160), color="white")
+        fingerprint = screen_fingerprint(image, 16)
+
+        change = detect_screen_change(fingerprint, screen_fingerprint(image.copy(), 16), 16, 12, image.size)
+
+        self.assertEqual(change, ScreenChange(regions=(), changed_fraction=0.0))
+        self.assertFalse(change.changed)
+
+    def test_separate_changes_become_separate_regions_sorted_by_area(self):
+        before = Image.new("RGB", (320, 160), color="white")
+        after = before.copy()
+        draw = ImageDraw.Draw(after)
+        draw.rectangle((16, 16, 47, 31), fill="black")
+        draw.rectangle((160, 64, 255, 127), fill="black")
+
+        change = detect_screen_change(
+            screen_fingerprint(before, 16),
+            screen_fingerprint(after, 16),
+            16,
+            12,
+            after.size,
+        )
+
+        self.assertEqual(change.regions, ((160, 64, 256, 128), (16, 16, 48, 32)))
+        self.assertAlmostEqual(change.changed_fraction, 26 / 200)
+
+    def test_diagonal_and_wrapping_blocks_join_one_region(self):
+        before = Image.new("RGB", (160, 160), color="white")
+        after = before.copy()
+        draw = ImageDraw.Draw(after)
+        # A U shape whose arms only meet at the bottom, plus a block touching it diagonally
+        draw.rectangle((16, 16, 31, 79), fill="black")
+        draw.rectangle((64, 16, 79, 79), fill="black")
+        draw.rectangle((16, 64, 79, 79), fill="black")
+        draw.rectangle((80, 80, 95, 95), fill="black")
+        draw.rectangle((128, 16, 143, 31), fill="black")
+
+        change = detect_screen_change(screen_fingerprint(before, 16), screen_fingerprint(after, 16), 16, 12, after.size)
+
+        self.assertEqual(change.regions, ((16, 16, 96, 96), (128, 16, 144, 32)))
+
+    def test_regions_are_clipped_to_partial_edge_blocks(self):
+        before = Image.new("RGB", (100, 50), color="white")
+        after = before.copy()
+        ImageDraw.Draw(after).rectangle((90, 40, 99, 49), fill="black")
+
+        change = detect_screen_change(screen_fingerprint(before, 16), screen_fingerprint(after, 16), 16, 12, after.size)
+
+        self.assertEqual(change.regions, ((80, 32, 100, 50),))
+
+    def test_missing_or_resized_previous_frame_is_not_comparable(self):
+        current = screen_fingerprint(Image.new("RGB", (64, 64)), 16)
+
+        self.assertIsNone(detect_screen_change(None, current, 16, 12, (64, 64)))
+        self.assertIsNone(detect_screen_change(screen_fingerprint(Image.new("RGB", (32, 64)), 16), current, 16, 12, (64, 64)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from scripts.streaming import ToolCallAssembler
+
+
+def chunk(content=None, tool_calls=None, finish_reason=None, usage=None):
+    delta = {}
+    if content is not None:
+        delta["content"] = content
+    if tool_calls is not None:
+        delta["tool_calls"] = tool_calls
+    choices = [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta or finish_reason else []
+    return {"choices": choices, "usage": usage}
+
+
+class ToolCallAssemblerTests(unittest.TestCase):
+    def test_releases_each_call_once_its_arguments_are_complete(self):
+        assembler = ToolCallAssembler()
+        released = []
+
+        released.append(assembler.feed(chunk(content="Clicking, ")))
+        released.append(assembler.feed(chunk(content="then typing.")))
+        released.append(assembler.feed(chunk(tool_calls=[{"index": 0, "id": "call_click", "function": {"name": "click", "arguments": ""}}])))
+        released.append(assembler.feed(chunk(tool_calls=[{"index": 0, "function": {"arguments": '{"button": '}}])))
+        released.append(assembler.feed(chunk(tool_calls=[{"index": 0, "function": {"arguments": '"left"}'}}])))
+        released.append(assembler.feed(chunk(tool_calls=[{"index": 1, "id": "call_type", "function": {"name": "type", "arguments": '{"text": "hi"'}}])))
+        released.append(assembler.feed(chunk(tool_calls=[{"index": 1, "function": {"arguments": "}"}}], finish_reason="tool_calls")))
+        released.append(assembler.feed(chunk(usage={"prompt_tokens": 900, "completion_tokens": 40})))
+
+        self.assertEqual([[call["id"] for call in calls] for calls in released], [[], [], [], [], ["call_click"], [], ["call_type"], []])
+        self.assertEqual(assembler.finish(), [])
+        response = assembler.response()
+        message = response["choices"][0]["message"]
+        self.assertEqual(message["content"], "Clicking, then typing.")
+        self.assertEqual(
+            [(call["function"]["name"], call["function"]["arguments"]) for call in message["tool_calls"]],
+            [("click", '{"button": "left"}'), ("type", '{"text": "hi"}')],
+        )
+        self.assertEqual(response["choices"][0]["finish_reason"], "tool_calls")
+        self.assertEqual(response["usage"], {"prompt_tokens": 900, "completion_tokens": 40})
+
+    def test_unparseable_calls_are_released_by_the_next_call_or_finish_but_not_after_truncation(self):
+        assembler = ToolCallAssembler()
+        self.assertEqual(assembler.feed(chunk(tool_calls=[{"index": 0, "id": "a", "function": {"name": "wait", "arguments": "{bad"}}])), [])
+        self.assertEqual([call["id"] for call in assembler.feed(chunk(tool_calls=[{"index": 1, "id": "b", "function": {"name": "wait"}}]))], ["a"])
+        self.assertEqual([call["id"] for call in assembler.finish()], ["b"])
+
+        truncated = ToolCallAssembler()
+        truncated.feed(chunk(tool_calls=[{"index": 0, "id": "c", "function": {"name": "type", "arguments": '{"text": "hel'}}]))
+        truncated.feed(chunk(finish_reason="length"))
+        self.assertEqual(truncated.finish(), [])
+        self.assertEqual(len(truncated.response()["choices"][0]["message"]["tool_calls"]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
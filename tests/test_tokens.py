@@ -0,0 +1,109 @@
+import os
+import random
+import tempfile
+import unittest
+
+from scripts.tokens import TokenCalibration, TokenCountedLayer, count_text, tokens_for_counts
+
+
+class TokenCalibrationTests(unittest.TestCase):
+    def test_starts_from_configured_rates(self):
+        calibration = TokenCalibration()
+
+        self.assertEqual(calibration.rates(4.0, 1000), (4.0, 1000))
+
+    def test_separates_text_and_image_cost(self):
+        rng = random.Random(0)
+        calibration = TokenCalibration()
+        for _ in range(40):
+            ascii_chars = rng.randint(5000, 60000)
+            images = rng.choice([1, 2])
+            calibration.observe(ascii_chars, 30, images, int(ascii_chars / 3.2) + 30 + images * 765)
+
+        chars_per_token, image_tokens = calibration.rates(4.0, 1000)
+
+        self.assertAlmostEqual(chars_per_token, 3.2, delta=0.05)
+        self.assertAlmostEqual(image_tokens, 765, delta=50)
+
+    def test_a_single_observation_does_not_override_the_prior(self):
+        calibration = TokenCalibration()
+        calibration.observe(2000, 0, 0, 2000)
+
+        chars_per_token, image_tokens = calibration.rates(4.0, 1000)
+
+        self.assertGreater(chars_per_token, 1.5)
+        self.assertEqual(image_tokens, 1000)
+
+    def test_fits_are_persisted_per_model(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "nested", "calibration.json")
+            calibration = TokenCalibration(path, model="model-a")
+            for _ in range(10):
+                calibration.observe(8000, 0, 0, 4000)
+            calibration.save()
+
+            reloaded = TokenCalibration(path, model="model-a")
+            other_model = TokenCalibration(path, model="model-b")
+            other_model.observe(8000, 0, 0, 1000)
+            other_model.save()
+            reloaded_again = TokenCalibration(path, model="model-a")
+
+        self.assertEqual(reloaded.observations, 10)
+        self.assertEqual(reloaded.rates(4.0, 1000), calibration.rates(4.0, 1000))
+        self.assertEqual(reloaded_again.rates(4.0, 1000), calibration.rates(4.0, 1000))
+
+    def test_saves_only_new_observations_and_at_most_once_per_interval(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "calibration.json")
+            calibration = TokenCalibration(path, save_interval=3600)
+            calibration.save()
+            self.assertFalse(os.path.exists(path))
+
+            calibration.observe(8000, 0, 0, 4000)
+            calibration.save_if_due()
+            self.assertFalse(os.path.exists(path))
+
+            calibration.save()
+            self.assertEqual(TokenCalibration(path).observations, 1)
+
+    def test_unreadable_file_starts_fresh(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            f.write("{not json")
+        self.addCleanup(os.remove, f.name)
+
+        calibration = TokenCalibration(f.name)
+
+        self.assertEqual(calibration.observations, 0)
+
+
+class TokenCountedLayerTests(unittest.TestCase):
+    def make_layer(self, steps=(), rate=None):
+        rate = rate or [4.0]
+        measure = lambda step: count_text(step["content"])
+        return TokenCountedLayer(steps, measure=measure, to_tokens=lambda a, o: tokens_for_counts(a, o, rate[0])), rate
+
+    def test_totals_follow_every_mutation(self):
+        layer, _ = self.make_layer([{"content": "a" * 40}])
+        layer.append({"content": "中文"})
+        layer.insert(0, {"content": "b" * 8})
+        layer.extend([{"content": "c" * 4}, {"content": "d" * 4}])
+        layer.pop()
+        del layer[1]
+        del layer[:1]
+        layer[0] = {"content": "e" * 12}
+
+        self.assertEqual(layer, [{"content": "e" * 12}, {"content": "c" * 4}])
+        self.assertEqual((layer.ascii_chars, layer.other_chars), (16, 0))
+        self.assertEqual(layer.total_tokens, 4)
+
+    def test_recalibration_reprices_the_whole_layer(self):
+        layer, rate = self.make_layer([{"content": "a" * 400}, {"content": "b" * 400}])
+        self.assertEqual(layer.total_tokens, 200)
+
+        rate[0] = 2.0
+
+        self.assertEqual(layer.total_tokens, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
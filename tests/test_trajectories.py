@@ -0,0 +1,156 @@
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest.mock import patch
+
+os.environ.setdefault("LLM_API_ENDPOINT", "http://example.invalid/v1")
+os.environ.setdefault("LLM_API_KEY", "sk-test")
+os.environ.setdefault("LLM_MODEL_NAME", "fake-model")
+os.environ.setdefault("DEBUG_MODE", "False")
+os.environ.setdefault("MEMORY_TOKEN_CALIBRATION_FILE", "off")
+os.environ.setdefault("CHECKPOINT_DIR", "off")
+os.environ.setdefault("MACRO_DIR", "off")
+os.environ.setdefault("TRAJECTORY_STORE_FILE", "off")
+
+from PIL import Image
+
+import scripts.agent as agent_module
+from scripts.frame import CapturedFrame
+from scripts.trajectories import BM25Index, TrajectoryStore, compress_actions, format_trajectory_hints, tokenize
+
+
+class FakeVision:
+    def __init__(self, *args, **kwargs):
+        self.last_capture_files = None
+
+    def capture_state(self, mouse_x, mouse_y, local_only=False):
+        return CapturedFrame(None, Image.new("RGB", (8, 8)), {"G-00-00": (5, 6)}, "L-00-00", "G-00-00")
+
+
+class FakeExecutor:
+    def __init__(self, *args, **kwargs):
+        self.mouse_x, self.mouse_y = 0, 0
+
+    def get_mouse_position(self):
+        return self.mouse_x, self.mouse_y
+
+    def execute(self, action_dict, coordinate_map=None, log_callback=None):
+        if action_dict["action_type"] == "final_answer":
+            return f"[Task Completed]: {action_dict['text']}"
+        return f"executed {action_dict['action_type']}"
+
+
+def tool_response(name, arguments):
+    return {
+        "choices": [
+            {
+                "finish_reason": "tool_calls",
+                "message": {
+                    "content": f"Calling {name}.",
+                    "tool_calls": [
+                        {"id": f"call_{name}", "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+                    ],
+                },
+            }
+        ]
+    }
+
+
+class TrajectoryIndexTests(unittest.TestCase):
+    def test_tokenize_splits_words_and_cjk_characters(self):
+        self.assertEqual(tokenize("Open the Settings, 打开设置"), ["open", "settings", "打", "开", "设", "置"])
+
+    def test_compress_actions_collapses_consecutive_repeats(self):
+        actions = ["scroll down", "scroll down", "scroll down", "click", "scroll down"]
+
+        self.assertEqual(compress_actions(actions), ["scroll down x3", "click", "scroll down"])
+
+    def test_bm25_ranks_the_matching_task_family_first(self):
+        index = BM25Index([
+            "export the sales report from the spreadsheet as pdf",
+            "send an email to the team about the meeting",
+            "export the monthly invoice spreadsheet as csv",
+        ])
+
+        ranked = [position for position, _ in index.top("export spreadsheet to pdf", 3)]
+
+        self.assertEqual(ranked[0], 0)
+        self.assertNotIn(1, ranked)
+
+
+class TrajectoryStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "store", "trajectories.jsonl")
+
+    def test_records_persist_and_identical_tasks_keep_their_shortest_run(self):
+        store = TrajectoryStore(self.path)
+        store.record("Rename file report.txt", ["click a", "type b", "hotkey c"], "renamed", 9)
+        store.record("Rename file report.txt", ["click a", "type b"], "renamed", 4)
+        store.record("Open the calculator", ["hotkey d"], "opened", 2)
+
+        similar = TrajectoryStore(self.path).similar("rename report.txt file", 3)
+
+        self.assertEqual([trajectory["step_count"] for trajectory in similar], [4])
+
+    def test_hints_summarize_actions_and_answer(self):
+        hints = format_trajectory_hints([
+            {"task": "Open the calculator", "actions": ["hotkey {\"keys\": [\"win\"]}", "type {\"text\": \"calc\"}"], "final_answer": "opened", "step_count": 2}
+        ])
+
+        self.assertIn("## Hints From Similar Past Runs", hints)
+        self.assertIn("Open the calculator", hints)
+        self.assertIn('- type {"text": "calc"}', hints)
+        self.assertIn("Final answer: opened", hints)
+        self.assertEqual(format_trajectory_hints([]), "")
+
+
+class AgentTrajectoryTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        path = os.path.join(self.directory.name, "trajectories.jsonl")
+        for name, value in (
+            ("VisionPerceptor", FakeVision),
+            ("ActionExecutor", FakeExecutor),
+            ("TRAJECTORY_STORE_FILE", path),
+            ("TRAJECTORY_HINTS", 2),
+        ):
+            patcher = patch.object(agent_module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_task(self, task, responses):
+        agent = agent_module.IrisAgent(task)
+        agent._call_llm_for_action = lambda messages: responses.pop(0)
+        with redirect_stdout(StringIO()):
+            while responses:
+                agent.step()
+        return agent
+
+    def test_completed_run_becomes_a_hint_for_a_similar_task(self):
+        first = self.run_task(
+            "Open the settings and enable dark mode",
+            [tool_response("move", {"point_id": "G-00-00"}), tool_response("final_answer", {"text": "Dark mode is on."})],
+        )
+        self.assertEqual(first.hinted_runs, 0)
+
+        second = agent_module.IrisAgent("enable dark mode in settings")
+        unrelated = agent_module.IrisAgent("write an email")
+
+        task_message = second.memory.fixed_layer[1]["content"]
+        self.assertTrue(task_message.startswith("enable dark mode in settings\n\n## Hints From Similar Past Runs"))
+        self.assertIn('- move {"point_id": "G-00-00"}', task_message)
+        self.assertIn("Final answer: Dark mode is on.", task_message)
+        self.assertEqual(second.hinted_runs, 1)
+        self.assertEqual(second.memory.initial_task, "enable dark mode in settings")
+        self.assertEqual(unrelated.memory.fixed_layer[1]["content"], "write an email")
+        self.assertEqual(second.trajectory_store.trajectories[0]["step_count"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
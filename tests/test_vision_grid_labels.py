@@ -1,4 +1,5 @@
 import os
+import tempfile
 import unittest
 from unittest.mock import patch
 
@@ -16,6 +17,10 @@ os.environ.setdefault("MOUSE_COLOR", "white")
 os.environ.setdefault("MOUSE_WIDTH", "4")
 os.environ.setdefault("MAX_STEPS", "100")
 os.environ.setdefault("DEBUG_MODE", "False")
+os.environ.setdefault("MEMORY_TOKEN_CALIBRATION_FILE", "off")
+os.environ.setdefault("CHECKPOINT_DIR", "off")
+os.environ.setdefault("MACRO_DIR", "off")
+os.environ.setdefault("TRAJECTORY_STORE_FILE", "off")
 os.environ.setdefault("MEMORY_SHORT_TOKEN_BUDGET", "128000")
 os.environ.setdefault("MEMORY_LONG_TOKEN_BUDGET", "128000")
 os.environ.setdefault("MEMORY_RECENT_INTERACTIONS_TO_KEEP", "3")
@@ -25,6 +30,12 @@ import scripts.tools as tools
 
 
 class VisionGridLabelTests(unittest.TestCase):
+    def setUp(self):
+        # Screenshots are patched through pyautogui, so pin that backend for fresh perceptors.
+        backend_patch = patch.object(tools, "CAPTURE_BACKEND", "pyautogui")
+        backend_patch.start()
+        self.addCleanup(backend_patch.stop)
+
     def test_global_grid_uses_larger_border_and_prefix_labels(self):
         old_grid_color = tools.GRID_COLOR
         tools.GRID_COLOR = "red"
@@ -57,6 +68,70 @@ class VisionGridLabelTests(unittest.TestCase):
         self.assertEqual(coordinate_map["L-04-03"], (79, 59))
         self.assertTrue(self._has_dark_pixels(self._corner_center(processed, 20, 20)))
 
+    def test_grid_overlay_is_cached_per_geometry_and_reused_for_new_screenshots(self):
+        perceptor = tools.VisionPerceptor.__new__(tools.VisionPerceptor)
+        tools._grid_overlay.cache_clear()
+
+        first, first_map = perceptor._draw_grid_with_labels(Image.new("RGB", (80, 60), color="blue"), step=20, prefix="G")
+        second, second_map = perceptor._draw_grid_with_labels(Image.new("RGB", (80, 60), color="green"), step=20, prefix="G")
+
+        cache_info = tools._grid_overlay.cache_info()
+        self.assertEqual((cache_info.hits, cache_info.misses), (1, 1))
+        self.assertEqual(first_map, second_map)
+        self.assertEqual(first.getpixel((90, 90)), (0, 0, 255))
+        self.assertEqual(second.getpixel((90, 90)), (0, 128, 0))
+        self.assertEqual(second.getpixel((80, 90)), (255, 0, 0))
+
+    def test_cached_overlay_applies_offset_per_call(self):
+        perceptor = tools.VisionPerceptor.__new__(tools.VisionPerceptor)
+
+        _, first_map = perceptor._draw_grid_with_labels(Image.new("RGB", (40, 40)), step=20, prefix="L", offset_x=100, offset_y=200)
+        _, second_map = perceptor._draw_grid_with_labels(Image.new("RGB", (40, 40)), step=20, prefix="L", offset_x=300, offset_y=0)
+
+        self.assertEqual(first_map["L-01-01"], (120, 220))
+        self.assertEqual(second_map["L-01-01"], (320, 20))
+
+    def test_grid_resolver_parses_ids_arithmetically_with_clamping(self):
+        resolver = tools.GridResolver(
+            tools.GridGeometry("G", 100, 500, 300),
+            tools.GridGeometry("L", 20, 349, 251, 1000, 2000, anchor_x=149, anchor_y=51, anchor_col=10, anchor_row=10),
+        )
+
+        self.assertEqual(resolver["G-05-03"], (499, 299))
+        self.assertEqual(resolver["L-10-10"], (1149, 2051))
+        self.assertEqual(resolver["L-03-08"], (1009, 2011))
+        self.assertIn("G-00-00", resolver)
+        for point_id in ("G-06-00", "G-5-3", "L-02-10", "X-00-00", "G-00", "G-0a-01", None):
+            self.assertNotIn(point_id, resolver)
+        with self.assertRaises(KeyError):
+            resolver["L-21-10"]
+
+    def test_grid_resolver_iterates_like_the_materialized_map(self):
+        resolver = tools.GridResolver(tools.GridGeometry("G", 100, 250, 150))
+
+        self.assertEqual(
+            list(resolver),
+            ["G-00-00", "G-00-01", "G-01-00", "G-01-01", "G-02-00", "G-02-01"],
+        )
+        self.assertEqual(len(resolver), 6)
+        self.assertEqual(dict(resolver)["G-02-01"], (200, 100))
+
+    def test_region_fingerprint_is_cut_at_the_screen_edge_before_any_capture(self):
+        perceptor = tools.VisionPerceptor.__new__(tools.VisionPerceptor)
+        perceptor.screen_size = None
+        perceptor.overlay_rect = None
+        perceptor.pre_callback = perceptor.post_callback = None
+        regions = []
+
+        def grab(region=None):
+            regions.append(region)
+            return Image.new("RGB", region[2:])
+
+        with patch.object(perceptor, "_capture_screenshot", grab, create=True), patch.object(tools.pyautogui, "size", return_value=(800, 600)):
+            perceptor.region_fingerprint(790, 650, size=40)
+
+        self.assertEqual(regions, [(770, 579, 30, 21)])
+
     def test_nearest_grid_id_uses_closest_clamped_global_point(self):
         perceptor = tools.VisionPerceptor.__new__(tools.VisionPerceptor)
 
@@ -144,13 +219,205 @@ class VisionGridLabelTests(unittest.TestCase):
         perceptor.last_capture_files = None
 
         with patch("scripts.tools.pyautogui.screenshot", return_value=Image.new("RGB", (500, 300), color="white")):
-            _, local_image, coordinate_map, mouse_grid_id, nearest_global_grid_id = perceptor.capture_state(149, 51)
+            frame = perceptor.capture_state(149, 51)
+
+        self.assertEqual(frame.local_image.size, (429, 331))
+        self.assertEqual(frame.mouse_grid_id, "L-10-10")
+        self.assertEqual(frame.nearest_global_grid_id, "G-01-01")
+        self.assertEqual(frame.coordinate_map[frame.mouse_grid_id], (149, 51))
+        self.assertEqual(frame.coordinate_map["G-05-03"], (499, 299))
+        self.assertEqual([grid.prefix for grid in frame.coordinate_map.grids], ["G", "L"])
+        self.assertEqual(events, ["pre", "post"])
+
+    def test_capture_state_tracks_screen_change_between_captures(self):
+        perceptor = tools.VisionPerceptor.__new__(tools.VisionPerceptor)
+        perceptor.pre_callback = None
+        perceptor.post_callback = None
+        perceptor.last_capture_files = None
+        before = Image.new("RGB", (500, 300), color="white")
+        after = before.copy()
+        after.paste((0, 0, 0), (300, 100, 400, 200))
+
+        with patch("scripts.tools.pyautogui.screenshot", side_effect=[before, before.copy(), after]):
+            perceptor.capture_state(10, 10)
+            first_change = perceptor.last_screen_change
+            perceptor.capture_state(10, 10)
+            unchanged = perceptor.last_screen_change
+            perceptor.capture_state(10, 10)
+            changed = perceptor.last_screen_change
+
+        self.assertIsNone(first_change)
+        self.assertFalse(unchanged.changed)
+        self.assertEqual(changed.regions, ((288, 96, 400, 208),))
+        self.assertEqual(changed.grid_regions, (("G-03-01", "G-04-02"),))
+
+    def test_local_only_capture_grabs_only_the_local_region(self):
+        perceptor = tools.VisionPerceptor.__new__(tools.VisionPerceptor)
+        perceptor.pre_callback = None
+        perceptor.post_callback = None
+        perceptor.last_capture_files = None
+
+        with patch("scripts.tools.pyautogui.screenshot", return_value=Image.new("RGB", (500, 300), color="white")):
+            perceptor.capture_state(10, 10)
+        with patch("scripts.tools.pyautogui.screenshot", return_value=Image.new("RGB", (349, 251), color="white")) as screenshot:
+            frame = perceptor.capture_state(149, 51, local_only=True)
+
+        screenshot.assert_called_once_with(region=(0, 0, 349, 251))
+        self.assertIsNone(frame.global_image)
+        self.assertEqual(frame.local_image.size, (429, 331))
+        self.assertEqual(frame.coordinate_map[frame.mouse_grid_id], (149, 51))
+        self.assertEqual(frame.coordinate_map["G-05-03"], (499, 299))
+        self.assertEqual(frame.nearest_global_grid_id, "G-01-01")
+        # The crop is still compared with the last full capture
+        self.assertFalse(perceptor.last_screen_change.changed)
+        self.assertTrue(perceptor.last_screen_change.local_only)
+
+    def test_local_only_capture_reports_changes_inside_the_local_view(self):
+        perceptor = tools.VisionPerceptor.__new__(tools.VisionPerceptor)
+        perceptor.pre_callback = None
+        perceptor.post_callback = None
+        perceptor.last_capture_files = None
+        crop = Image.new("RGB", (400, 400), color="white")
+        crop.paste((0, 0, 0), (60, 40, 110, 90))
+
+        with patch("scripts.tools.pyautogui.screenshot", return_value=Image.new("RGB", (800, 600), color="white")):
+            perceptor.capture_state(10, 10)
+        with patch("scripts.tools.pyautogui.screenshot", side_effect=[crop, crop.copy()]) as screenshot:
+            perceptor.capture_state(405, 305, local_only=True)
+            changed = perceptor.last_screen_change
+            perceptor.capture_state(405, 305, local_only=True)
+            unchanged = perceptor.last_screen_change
+
+        # The crop starts at (205, 105); only whole blocks from (208, 112) are compared
+        screenshot.assert_called_with(region=(205, 105, 400, 400))
+        self.assertEqual(changed.regions, ((256, 144, 320, 208),))
+        self.assertEqual(changed.grid_regions, (("G-03-01", "G-03-02"),))
+        self.assertTrue(changed.local_only)
+        # The next comparison starts from what the previous crop showed
+        self.assertFalse(unchanged.changed)
+
+    def test_close_releases_the_grabber_and_a_later_capture_reopens_it(self):
+        perceptor = tools.VisionPerceptor.__new__(tools.VisionPerceptor)
+        perceptor.pre_callback = None
+        perceptor.post_callback = None
+        perceptor.last_capture_files = None
+
+        with patch("scripts.tools.pyautogui.screenshot", return_value=Image.new("RGB", (500, 300), color="white")):
+            perceptor.capture_state(10, 10)
+            first_capture = perceptor.screen_capture
+            perceptor.close()
+            perceptor.close()
+            perceptor.capture_state(10, 10)
+
+        self.assertIsNot(perceptor.screen_capture, first_capture)
+        with self.assertRaises(RuntimeError):
+            first_capture.grab()
+        perceptor.close()
+
+    def test_local_only_capture_without_known_screen_size_takes_full_capture(self):
+        perceptor = tools.VisionPerceptor.__new__(tools.VisionPerceptor)
+        perceptor.pre_callback = None
+        perceptor.post_callback = None
+        perceptor.last_capture_files = None
+
+        with patch("scripts.tools.pyautogui.screenshot", return_value=Image.new("RGB", (500, 300), color="white")) as screenshot:
+            frame = perceptor.capture_state(149, 51, local_only=True)
+
+        screenshot.assert_called_once_with()
+        self.assertEqual(frame.global_image.size, (660, 460))
+
+    def test_downscaled_global_view_still_resolves_screen_pixels(self):
+        perceptor = tools.VisionPerceptor.__new__(tools.VisionPerceptor)
+        perceptor.pre_callback = None
+        perceptor.post_callback = None
+        perceptor.last_capture_files = None
+
+        with patch.object(tools, "GLOBAL_MAX_EDGE", 250):
+            with patch("scripts.tools.pyautogui.screenshot", return_value=Image.new("RGB", (500, 300), color="white")):
+                frame = perceptor.capture_state(149, 51)
+
+        # 250x150 screenshot with the border scaled from 80px down to 40px
+        self.assertEqual(frame.global_image.size, (330, 230))
+        self.assertEqual(frame.global_image.getpixel((40 + 50, 150)), (255, 0, 0))
+        self.assertEqual(frame.local_image.size, (429, 331))
+        self.assertEqual(frame.coordinate_map["G-01-01"], (100, 100))
+        self.assertEqual(frame.coordinate_map["G-05-03"], (499, 299))
+        self.assertEqual(frame.nearest_global_grid_id, "G-01-01")
+
+    def test_debug_archive_is_written_in_the_background_with_one_encode_per_view(self):
+        perceptor = tools.VisionPerceptor.__new__(tools.VisionPerceptor)
+        perceptor.pre_callback = None
+        perceptor.post_callback = None
+
+        with tempfile.TemporaryDirectory() as directory, patch.object(tools, "DEBUG_MODE", True):
+            perceptor.debug_dir = directory
+            with patch("scripts.tools.pyautogui.screenshot", return_value=Image.new("RGB", (500, 300), color="white")):
+                frame = perceptor.capture_state(149, 51)
+            tools.get_debug_writer().flush()
+            saved = sorted(os.listdir(directory))
+
+        global_encoding, local_encoding = tools.configured_view_encodings()
+        self.assertEqual(saved, sorted(perceptor.last_capture_files.values()))
+        self.assertTrue(perceptor.last_capture_files["global"].startswith("global_"))
+        with patch.object(type(global_encoding), "encode", side_effect=AssertionError("encoded twice")):
+            frame.encoded_base64("global", global_encoding)
+            frame.encoded_base64("local", local_encoding)
+
+    def test_mask_mode_keeps_window_visible_and_paints_the_last_clean_backdrop(self):
+        events = []
+        window = {"rect": (400, 0, 500, 300)}
+        perceptor = tools.VisionPerceptor.__new__(tools.VisionPerceptor)
+        perceptor.pre_callback = lambda: events.append("pre")
+        perceptor.post_callback = lambda: events.append("post")
+        perceptor.last_capture_files = None
+        perceptor.overlay_rect = lambda: window["rect"]
+        clean = Image.new("RGB", (500, 300), color="white")
+        with_window = clean.copy()
+        with_window.paste((0, 0, 0), (400, 0, 500, 300))
+        with_window.paste((0, 0, 255), (0, 0, 50, 50))
+
+        with patch("scripts.tools.pyautogui.screenshot", side_effect=[clean, with_window]):
+            perceptor.capture_state(10, 10)
+            self.assertEqual(events, ["pre", "post"])
+            frame = perceptor.capture_state(10, 10)
 
-        self.assertEqual(local_image.size, (429, 331))
-        self.assertEqual(mouse_grid_id, "L-10-10")
-        self.assertEqual(nearest_global_grid_id, "G-01-01")
-        self.assertEqual(coordinate_map[mouse_grid_id], (149, 51))
         self.assertEqual(events, ["pre", "post"])
+        # Global View pixels: the window area shows the backdrop, the rest is fresh
+        self.assertEqual(frame.global_image.getpixel((80 + 450, 80 + 150)), (255, 255, 255))
+        self.assertEqual(frame.global_image.getpixel((80 + 25, 80 + 25)), (0, 0, 255))
+
+        window["rect"] = (300, 0, 400, 300)
+        with patch("scripts.tools.pyautogui.screenshot", return_value=clean.copy()):
+            perceptor.capture_state(10, 10)
+        self.assertEqual(events, ["pre", "post", "pre", "post"])
+
+    def test_mask_mode_refreshes_backdrop_and_skips_hiding_for_unaffected_regions(self):
+        events = []
+        perceptor = tools.VisionPerceptor.__new__(tools.VisionPerceptor)
+        perceptor.pre_callback = lambda: events.append("pre")
+        perceptor.post_callback = lambda: events.append("post")
+        perceptor.last_capture_files = None
+        perceptor.overlay_rect = lambda: (450, 250, 500, 300)
+
+        with patch.object(tools, "OVERLAY_MASK_REFRESH_STEPS", 2), patch(
+            "scripts.tools.pyautogui.screenshot", side_effect=lambda **kwargs: Image.new("RGB", (500, 300), "white")
+        ):
+            for _ in range(4):
+                perceptor.capture_state(10, 10)
+            self.assertEqual(events.count("pre"), 2)
+            # A Local View region away from the window needs neither hiding nor masking
+            perceptor.capture_state(10, 10, local_only=True)
+
+        self.assertEqual(events.count("pre"), 2)
+
+    def test_global_view_is_not_scaled_below_max_edge(self):
+        perceptor = tools.VisionPerceptor.__new__(tools.VisionPerceptor)
+
+        with patch.object(tools, "GLOBAL_MAX_EDGE", 1920):
+            self.assertEqual(perceptor._global_view_size(500, 300), (500, 300))
+            self.assertEqual(perceptor._global_view_size(3840, 2160), (1920, 1080))
+        with patch.object(tools, "GLOBAL_MAX_EDGE", 0):
+            self.assertEqual(perceptor._global_view_size(3840, 2160), (3840, 2160))
 
     def _corner_center(self, image, center_x, center_y, half_size=10):
         return image.crop(